@@ -1,3 +1,6 @@
+from datetime import datetime, timedelta
+
+import pycron
 import pytest
 
 from tgtg_scanner.models.cron import Cron
@@ -30,6 +33,65 @@ def test_is_now():
     assert Cron("* * * * *").is_now is True
 
 
+def test_next_activation():
+    cron = Cron("* 6-22 * * 1-5; * 19-22 * * 0,6")
+    monday = datetime(2024, 1, 1, 10, 30, 15)
+    assert cron.matches(monday)
+    assert cron.next_activation(monday) == monday
+    assert cron.next_deactivation(monday) == datetime(2024, 1, 1, 23, 0)
+    friday = datetime(2024, 1, 5, 23, 0)
+    assert not cron.matches(friday)
+    assert cron.next_activation(friday) == datetime(2024, 1, 6, 19, 0)
+    assert cron.next_deactivation(friday) == friday
+
+    assert Cron("*/15 8 1,15 * mon").next_activation(monday) == datetime(2024, 1, 8, 8, 0)
+    assert Cron("0 0 29 2 *").next_activation(monday) == datetime(2024, 2, 29, 0, 0)
+    assert Cron().next_deactivation(monday) is None
+    assert Cron("0 0 30 2 *").next_activation(monday) is None
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "* * * * *",
+        "*/15 8 1,15 * mon",
+        "0-30/5 6-22 * * 1-5",
+        "5,10,55 */3 */2 */4 *",
+        "* 19-22 * * 0,6",
+        "0 0 13 * fri",
+        "30 12 * 2-11 sunday,Wednesday",
+        "* * 10-20 * tue-thu",
+        "59 23 31 12 6",
+    ],
+)
+def test_matches_pycron(expression):
+    cron = Cron(expression)
+    start = datetime(2024, 1, 1)
+    for step in range(0, 366 * 24 * 60, 7 * 60 + 13):
+        dt = start + timedelta(minutes=step)
+        assert cron.matches(dt) == pycron.is_now(expression, dt), dt
+
+
+def test_parse_errors():
+    for expression in ["x * * * *", "*/0 * * * *", "1/5 * * * *", "* * * * mon-xyz", "1-2-3 * * * *"]:
+        with pytest.raises(ValueError):
+            Cron(expression)
+
+
+def test_weekday_wrap_around():
+    cron = Cron("* * * * fri-mon")
+    monday = datetime(2024, 1, 1, 12, 0)
+    assert [cron.matches(monday + timedelta(days=day)) for day in range(7)] == [True, False, False, False, True, True, True]
+
+
+def test_is_now_cached(mocker):
+    cron = Cron("* 6-22 * * *")
+    matches = mocker.spy(cron, "matches")
+    for _ in range(3):
+        cron.is_now
+    assert matches.call_count == 1
+
+
 def test_eq():
     assert Cron("0 0 * * *") == Cron("0 0 * * *")
     assert Cron("0 0 * * *") != Cron("0 0 * * 0")
@@ -0,0 +1,64 @@
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import responses
+
+from tgtg_scanner.models.image_cache import ImageCache, is_image_url
+
+URL = "https://images.tgtg.ninja/standard_images/GENERAL/other1.jpg"
+
+
+@responses.activate
+def test_image_cache_coalesces_downloads():
+    responses.add(responses.GET, URL, body=b"image", status=200)
+    cache = ImageCache()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: cache.get(URL), range(8)))
+
+    assert results == [b"image"] * 8
+    assert len(responses.calls) == 1
+    assert cache.get_cached(URL) == b"image"
+
+
+@responses.activate
+def test_image_cache_memory_eviction():
+    for index in range(3):
+        responses.add(responses.GET, f"{URL}?{index}", body=b"x" * 10, status=200)
+    cache = ImageCache(memory_budget=25)
+
+    for index in range(3):
+        cache.get(f"{URL}?{index}")
+
+    assert cache.get_cached(f"{URL}?0") is None
+    assert cache.get_cached(f"{URL}?1") == b"x" * 10
+    assert cache.get_cached(f"{URL}?2") == b"x" * 10
+
+
+@responses.activate
+def test_image_cache_disk_tier():
+    responses.add(responses.GET, URL, body=b"image", status=200)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = ImageCache(temp_dir)
+        assert cache.get(URL) == b"image"
+
+        restarted = ImageCache(temp_dir)
+        assert restarted.get_cached(URL) == b"image"
+        assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_image_cache_error():
+    responses.add(responses.GET, URL, status=404)
+    cache = ImageCache()
+
+    assert cache.get(URL) is None
+    assert cache.get_cached(URL) is None
+
+
+def test_is_image_url():
+    assert is_image_url(URL)
+    assert is_image_url("http://example.com/image.png")
+    assert not is_image_url("-")
+    assert not is_image_url("")
+    assert not is_image_url(None)
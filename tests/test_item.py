@@ -1,6 +1,8 @@
 import pytest
 
-from tgtg_scanner.models.item import Item
+from tgtg_scanner.errors import MaskConfigurationError
+from tgtg_scanner.models.item import Item, format_number, get_locale
+from tgtg_scanner.models.template import Template
 
 
 def test_item(tgtg_item: dict, monkeypatch: pytest.MonkeyPatch):
@@ -23,3 +25,26 @@ def test_item(tgtg_item: dict, monkeypatch: pytest.MonkeyPatch):
     assert item.store_name == tgtg_item.get("store", {}).get("store_name", "-")
     assert item.item_logo == tgtg_item.get("item", {}).get("logo_picture", {}).get("current_url", "-")
     assert item.item_cover == tgtg_item.get("item", {}).get("cover_picture", {}).get("current_url", "-")
+
+
+def test_item_format_cache(tgtg_item: dict):
+    format_number.cache_clear()
+    items = [Item(tgtg_item, locale="de_DE") for _ in range(3)]
+    assert [item.price for item in items] == ["3,00\xa0€"] * 3
+    assert items[0].value == "9,00\xa0€"
+    assert items[0].rating == "3,6"
+    info = format_number.cache_info()
+    assert info.misses == 3
+    assert info.hits == 2
+    assert get_locale("de_DE") is get_locale("de_DE")
+
+
+def test_template(tgtg_item: dict):
+    item = Item(tgtg_item)
+    text = "${{display_name}} - ${{items_available}} left - ${{link}}"
+    template = Template(text)
+    assert template.variables == ["display_name", "items_available", "link"]
+    assert template.render(item) == item.unmask(text)
+    assert Template("no variables").render(item) == "no variables"
+    with pytest.raises(MaskConfigurationError):
+        Template("${{unknown}}")
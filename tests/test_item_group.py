@@ -0,0 +1,38 @@
+import pytest
+
+from tgtg_scanner.errors import ConfigurationError
+from tgtg_scanner.models import Config, Cron
+from tgtg_scanner.models.item_group import ItemGroup
+
+
+def test_item_groups():
+    config = Config()
+    config.item_ids = ["1", "2", ""]
+    config.sleep_time = 30
+    config.item_groups = [
+        {"name": "bakery", "items": ["2", 3], "cron": "* 17-20 * * *", "priority": 1},
+        {"items": ["4"], "sleep_time": 120, "priority": -1},
+    ]
+    groups = ItemGroup.from_config(config)
+
+    assert [group.name for group in groups] == ["bakery", "default", "1"]
+    bakery, default, other = groups
+    assert bakery.item_ids == ["2", "3"]
+    assert bakery.cron == Cron("* 17-20 * * *")
+    assert bakery.sleep_time == 30
+    # grouped items are removed from the default group
+    assert default.item_ids == ["1"]
+    assert default.favorites and not bakery.favorites
+    assert other.sleep_time == 120
+
+    assert other.due(0)
+    other.fetched(0)
+    assert not other.due(100)
+    assert other.due(140)
+
+    config.item_groups = [{"name": "broken", "cron": "* * * * *"}]
+    with pytest.raises(ConfigurationError):
+        ItemGroup.from_config(config)
+    config.item_groups = [{"items": ["1"], "cron": "abc"}]
+    with pytest.raises(ConfigurationError):
+        ItemGroup.from_config(config)
@@ -1,6 +1,34 @@
+import tempfile
+import threading
+from pathlib import Path
+from time import monotonic
+from unittest.mock import MagicMock
+
+import googlemaps
+import pytest
 from pytest_mock.plugin import MockerFixture
 
-from tgtg_scanner.models import Location
+from tgtg_scanner.errors import LocationConfigurationError
+from tgtg_scanner.models import Config, Item, Location
+from tgtg_scanner.models.distance_filter import DistanceFilter
+from tgtg_scanner.models.location import haversine
+
+
+def distance_matrix(origins, destinations, mode=None):
+    return {
+        "rows": [
+            {
+                "elements": [
+                    (
+                        {"status": "NOT_FOUND"}
+                        if destination == "Nowhere"
+                        else {"status": "OK", "distance": {"value": 1500}, "duration": {"value": 1200}}
+                    )
+                    for destination in destinations
+                ]
+            }
+        ]
+    }
 
 
 def test_calculate_distance_time(mocker: MockerFixture):
@@ -8,10 +36,7 @@ def test_calculate_distance_time(mocker: MockerFixture):
     location = "Hauptstraße 1, 20099 Hamburg, Germany"
 
     mocker.patch("googlemaps.Client.geocode", return_value=[{}])
-    mocker.patch(
-        "googlemaps.Client.directions",
-        return_value=[{"legs": [{"distance": {"value": 1500}, "duration": {"value": 1200}}]}],
-    )
+    mocker.patch("googlemaps.Client.distance_matrix", side_effect=distance_matrix)
 
     distance_time_calculator = Location(True, google_api_key, location)
     distance_time = distance_time_calculator.calculate_distance_time("München", Location.WALKING_MODE)
@@ -20,3 +45,143 @@ def test_calculate_distance_time(mocker: MockerFixture):
     assert distance_time.distance == 1500
     assert distance_time.duration == 1200
     assert distance_time.travel_mode == Location.WALKING_MODE
+
+
+def test_prefetch_distance_time(mocker: MockerFixture):
+    mocker.patch("googlemaps.Client.geocode", return_value=[{}])
+    gmaps = mocker.patch("googlemaps.Client.distance_matrix", side_effect=distance_matrix)
+
+    location = Location(True, "AIza123456", "Hamburg", Location.used_travel_modes("${{distance_walking}} ${{duration_biking}}"))
+    assert location.travel_modes == {"walking", "biking"}
+    destinations = [f"Street {number}" for number in range(30)] + ["Nowhere"]
+    for destination in destinations:
+        location.watch(destination)
+    location.prefetch()
+
+    # 31 destinations need two requests per travel mode
+    assert gmaps.call_count == 4
+    assert {call.kwargs["mode"] for call in gmaps.call_args_list} == {"walking", "bicycling"}
+    assert all(len(call.args[1]) <= 25 for call in gmaps.call_args_list)
+
+    distance_time = location.calculate_distance_time("Street 29", "biking")
+    assert distance_time is not None
+    assert distance_time.distance == 1500
+    assert location.calculate_distance_time("Nowhere", "walking") is None
+    assert gmaps.call_count == 4
+
+
+def test_lookup_during_request(mocker: MockerFixture):
+    mocker.patch("googlemaps.Client.geocode", return_value=[{}])
+    requested, release = threading.Event(), threading.Event()
+
+    def slow_distance_matrix(origins, destinations, mode=None):
+        requested.set()
+        release.wait(5)
+        return distance_matrix(origins, destinations, mode)
+
+    mocker.patch("googlemaps.Client.distance_matrix", side_effect=slow_distance_matrix)
+    location = Location(True, "AIza123456", "Hamburg", origin_coordinates=[53.5511, 9.9937])
+    request = threading.Thread(target=location.calculate_distance_time, args=("Berlin", "walking"))
+    request.start()
+    assert requested.wait(5)
+    # the running Google Maps request does not block other lookups
+    start = monotonic()
+    assert location.cached_distance_time("Munich", "walking", (48.1351, 11.5820)) is not None
+    assert monotonic() - start < 1
+    location.watch("Munich")
+    release.set()
+    request.join()
+    assert location.cached_distance_time("Berlin", "walking") is not None
+
+
+def test_persistent_cache(mocker: MockerFixture):
+    geocode = mocker.patch("googlemaps.Client.geocode", return_value=[{}])
+    gmaps = mocker.patch("googlemaps.Client.distance_matrix", side_effect=distance_matrix)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, "location.sqlite3")
+        location = Location(True, "AIza123456", "Hamburg", cache_path=path, cache_size=2)
+        location.calculate_distance_time("Street 1", "walking")
+        location.calculate_distance_time("Nowhere", "walking")
+        location.calculate_distance_time("Street 2", "walking")
+        location.cache.close()
+        assert gmaps.call_count == 3
+
+        # restart, the origin address and the recently used destinations are cached
+        location = Location(True, "AIza123456", " hamburg ", cache_path=path, cache_size=2, metrics=MagicMock())
+        assert geocode.call_count == 1
+        assert location.calculate_distance_time("street  2", "walking").distance == 1500
+        assert location.calculate_distance_time("Nowhere", "walking") is None
+        assert gmaps.call_count == 3
+        location.calculate_distance_time("Street 1", "walking")
+        assert gmaps.call_count == 4
+        location.metrics.location_cache_requests.labels.assert_called_with("distance", "miss")
+        location.cache.close()
+
+        location = Location(True, "AIza123456", "Hamburg", cache_path=path, cache_ttl=-1)
+        assert geocode.call_count == 2
+        location.cache.close()
+
+
+def test_haversine():
+    hamburg = (53.5511, 9.9937)
+    distances = haversine(hamburg, [hamburg, (52.5200, 13.4050)])
+    assert distances[0] == 0
+    assert distances[1] == pytest.approx(255_000, rel=0.01)
+
+
+def test_offline_provider(test_item: Item):
+    location = Location(True, provider="offline", origin_coordinates=["53.5511", "9.9937"], speeds={"biking": 18})
+    item = Item(test_item.to_dict(), location)
+    assert item.pickup_coordinates == (53.55182, 9.99532)
+
+    walking = location.calculate_distance_time(item.pickup_location, "walking", item.pickup_coordinates)
+    biking = location.calculate_distance_time(item.pickup_location, "biking", item.pickup_coordinates)
+    assert walking is not None and biking is not None
+    assert walking.distance == biking.distance == pytest.approx(174, rel=0.01)
+    assert walking.duration == pytest.approx(walking.distance / (5 / 3.6))
+    assert biking.duration == pytest.approx(biking.distance / (18 / 3.6))
+    assert item.distance_walking == "0.2 km"
+
+    with pytest.raises(LocationConfigurationError):
+        Location(True, provider="offline")
+
+
+def test_quota_fallback(mocker: MockerFixture):
+    mocker.patch("googlemaps.Client.geocode", return_value=[{}])
+    gmaps = mocker.patch("googlemaps.Client.distance_matrix", side_effect=googlemaps.exceptions.ApiError("OVER_DAILY_LIMIT"))
+    location = Location(True, "AIza123456", "Hamburg", origin_coordinates=[53.5511, 9.9937])
+    distance_time = location.calculate_distance_time("Berlin", "driving", (52.5200, 13.4050))
+    assert distance_time is not None
+    assert distance_time.distance == pytest.approx(255_000 * 1.3, rel=0.01)
+    assert location.quota_exceeded
+    # estimates are not cached and Google Maps is not requested while the quota is exceeded
+    location.calculate_distance_time("Berlin", "driving", (52.5200, 13.4050))
+    location.travel_modes.add("driving")
+    location.watch("Munich", (48.1351, 11.5820))
+    location.prefetch()
+    assert gmaps.call_count == 1
+    assert location.distancetime_dict == {}
+
+
+def test_distance_filter(test_item: Item, mocker: MockerFixture):
+    gmaps = mocker.patch("googlemaps.Client.distance_matrix", side_effect=distance_matrix)
+    config = Config()
+    config.max_duration = 10
+    config.filter_travel_mode = "biking"
+    distance_filter = DistanceFilter.from_config(config)
+    assert distance_filter == DistanceFilter(None, 600, "biking")
+
+    # offline estimate of about 174 m
+    location = Location(True, provider="offline", origin_coordinates=[53.5511, 9.9937])
+    item = Item(test_item.to_dict(), location)
+    assert distance_filter.accepts(item)
+    assert not DistanceFilter(max_distance=100).accepts(item)
+
+    # unknown distances pass, only cached ones are used
+    mocker.patch("googlemaps.Client.geocode", return_value=[{}])
+    location = Location(True, "AIza123456", "Hamburg")
+    item = Item(test_item.to_dict(), location)
+    assert DistanceFilter(max_distance=1000).accepts(item)
+    assert gmaps.call_count == 0
+    location.calculate_distance_time(item.pickup_location, "walking")
+    assert not DistanceFilter(max_distance=1000).accepts(item)
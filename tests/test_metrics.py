@@ -1,6 +1,15 @@
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
 import requests
+from prometheus_client import CollectorRegistry
 
+from tgtg_scanner.models import Item
 from tgtg_scanner.models.metrics import Metrics
+from tgtg_scanner.models.state import StateStore
 
 
 def test_metrics():
@@ -9,3 +18,110 @@ def test_metrics():
     res = requests.get("http://localhost:8000")
 
     assert res.ok
+
+
+def test_item_series(test_item: Item):
+    registry = CollectorRegistry()
+    metrics = Metrics(max_items=2, registry=registry)
+    data = test_item.to_dict()
+    items = [Item({**data, "item": {**data["item"], "item_id": str(item_id)}}) for item_id in range(3)]
+    for item in items:
+        metrics.update(item)
+        metrics.count_notification(item)
+
+    # the third item exceeds the limit
+    assert registry.get_sample_value("tgtg_item_count", {"item_id": "1"}) == test_item.items_available
+    assert registry.get_sample_value("tgtg_item_count", {"item_id": "2"}) is None
+    assert registry.get_sample_value("tgtg_item_info", {"item_id": "0", "display_name": test_item.display_name}) == 1
+    assert registry.get_sample_value("tgtg_send_notifications_total", {"item_id": "0"}) == 1
+
+    metrics.retain(["1"])
+    assert registry.get_sample_value("tgtg_item_count", {"item_id": "0"}) is None
+    assert registry.get_sample_value("tgtg_item_info", {"item_id": "0", "display_name": test_item.display_name}) is None
+    metrics.update(items[2])
+    assert registry.get_sample_value("tgtg_item_count", {"item_id": "2"}) == test_item.items_available
+
+
+def test_runtime_metrics():
+    registry = CollectorRegistry()
+    metrics = Metrics(registry=registry)
+    metrics.runtime.client = MagicMock(
+        api_errors=Counter({("item/v8/{id}", 403): 2}),
+        token_refresh_count=3,
+        last_time_token_refreshed=datetime.now() - timedelta(minutes=5),
+    )
+    notifier = MagicMock(is_alive=False)
+    notifier.name = "Telegram"
+    metrics.runtime.notifiers = [notifier]
+    metrics.scan_failed()
+    metrics.scan_failed()
+
+    assert registry.get_sample_value("tgtg_api_errors_total", {"endpoint": "item/v8/{id}", "status": "403"}) == 2
+    assert registry.get_sample_value("tgtg_token_refreshes_total") == 3
+    assert 300 <= registry.get_sample_value("tgtg_token_age_seconds") < 310
+    assert registry.get_sample_value("tgtg_notifier_alive", {"notifier": "Telegram"}) == 0
+    assert registry.get_sample_value("tgtg_scan_consecutive_errors") == 2
+    metrics.scan_succeeded()
+    assert registry.get_sample_value("tgtg_scan_consecutive_errors") == 0
+    assert registry.get_sample_value("tgtg_scan_seconds_since_success") < 1
+
+
+def test_state_api(test_item: Item):
+    store = StateStore()
+    metrics = Metrics(8001, registry=CollectorRegistry())
+    metrics.enable_metrics(store)
+    url = "http://localhost:8001/state"
+    store.update(test_item)
+
+    res = requests.get(url)
+    assert res.ok
+    assert res.json()["items"][test_item.item_id]["items_available"] == test_item.items_available
+    assert requests.get(url, headers={"If-None-Match": res.headers["ETag"]}).status_code == 304
+    assert requests.get("http://localhost:8001/").ok
+
+    res = requests.get(f"{url}/{test_item.item_id}")
+    assert res.json()["version"] == 1
+    assert requests.get(f"{url}/{test_item.item_id}", headers={"If-None-Match": res.headers["ETag"]}).status_code == 304
+    assert requests.get(f"{url}/unknown").status_code == 404
+
+    # long-poll returns as soon as the state changes
+    other = Item({**test_item.to_dict(), "item": {"item_id": "other"}})
+    threading.Timer(0.2, store.update, [other]).start()
+    res = requests.get(url, params={"since": 1, "timeout": 5})
+    assert res.json() == {"version": 2, "items": {"other": StateStore.item_dict(2, other)}, "removed": []}
+
+    store.remove("other")
+    res = requests.get(url, params={"since": 2, "timeout": 0})
+    assert res.json() == {"version": 3, "items": {}, "removed": ["other"]}
+    assert requests.get(url, params={"since": "x"}).status_code == 400
+
+
+def test_event_stream(test_item: Item):
+    store = StateStore(events_size=2)
+    metrics = Metrics(8002, registry=CollectorRegistry())
+    metrics.enable_metrics(store)
+    item = Item({**test_item.to_dict(), "items_available": 0})
+    for amount in (0, 1, 2):
+        store.update(Item({**test_item.to_dict(), "items_available": amount}))
+
+    # the buffer keeps the last two events
+    with requests.get("http://localhost:8002/events", headers={"Last-Event-ID": "0"}, stream=True, timeout=5) as res:
+        assert res.headers["Content-Type"] == "text/event-stream"
+        lines = res.iter_lines(chunk_size=1, decode_unicode=True)
+        assert next(lines) == "retry: 5000"
+        assert next(lines) == ""
+        assert next(lines) == "id: 2"
+        assert next(lines) == "event: stock"
+        data = json.loads(next(lines)[len("data: ") :])
+        assert (data["item_id"], data["old"], data["new"]) == (item.item_id, 0, 1)
+        assert next(lines) == ""
+        assert next(lines) == "id: 3"
+
+    # new clients only receive new events
+    with requests.get("http://localhost:8002/events", stream=True, timeout=5) as res:
+        lines = res.iter_lines(chunk_size=1, decode_unicode=True)
+        assert next(lines) == "retry: 5000"
+        threading.Timer(0.2, store.remove, [item.item_id]).start()
+        assert [next(lines) for _ in range(3)] == ["", "id: 4", "event: stock"]
+        data = json.loads(next(lines)[len("data: ") :])
+        assert (data["old"], data["new"]) == (2, None)
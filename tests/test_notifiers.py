@@ -1,21 +1,31 @@
+import asyncio
+import datetime
+import email
 import json
 import platform
-from time import sleep
-from unittest.mock import MagicMock
+import threading
+from time import monotonic, sleep
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 import responses
 from pytest_mock.plugin import MockerFixture
+from telegram import Chat, Message, PhotoSize
+from telegram.error import RetryAfter, TimedOut
 
+from tgtg_scanner.errors import NotificationError, WebHookConfigurationError
 from tgtg_scanner.models import Config, Cron, Favorites, Item, Reservations
+from tgtg_scanner.models.digest import Digest
+from tgtg_scanner.notifiers import Notifier
 from tgtg_scanner.notifiers.apprise import Apprise
 from tgtg_scanner.notifiers.console import Console
 from tgtg_scanner.notifiers.discord import Discord
+from tgtg_scanner.notifiers.dispatcher import Dispatcher
 from tgtg_scanner.notifiers.ifttt import IFTTT
 from tgtg_scanner.notifiers.ntfy import Ntfy
 from tgtg_scanner.notifiers.script import Script
 from tgtg_scanner.notifiers.smtp import SMTP
-from tgtg_scanner.notifiers.telegram import Telegram
+from tgtg_scanner.notifiers.telegram import RateLimiter, Telegram
 from tgtg_scanner.notifiers.webhook import WebHook
 
 SYS_PLATFORM = platform.system()
@@ -66,6 +76,32 @@ def test_webhook_json(test_item: Item, reservations: Reservations, favorites: Fa
     }
 
 
+@responses.activate
+def test_webhook_json_typed(tgtg_item: dict, reservations: Reservations, favorites: Favorites):
+    config = Config()
+    config.webhook.enabled = True
+    config.webhook.url = "https://api.example.com"
+    config.webhook.type = "application/json"
+    config.webhook.body = '{"name": "${{display_name}}", "amount": ${{items_available}}, "ids": [${{item_id}}]}'
+    responses.add(responses.POST, "https://api.example.com", status=200)
+    item = Item({**tgtg_item, "display_name": 'Bakery "Zum Glück"\nHamburg'})
+
+    webhook = WebHook(config, reservations, favorites)
+    webhook.start()
+    webhook.send(item)
+    webhook.stop()
+
+    assert json.loads(responses.calls[0].request.body) == {
+        "name": 'Bakery "Zum Glück"\nHamburg',
+        "amount": item.items_available,
+        "ids": [int(item.item_id)],
+    }
+
+    config.webhook.body = '{"name": ${{display_name}'
+    with pytest.raises(WebHookConfigurationError):
+        WebHook(config, reservations, favorites)
+
+
 @responses.activate
 def test_webhook_text(test_item: Item, reservations: Reservations, favorites: Favorites):
     config = Config()
@@ -96,6 +132,50 @@ def test_webhook_text(test_item: Item, reservations: Reservations, favorites: Fa
     )
 
 
+@responses.activate
+def test_webhook_endpoints(test_item: Item, reservations: Reservations, favorites: Favorites):
+    config = Config()
+    config.webhook.enabled = True
+    config.webhook.body = "${{display_name}}"
+    config.webhook.headers = {"Accept": "json"}
+    config.webhook.endpoints = [
+        {"name": "a", "url": "https://a.example.com/${{item_id}}", "headers": {"X-Token": "a"}},
+        {"name": "b", "url": "https://b.example.com", "method": "PUT", "body": "${{items_available}}", "retries": 2},
+    ]
+    responses.add(responses.POST, f"https://a.example.com/{test_item.item_id}", status=200)
+    responses.add(responses.PUT, "https://b.example.com", status=503)
+    responses.add(responses.PUT, "https://b.example.com", status=200)
+
+    webhook = WebHook(config, reservations, favorites)
+    assert webhook._executor is not None
+    webhook.metrics = MagicMock()
+    webhook.start()
+    webhook.send(test_item)
+    webhook.stop()
+
+    requests = {call.request.url: call.request for call in responses.calls}
+    assert len(responses.calls) == 3
+    request_a = requests[f"https://a.example.com/{test_item.item_id}"]
+    assert request_a.body.decode("utf-8") == test_item.display_name
+    assert request_a.headers["X-Token"] == "a"
+    assert request_a.headers.get("Accept") != "json"
+    request_b = requests["https://b.example.com/"]
+    assert request_b.body.decode("utf-8") == str(test_item.items_available)
+    assert request_b.headers["Accept"] == "json"
+    webhook.metrics.webhook_retries.labels.assert_called_once_with("WebHook", "b")
+    assert webhook._executor is None
+
+    # a restarted notifier gets a new executor
+    webhook.start()
+    webhook.send(test_item)
+    webhook.stop()
+    assert len(responses.calls) == 5
+
+    config.webhook.retries = -1
+    with pytest.raises(WebHookConfigurationError):
+        WebHook(config, reservations, favorites)
+
+
 @responses.activate
 def test_ifttt(test_item: Item, reservations: Reservations, favorites: Favorites):
     config = Config()
@@ -161,6 +241,30 @@ def test_ntfy(test_item: Item, reservations: Reservations, favorites: Favorites)
     assert request.headers.get("X-Title").decode("utf-8") == (f"New Items - {test_item.display_name}")
 
 
+@responses.activate
+def test_ntfy_concurrent(tgtg_item: dict, reservations: Reservations, favorites: Favorites):
+    config = Config()
+    config.ntfy.enabled = True
+    config.ntfy.topic = "tgtg_test"
+    config.ntfy.token = "token"
+    config.ntfy.title = "${{item_id}}"
+    config.ntfy.pool_size = 4
+    responses.add(responses.POST, "https://ntfy.sh/tgtg_test", status=200)
+
+    ntfy = Ntfy(config, reservations, favorites)
+    assert ntfy.concurrency == 4
+    ntfy.start()
+    for item_id in range(20):
+        ntfy.send(Item({**tgtg_item, "item": {**tgtg_item["item"], "item_id": str(item_id)}}))
+    ntfy.stop()
+
+    # the configured headers are not shared between messages
+    assert ntfy.headers == {"Authorization": "Bearer token"}
+    titles = sorted(int(call.request.headers["X-Title"]) for call in responses.calls)
+    assert titles == list(range(20))
+    assert all(call.request.headers["Authorization"] == "Bearer token" for call in responses.calls)
+
+
 @responses.activate
 def test_apprise(test_item: Item, reservations: Reservations, favorites: Favorites):
     config = Config()
@@ -187,6 +291,32 @@ def test_apprise(test_item: Item, reservations: Reservations, favorites: Favorit
     )
 
 
+@responses.activate
+def test_apprise_targets(test_item: Item, reservations: Reservations, favorites: Favorites, mocker: MockerFixture):
+    # reused Apprise objects throttle requests to the same target
+    mocker.patch("apprise.URLBase.throttle")
+    config = Config()
+    config.apprise.enabled = True
+    config.apprise.url = "ntfy://tgtg_test family,mobile=ntfy://tgtg_family work=ntfy://tgtg_work"
+    config.apprise.tags = ["family"]
+    responses.add(responses.POST, "https://ntfy.sh/", status=200)
+
+    apprise = Apprise(config, reservations, favorites)
+    apprise._send(test_item)
+    apprise._send(test_item)
+
+    topics = sorted(json.loads(call.request.body).get("topic") for call in responses.calls)
+    assert topics == ["tgtg_family", "tgtg_family"]
+
+    config.apprise.url = "ntfy://tgtg_${{item_id}}"
+    config.apprise.tags = []
+    apprise = Apprise(config, reservations, favorites)
+    apprise._send(test_item)
+    apprise._send(test_item)
+    assert len(apprise._cache) == 1
+    assert json.loads(responses.calls[-1].request.body).get("topic") == f"tgtg_{test_item.item_id}"
+
+
 def test_console(
     test_item: Item,
     reservations: Reservations,
@@ -230,6 +360,40 @@ def test_script(
     assert captured.out.decode(encoding).rstrip() == test_item.display_name
 
 
+@pytest.mark.skipif(IS_WINDOWS, reason="uses POSIX commands")
+def test_script_stdin_timeout(
+    test_item: Item,
+    reservations: Reservations,
+    favorites: Favorites,
+    capfdbinary: pytest.CaptureFixture,
+):
+    config = Config()
+    config.script.enabled = True
+    config.script.command = "cat"
+    config.script.stdin = True
+
+    script = Script(config, reservations, favorites)
+    script.metrics = MagicMock()
+    asyncio.run(script._send(test_item))
+    payload = json.loads(capfdbinary.readouterr().out)
+    assert payload["display_name"] == test_item.display_name
+    assert "item_cover_bytes" not in payload
+    assert "distance_walking" not in payload
+    config.script.command = "echo ${{duration_biking}}"
+    assert "duration_biking" in Script(config, reservations, favorites).payload_names
+    script.metrics.script_exit_codes.labels.assert_called_with("0")
+
+    config.script.command = "sleep 5"
+    config.script.timeout = 0.1
+    script = Script(config, reservations, favorites)
+    script.metrics = MagicMock()
+    start = monotonic()
+    with pytest.raises(NotificationError):
+        asyncio.run(script._send(test_item))
+    assert monotonic() - start < 2
+    script.metrics.script_exit_codes.labels.assert_called_with("timeout")
+
+
 def test_smtp(test_item: Item, reservations: Reservations, favorites: Favorites, mocker: MockerFixture):
     mock_SMTP = mocker.MagicMock(name="tgtg_scanner.notifiers.smtp.smtplib.SMTP")
     mocker.patch("tgtg_scanner.notifiers.smtp.smtplib.SMTP", new=mock_SMTP)
@@ -266,6 +430,42 @@ def test_smtp(test_item: Item, reservations: Reservations, favorites: Favorites,
     assert body[12] == f"<b>=C3=81 =C3=AA</b> </br>Amount: {test_item.items_available}"
 
 
+def test_smtp_digest(test_item: Item, reservations: Reservations, favorites: Favorites, mocker: MockerFixture):
+    mock_SMTP = mocker.MagicMock(name="tgtg_scanner.notifiers.smtp.smtplib.SMTP")
+    mocker.patch("tgtg_scanner.notifiers.smtp.smtplib.SMTP", new=mock_SMTP)
+
+    config = Config()
+    config.smtp.enabled = True
+    config.smtp.cron = Cron()
+    config.smtp.host = "localhost"
+    config.smtp.port = 25
+    config.smtp.sender = "user@example.com"
+    config.smtp.recipients = ["user@example.com"]
+    config.smtp.recipients_per_item = json.dumps({"other": "other@example.com"})
+
+    smtp = SMTP(config, reservations, favorites)
+    data = test_item.to_dict()
+    second = Item({**data, "display_name": "Second Bakery", "item": {**data["item"], "item_id": "2"}})
+    other = Item({**data, "item": {**data["item"], "item_id": "other"}})
+    smtp._send_digest(Digest([test_item, other, second]))
+
+    # one connection, one mail per distinct set of recipients
+    assert mock_SMTP.call_count == 1
+    assert mock_SMTP.return_value.noop.call_count == 0
+    calls = mock_SMTP.return_value.sendmail.call_args_list
+    assert [call[0][1] for call in calls] == [["user@example.com"], ["other@example.com"]]
+    assert "Subject: 2 new Magic Bags" in calls[0][0][2]
+    assert "Subject: 1 new Magic Bags" in calls[1][0][2]
+    bodies = [email.message_from_string(call[0][2]).get_payload()[0].get_payload(decode=True).decode() for call in calls]
+    assert test_item.display_name in bodies[0] and "Second Bakery" in bodies[0]
+    assert "Second Bakery" not in bodies[1]
+
+    # an idle connection is replaced before sending
+    smtp._last_used -= smtp.idle_timeout + 1
+    smtp._send(test_item)
+    assert mock_SMTP.call_count == 2
+
+
 @pytest.fixture
 def mocked_telegram(mocker: MockerFixture):
     mocker.patch(
@@ -317,13 +517,18 @@ def test_telegram(test_item: Item, reservations: Reservations, favorites: Favori
     config.telegram.body = "New Magic Bags: ${{items_available}}"
     config.telegram.image = None
 
+    send_message = mocked_telegram.patch("telegram.ext.ExtBot.send_message", return_value=None)
+
     telegram = Telegram(config, reservations, favorites)
+    telegram.limiter = RateLimiter(chat_rate=1000)
     telegram.start()
-    telegram.send(test_item)
+    for _ in range(10):
+        telegram.send(test_item)
     sleep(0.5)
-    assert telegram.thread.is_alive()
+    assert telegram.is_alive
+    assert send_message.call_count == 10
     telegram.stop()
-    assert not telegram.thread.is_alive()
+    assert not telegram.is_alive
 
 
 @pytest.fixture
@@ -366,3 +571,200 @@ def test_discord(test_item: Item, reservations: Reservations, favorites: Favorit
     discord.send(test_item)
     sleep(0.5)
     discord.stop()
+
+
+def test_telegram_photo_file_id_reuse(
+    test_item: Item, reservations: Reservations, favorites: Favorites, mocked_telegram: MockerFixture
+):
+    config = Config()
+    config.telegram.enabled = True
+    config.telegram.token = "1234567890:ABCDEF"
+    config.telegram.chat_ids = ["1", "2", "3"]
+    config.telegram.body = "New Magic Bags: ${{items_available}}"
+    config.telegram.image = "${{item_cover_bytes}}"
+    mocked_telegram.patch("tgtg_scanner.notifiers.telegram.image_cache.get_cached", return_value=b"image")
+
+    telegram = Telegram(config, reservations, favorites)
+    message = Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=1, type="private"),
+        photo=(PhotoSize(file_id="file_id", file_unique_id="unique", width=10, height=10),),
+    )
+    telegram.limiter = RateLimiter(chat_rate=1000, group_rate=1000)
+    telegram.application = MagicMock()
+    telegram.application.bot.send_photo = AsyncMock(return_value=message)
+
+    asyncio.run(telegram._send(test_item))
+    asyncio.run(telegram._send(test_item))
+
+    photos = [call.kwargs["photo"] for call in telegram.application.bot.send_photo.call_args_list]
+    assert photos == [b"image"] + ["file_id"] * 5
+    assert telegram.file_ids.get(test_item.item_cover) == "file_id"
+
+
+def test_telegram_fanout(test_item: Item, reservations: Reservations, favorites: Favorites, mocked_telegram: MockerFixture):
+    config = Config()
+    config.telegram.enabled = True
+    config.telegram.token = "1234567890:ABCDEF"
+    config.telegram.chat_ids = ["1", "2", "-3"]
+    config.telegram.body = "New Magic Bags: ${{items_available}}"
+
+    telegram = Telegram(config, reservations, favorites)
+    telegram.limiter = RateLimiter(chat_rate=1000, group_rate=1000)
+    telegram.metrics = MagicMock()
+    telegram.application = MagicMock()
+    telegram.application.bot.send_message = AsyncMock(side_effect=[RetryAfter(0), None, TimedOut(), None, None])
+    mocked_telegram.patch.object(Telegram, "RETRY_BACKOFF", 0.01)
+
+    asyncio.run(telegram._send(test_item))
+
+    chat_ids = [call.kwargs["chat_id"] for call in telegram.application.bot.send_message.call_args_list]
+    assert sorted(set(chat_ids)) == ["-3", "1", "2"]
+    assert len(chat_ids) == 5
+    telegram.metrics.notification_fanout.labels.assert_called_once_with("Telegram")
+
+
+def test_telegram_rate_limiter():
+    limiter = RateLimiter(overall_rate=1000, chat_rate=10)
+
+    async def send_twice():
+        start = monotonic()
+        await limiter.wait("1")
+        await limiter.wait("2")
+        other_chat = monotonic() - start
+        await limiter.wait("1")
+        return other_chat, monotonic() - start
+
+    other_chat, same_chat = asyncio.run(send_twice())
+    assert other_chat < 0.05
+    assert same_chat >= 0.09
+
+
+class DummyNotifier(Notifier):
+    def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
+        super().__init__(config, reservations, favorites)
+        self.enabled = True
+        self.sent: list[Item] = []
+        self.threads: set[str] = set()
+
+    def _send(self, item):
+        self.threads.add(threading.current_thread().name)
+        sleep(0.2)
+        self.sent.append(item)
+
+    def __repr__(self) -> str:
+        return "Dummy"
+
+
+def test_dispatcher(test_item: Item, reservations: Reservations, favorites: Favorites):
+    dispatcher = Dispatcher(max_workers=4)
+    notifiers = [DummyNotifier(Config(), reservations, favorites) for _ in range(2)]
+    notifiers[0].concurrency = 2
+    for notifier in notifiers:
+        notifier.dispatcher = dispatcher
+        notifier.start()
+        assert notifier.is_alive
+
+    start = monotonic()
+    for notifier in notifiers:
+        notifier.send(test_item)
+        notifier.send(test_item)
+    for notifier in notifiers:
+        notifier.stop()
+        assert not notifier.is_alive
+    duration = monotonic() - start
+    dispatcher.stop()
+
+    assert [len(notifier.sent) for notifier in notifiers] == [2, 2]
+    assert len(notifiers[0].threads) == 2
+    assert all(thread.startswith("notifier") for thread in notifiers[1].threads)
+    # 2 items sent in parallel + 2 items sent in sequence on a second notifier
+    assert duration < 0.6
+    assert not dispatcher.is_alive
+
+
+def test_dispatcher_default_executor():
+    dispatcher = Dispatcher(max_workers=1)
+
+    async def worker_thread() -> threading.Thread:
+        return await asyncio.to_thread(threading.current_thread)
+
+    # asyncio.to_thread uses the bounded notifier pool, also after a restart
+    for _ in range(2):
+        assert dispatcher.run(worker_thread()).name.startswith("notifier")
+        dispatcher.stop()
+
+
+@pytest.mark.parametrize(
+    "policy,expected",
+    [
+        ("drop_oldest", ["0", "1", "2", "4"]),
+        ("coalesce", ["0", "2", "3", "4"]),
+        ("block", ["0", "1", "2", "3", "1", "2", "4"]),
+    ],
+)
+def test_dispatcher_queue_policy(
+    tgtg_item: dict, reservations: Reservations, favorites: Favorites, policy: str, expected: list[str]
+):
+    dispatcher = Dispatcher(max_workers=1)
+    dispatcher.metrics = MagicMock()
+    notifier = DummyNotifier(Config(), reservations, favorites)
+    notifier.dispatcher = dispatcher
+    notifier.queue_size = 3
+    notifier.queue_policy = policy
+    blocker = threading.Event()
+
+    def send(item: Item) -> None:
+        blocker.wait()
+        notifier.sent.append(item)
+
+    notifier._send = send  # type: ignore[method-assign]
+    notifier.start()
+
+    items = [Item({**tgtg_item, "item": {**tgtg_item["item"], "item_id": item_id}}) for item_id in "0123124"]
+    # the first item blocks the only worker, the following items have to wait in the queue
+    notifier.send(items[0])
+    sleep(0.1)
+    if policy == "block":
+        threading.Timer(0.3, blocker.set).start()
+    for item in items[1:]:
+        notifier.send(item)
+    blocker.set()
+    notifier.stop()
+    dispatcher.stop()
+
+    assert [item.item_id for item in notifier.sent] == expected
+    if policy == "coalesce":
+        # the queued items were replaced by their newest state
+        assert notifier.sent[1] is items[5]
+    dropped = dispatcher.metrics.notifier_dropped.labels
+    if policy == "block":
+        dropped.assert_not_called()
+    else:
+        dropped.assert_any_call("DummyNotifier", "coalesced" if policy == "coalesce" else "overflow")
+
+
+def test_dispatcher_digest(tgtg_item: dict, reservations: Reservations, favorites: Favorites, capsys):
+    config = Config()
+    config.console.enabled = True
+    config.console.body = "${{display_name}}"
+    config.console.digest_window = 300
+    config.console.digest_header = "${{count}} new:\n"
+    config.console.digest_row = "- ${{item_id}}\n"
+    config.console.digest_footer = "end"
+    console = Console(config, reservations, favorites)
+    console.dispatcher = Dispatcher()
+    console.start()
+
+    items = [Item({**tgtg_item, "item": {**tgtg_item["item"], "item_id": item_id}}) for item_id in "0123"]
+    console.send(items[0])
+    sleep(0.1)
+    # the first item is sent without waiting for the window to close
+    assert capsys.readouterr().out == f"{items[0].display_name}\n"
+    for item in items[1:]:
+        console.send(item)
+    sleep(0.5)
+    assert capsys.readouterr().out == "3 new:\n- 1\n- 2\n- 3\nend\n"
+    console.stop()
+    console.dispatcher.stop()
@@ -0,0 +1,97 @@
+import tempfile
+from pathlib import Path
+from time import sleep
+from unittest.mock import MagicMock
+
+from tgtg_scanner.models import Config, Item
+from tgtg_scanner.models.reservations import Reservation
+from tgtg_scanner.notifiers import Notifier
+from tgtg_scanner.notifiers.dispatcher import Dispatcher
+from tgtg_scanner.notifiers.outbox import Outbox
+
+
+class FlakyNotifier(Notifier):
+    def __init__(self, failures: int):
+        super().__init__(Config(), MagicMock(), MagicMock())
+        self.enabled = True
+        self.failures = failures
+        self.sent: list = []
+
+    def _send(self, item):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("endpoint not reachable")
+        self.sent.append(item)
+
+    def __repr__(self) -> str:
+        return "Flaky"
+
+
+def wait_for(condition, timeout: float = 5):
+    for _ in range(int(timeout * 20)):
+        if condition():
+            return
+        sleep(0.05)
+
+
+def test_outbox_resume(test_item: Item):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, "outbox.sqlite3")
+        outbox = Outbox(path)
+        outbox.add("Flaky", test_item)
+        outbox.add("Flaky", Reservation("1", 2, "name"))
+        outbox.add("Other", test_item)
+        # process stops before sending
+        outbox.close()
+
+        outbox = Outbox(path)
+        due = outbox.due(["Flaky"])
+        assert [name for name, _ in due] == ["Flaky", "Flaky"]
+        assert due[0][1].item.to_dict() == test_item.to_dict()
+        assert due[0][1].item.display_name == test_item.display_name
+        assert due[1][1].item == Reservation("1", 2, "name")
+        # taken notifications are not due again
+        assert outbox.due(["Flaky"]) == []
+        for _, notification in due:
+            outbox.done(notification)
+        assert outbox.pending == 1
+        outbox.close()
+
+
+def test_outbox_dead_letter(test_item: Item):
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(Path(tmp, "outbox.sqlite3"), max_attempts=2)
+        notification = outbox.add("Flaky", test_item)
+        assert outbox.failed(notification, "error")
+        assert not outbox.failed(notification, "error")
+        assert outbox.pending == 0
+        assert outbox.dead_letters == 1
+        outbox.close()
+
+        outbox = Outbox(Path(tmp, "outbox.sqlite3"))
+        outbox.add("Flaky", test_item)
+        outbox.close()
+        outbox = Outbox(Path(tmp, "outbox.sqlite3"), max_age=-1)
+        assert outbox.due(["Flaky"]) == []
+        assert outbox.dead_letters == 2
+        outbox.close()
+
+
+def test_dispatcher_retries_from_outbox(test_item: Item, mocker):
+    mocker.patch("tgtg_scanner.notifiers.outbox.RETRY_BACKOFF", 0.01)
+    mocker.patch("tgtg_scanner.notifiers.dispatcher.RETRY_INTERVAL", 0.05)
+    with tempfile.TemporaryDirectory() as tmp:
+        dispatcher = Dispatcher(max_workers=1)
+        dispatcher.outbox = Outbox(Path(tmp, "outbox.sqlite3"))
+        notifier = FlakyNotifier(failures=2)
+        notifier.dispatcher = dispatcher
+        notifier.start()
+        notifier.send(test_item)
+
+        wait_for(lambda: len(notifier.sent) == 1)
+        dispatcher.stop()
+
+        assert notifier.sent[0].item_id == test_item.item_id
+        assert notifier.failures == 0
+        assert dispatcher.outbox.pending == 0
+        dispatcher.outbox.close()
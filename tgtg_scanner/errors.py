@@ -22,6 +22,10 @@ class ConfigurationError(Error):
     pass
 
 
+class NotificationError(Error):
+    pass
+
+
 class MaskConfigurationError(ConfigurationError):
     def __init__(self, variable):
         self.message = (
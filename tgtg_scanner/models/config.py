@@ -26,6 +26,8 @@ CONFIG_FILE_HEADER = """## TGTG Scanner Configuration
 
 """
 
+QUEUE_POLICIES = ("drop_oldest", "coalesce", "block")
+
 DEPRECATION_NOTICE = "{} is deprecated and will be removed in a future release. Please use {} instead."
 
 
@@ -66,6 +68,14 @@ class BaseConfig(ABC):
         if value is not None:
             setattr(self, attr, value)
 
+    def _ini_get_float(self, parser: configparser.ConfigParser, section: str, key: str, attr: str):
+        try:
+            value = parser.getfloat(section, key, fallback=None)
+        except ValueError as err:
+            raise ConfigurationError(f"Invalid number value for {section}.{key} - {err}") from err
+        if value is not None:
+            setattr(self, attr, value)
+
     def _ini_get_list(self, parser: configparser.ConfigParser, section: str, key: str, attr: str):
         value = parser.get(section, key, fallback=None)
         if value is not None:
@@ -105,6 +115,14 @@ class BaseConfig(ABC):
             except ValueError as err:
                 raise ConfigurationError(f"Invalid integer value for {key} - {err}") from err
 
+    def _env_get_float(self, key: str, attr: str):
+        value = environ.get(key, None)
+        if value is not None:
+            try:
+                setattr(self, attr, float(value))
+            except ValueError as err:
+                raise ConfigurationError(f"Invalid number value for {key} - {err}") from err
+
     def _env_get_list(self, key: str, attr: str):
         value = environ.get(key, None)
         if value is not None:
@@ -126,6 +144,16 @@ class BaseConfig(ABC):
             except ValueError as err:
                 raise ConfigurationError(f"Invalid cron value for {key} - {err}") from err
 
+    def _ini_get_filter(self, parser: configparser.ConfigParser, section: str):
+        self._ini_get_float(parser, section, "MaxDistance", "max_distance")
+        self._ini_get_float(parser, section, "MaxDuration", "max_duration")
+        self._ini_get(parser, section, "FilterTravelMode", "filter_travel_mode")
+
+    def _env_get_filter(self, prefix: str):
+        self._env_get_float(f"{prefix}_MAX_DISTANCE", "max_distance")
+        self._env_get_float(f"{prefix}_MAX_DURATION", "max_duration")
+        self._env_get(f"{prefix}_FILTER_TRAVEL_MODE", "filter_travel_mode")
+
 
 @dataclass
 class NotifierConfig(BaseConfig):
@@ -133,6 +161,43 @@ class NotifierConfig(BaseConfig):
 
     enabled: bool = False
     cron: Cron = field(default_factory=Cron)
+    queue_size: int = 100
+    queue_policy: str = "drop_oldest"
+    max_distance: Union[float, None] = None
+    max_duration: Union[float, None] = None
+    filter_travel_mode: str = "walking"
+    digest_window: int = 0
+    digest_header: str = "${{count}} new Magic Bags\n"
+    digest_row: str = "${{display_name}}: ${{items_available}}\n"
+    digest_footer: str = ""
+
+    def _check_queue_policy(self, key: str):
+        if self.queue_policy not in QUEUE_POLICIES:
+            raise ConfigurationError(
+                f"Invalid queue policy '{self.queue_policy}' for {key} - use one of {', '.join(QUEUE_POLICIES)}"
+            )
+
+    def _ini_get_queue(self, parser: configparser.ConfigParser, section: str):
+        self._ini_get_int(parser, section, "QueueSize", "queue_size")
+        self._ini_get(parser, section, "QueuePolicy", "queue_policy")
+        self._check_queue_policy(f"{section}.QueuePolicy")
+
+    def _env_get_queue(self, prefix: str):
+        self._env_get_int(f"{prefix}_QUEUE_SIZE", "queue_size")
+        self._env_get(f"{prefix}_QUEUE_POLICY", "queue_policy")
+        self._check_queue_policy(f"{prefix}_QUEUE_POLICY")
+
+    def _ini_get_digest(self, parser: configparser.ConfigParser, section: str):
+        self._ini_get_int(parser, section, "DigestWindow", "digest_window")
+        self._ini_get(parser, section, "DigestHeader", "digest_header")
+        self._ini_get(parser, section, "DigestRow", "digest_row")
+        self._ini_get(parser, section, "DigestFooter", "digest_footer")
+
+    def _env_get_digest(self, prefix: str):
+        self._env_get_int(f"{prefix}_DIGEST_WINDOW", "digest_window")
+        self._env_get(f"{prefix}_DIGEST_HEADER", "digest_header")
+        self._env_get(f"{prefix}_DIGEST_ROW", "digest_row")
+        self._env_get(f"{prefix}_DIGEST_FOOTER", "digest_footer")
 
 
 @dataclass
@@ -142,20 +207,29 @@ class AppriseConfig(NotifierConfig):
     url: Union[str, None] = None
     title: str = "New Magic Bags"
     body: str = "${{display_name}} - new amount: ${{items_available}} - ${{link}}"
+    tags: list[str] = field(default_factory=list)
 
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "APPRISE", "Enabled", "enabled")
         self._ini_get_cron(parser, "APPRISE", "Cron", "cron")
+        self._ini_get_queue(parser, "APPRISE")
+        self._ini_get_filter(parser, "APPRISE")
+        self._ini_get_digest(parser, "APPRISE")
         self._ini_get(parser, "APPRISE", "URL", "url")
         self._ini_get(parser, "APPRISE", "Title", "title")
         self._ini_get(parser, "APPRISE", "Body", "body")
+        self._ini_get_list(parser, "APPRISE", "Tags", "tags")
 
     def _read_env(self):
         self._env_get_boolean("APPRISE", "enabled")
         self._env_get_cron("APPRISE_CRON", "cron")
+        self._env_get_queue("APPRISE")
+        self._env_get_filter("APPRISE")
+        self._env_get_digest("APPRISE")
         self._env_get("APPRISE_URL", "url")
         self._env_get("APPRISE_TITLE", "title")
         self._env_get("APPRISE_BODY", "body")
+        self._env_get_list("APPRISE_TAGS", "tags")
 
 
 @dataclass
@@ -175,6 +249,9 @@ class TelegramConfig(NotifierConfig):
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "TELEGRAM", "Enabled", "enabled")
         self._ini_get_cron(parser, "TELEGRAM", "Cron", "cron")
+        self._ini_get_queue(parser, "TELEGRAM")
+        self._ini_get_filter(parser, "TELEGRAM")
+        self._ini_get_digest(parser, "TELEGRAM")
         self._ini_get(parser, "TELEGRAM", "Token", "token")
         if parser.has_option("TELEGRAM", "chat_ids"):
             log.warning(DEPRECATION_NOTICE.format("[TELEGRAM] chat_ids", "ChatIDs"))
@@ -189,6 +266,9 @@ class TelegramConfig(NotifierConfig):
     def _read_env(self):
         self._env_get_boolean("TELEGRAM", "enabled")
         self._env_get_cron("TELEGRAM_CRON", "cron")
+        self._env_get_queue("TELEGRAM")
+        self._env_get_filter("TELEGRAM")
+        self._env_get_digest("TELEGRAM")
         self._env_get("TELEGRAM_TOKEN", "token")
         self._env_get_list("TELEGRAM_CHAT_IDS", "chat_ids")
         self._env_get_boolean("TELEGRAM_DISABLE_COMMANDS", "disable_commands")
@@ -208,6 +288,8 @@ class PushSaferConfig(NotifierConfig):
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "PUSHSAFER", "Enabled", "enabled")
         self._ini_get_cron(parser, "PUSHSAFER", "Cron", "cron")
+        self._ini_get_queue(parser, "PUSHSAFER")
+        self._ini_get_filter(parser, "PUSHSAFER")
         self._ini_get(parser, "PUSHSAFER", "Key", "key")
         self._ini_get(parser, "PUSHSAFER", "DeviceID", "device_id")
 
@@ -220,6 +302,8 @@ class PushSaferConfig(NotifierConfig):
             log.warning(DEPRECATION_NOTICE.format("PUSH_SAFER_CRON", "PUSHSAFER_CRON"))
         self._env_get_cron("PUSH_SAFER_CRON", "cron")
         self._env_get_cron("PUSHSAFER_CRON", "cron")
+        self._env_get_queue("PUSHSAFER")
+        self._env_get_filter("PUSHSAFER")
         if environ.get("PUSH_SAFER_KEY", None):
             log.warning(DEPRECATION_NOTICE.format("PUSH_SAFER_KEY", "PUSHSAFER_KEY"))
         self._env_get("PUSH_SAFER_KEY", "key")
@@ -239,11 +323,17 @@ class ConsoleConfig(NotifierConfig):
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "CONSOLE", "Enabled", "enabled")
         self._ini_get_cron(parser, "CONSOLE", "Cron", "cron")
+        self._ini_get_queue(parser, "CONSOLE")
+        self._ini_get_filter(parser, "CONSOLE")
+        self._ini_get_digest(parser, "CONSOLE")
         self._ini_get(parser, "CONSOLE", "Body", "body")
 
     def _read_env(self):
         self._env_get_boolean("CONSOLE", "enabled")
         self._env_get_cron("CONSOLE_CRON", "cron")
+        self._env_get_queue("CONSOLE")
+        self._env_get_filter("CONSOLE")
+        self._env_get_digest("CONSOLE")
         self._env_get("CONSOLE_BODY", "body")
 
 
@@ -263,10 +353,18 @@ class SMTPConfig(NotifierConfig):
     recipients_per_item: Union[str, None] = None
     subject: str = "${{display_name}} New Amount: ${{items_available}} @ ${{price}}"
     body: str = "<b>${{display_name}}</b> </br>New Amount: ${{items_available}} @ ${{price}}"
+    idle_timeout: int = 60
+    digest_subject: str = "${{count}} new Magic Bags"
+    digest_header: str = "<b>${{count}} new Magic Bags</b></br>"
+    digest_row: str = "${{display_name}}: ${{items_available}} @ ${{price}}</br>"
 
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "SMTP", "Enabled", "enabled")
         self._ini_get_cron(parser, "SMTP", "Cron", "cron")
+        self._ini_get_queue(parser, "SMTP")
+        self._ini_get_filter(parser, "SMTP")
+        self._ini_get_digest(parser, "SMTP")
+        self._ini_get(parser, "SMTP", "DigestSubject", "digest_subject")
         self._ini_get(parser, "SMTP", "Host", "host")
         self._ini_get_int(parser, "SMTP", "Port", "port")
         self._ini_get(parser, "SMTP", "Username", "username")
@@ -274,6 +372,7 @@ class SMTPConfig(NotifierConfig):
         self._ini_get_boolean(parser, "SMTP", "TLS", "use_tls")
         self._ini_get_boolean(parser, "SMTP", "SSL", "use_ssl")
         self._ini_get_int(parser, "SMTP", "Timeout", "timeout")
+        self._ini_get_int(parser, "SMTP", "IdleTimeout", "idle_timeout")
         self._ini_get(parser, "SMTP", "Sender", "sender")
         if parser.has_option("SMTP", "Recipient"):
             log.warning(DEPRECATION_NOTICE.format("[SMTP] Recipient", "Recipients"))
@@ -286,6 +385,10 @@ class SMTPConfig(NotifierConfig):
     def _read_env(self):
         self._env_get_boolean("SMTP", "enabled")
         self._env_get_cron("SMTP_CRON", "cron")
+        self._env_get_queue("SMTP")
+        self._env_get_filter("SMTP")
+        self._env_get_digest("SMTP")
+        self._env_get("SMTP_DIGEST_SUBJECT", "digest_subject")
         self._env_get("SMTP_HOST", "host")
         self._env_get_int("SMTP_PORT", "port")
         self._env_get("SMTP_USERNAME", "username")
@@ -293,6 +396,7 @@ class SMTPConfig(NotifierConfig):
         self._env_get_boolean("SMTP_TLS", "use_tls")
         self._env_get_boolean("SMTP_SSL", "use_ssl")
         self._env_get_int("SMTP_TIMEOUT", "timeout")
+        self._env_get_int("SMTP_IDLE_TIMEOUT", "idle_timeout")
         self._env_get("SMTP_SENDER", "sender")
         if environ.get("SMTP_RECIPIENT", None):
             log.warning(DEPRECATION_NOTICE.format("SMTP_RECIPIENT", "SMTP_RECIPIENTS"))
@@ -311,22 +415,29 @@ class IFTTTConfig(NotifierConfig):
     key: Union[str, None] = None
     body: str = '{"value1": "${{display_name}}", "value2": ${{items_available}}, "value3": "${{link}}"}'
     timeout: int = 60
+    pool_size: int = 1
 
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "IFTTT", "Enabled", "enabled")
         self._ini_get_cron(parser, "IFTTT", "Cron", "cron")
+        self._ini_get_queue(parser, "IFTTT")
+        self._ini_get_filter(parser, "IFTTT")
         self._ini_get(parser, "IFTTT", "Event", "event")
         self._ini_get(parser, "IFTTT", "Key", "key")
         self._ini_get(parser, "IFTTT", "Body", "body")
         self._ini_get_int(parser, "IFTTT", "Timeout", "timeout")
+        self._ini_get_int(parser, "IFTTT", "PoolSize", "pool_size")
 
     def _read_env(self):
         self._env_get_boolean("IFTTT", "enabled")
         self._env_get_cron("IFTTT_CRON", "cron")
+        self._env_get_queue("IFTTT")
+        self._env_get_filter("IFTTT")
         self._env_get("IFTTT_EVENT", "event")
         self._env_get("IFTTT_KEY", "key")
         self._env_get("IFTTT_BODY", "body")
         self._env_get_int("IFTTT_TIMEOUT", "timeout")
+        self._env_get_int("IFTTT_POOL_SIZE", "pool_size")
 
 
 @dataclass
@@ -345,10 +456,13 @@ class NtfyConfig(NotifierConfig):
     password: Union[str, None] = None
     token: Union[str, None] = None
     timeout: int = 60
+    pool_size: int = 1
 
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "NTFY", "Enabled", "enabled")
         self._ini_get_cron(parser, "NTFY", "Cron", "cron")
+        self._ini_get_queue(parser, "NTFY")
+        self._ini_get_filter(parser, "NTFY")
         self._ini_get(parser, "NTFY", "Server", "server")
         self._ini_get(parser, "NTFY", "Topic", "topic")
         self._ini_get(parser, "NTFY", "Title", "title")
@@ -361,10 +475,13 @@ class NtfyConfig(NotifierConfig):
         self._ini_get(parser, "NTFY", "Password", "password")
         self._ini_get(parser, "NTFY", "Token", "token")
         self._ini_get_int(parser, "NTFY", "Timeout", "timeout")
+        self._ini_get_int(parser, "NTFY", "PoolSize", "pool_size")
 
     def _read_env(self):
         self._env_get_boolean("NTFY", "enabled")
         self._env_get_cron("NTFY_CRON", "cron")
+        self._env_get_queue("NTFY")
+        self._env_get_filter("NTFY")
         self._env_get("NTFY_SERVER", "server")
         self._env_get("NTFY_TOPIC", "topic")
         self._env_get("NTFY_TITLE", "title")
@@ -377,6 +494,7 @@ class NtfyConfig(NotifierConfig):
         self._env_get("NTFY_PASSWORD", "password")
         self._env_get("NTFY_TOKEN", "token")
         self._env_get_int("NTFY_TIMEOUT", "timeout")
+        self._env_get_int("NTFY_POOL_SIZE", "pool_size")
 
 
 @dataclass
@@ -389,12 +507,17 @@ class WebhookConfig(NotifierConfig):
     body: str = ""
     type: str = "text/plain"
     timeout: int = 60
+    pool_size: int = 1
     username: Union[str, None] = None
     password: Union[str, None] = None
+    retries: int = 0
+    endpoints: list[dict] = field(default_factory=list)
 
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "WEBHOOK", "Enabled", "enabled")
         self._ini_get_cron(parser, "WEBHOOK", "Cron", "cron")
+        self._ini_get_queue(parser, "WEBHOOK")
+        self._ini_get_filter(parser, "WEBHOOK")
         self._ini_get(parser, "WEBHOOK", "URL", "url")
         self._ini_get(parser, "WEBHOOK", "Method", "method")
         self._ini_get_dict(parser, "WEBHOOK", "Headers", "headers")
@@ -403,10 +526,15 @@ class WebhookConfig(NotifierConfig):
         self._ini_get(parser, "WEBHOOK", "Username", "username")
         self._ini_get(parser, "WEBHOOK", "Password", "password")
         self._ini_get_int(parser, "WEBHOOK", "Timeout", "timeout")
+        self._ini_get_int(parser, "WEBHOOK", "PoolSize", "pool_size")
+        self._ini_get_int(parser, "WEBHOOK", "Retries", "retries")
+        self._ini_get_dict(parser, "WEBHOOK", "Endpoints", "endpoints")
 
     def _read_env(self):
         self._env_get_boolean("WEBHOOK", "enabled")
         self._env_get_cron("WEBHOOK_CRON", "cron")
+        self._env_get_queue("WEBHOOK")
+        self._env_get_filter("WEBHOOK")
         self._env_get("WEBHOOK_URL", "url")
         self._env_get("WEBHOOK_METHOD", "method")
         self._env_get_dict("WEBHOOK_HEADERS", "headers")
@@ -415,6 +543,9 @@ class WebhookConfig(NotifierConfig):
         self._env_get("WEBHOOK_USERNAME", "username")
         self._env_get("WEBHOOK_PASSWORD", "password")
         self._env_get_int("WEBHOOK_TIMEOUT", "timeout")
+        self._env_get_int("WEBHOOK_POOL_SIZE", "pool_size")
+        self._env_get_int("WEBHOOK_RETRIES", "retries")
+        self._env_get_dict("WEBHOOK_ENDPOINTS", "endpoints")
 
 
 @dataclass
@@ -422,16 +553,29 @@ class ScriptConfig(NotifierConfig):
     """Script Notifier configuration"""
 
     command: Union[str, None] = None
+    concurrency: int = 4
+    timeout: int = 60
+    stdin: bool = False
 
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "SCRIPT", "Enabled", "enabled")
         self._ini_get_cron(parser, "SCRIPT", "Cron", "cron")
+        self._ini_get_queue(parser, "SCRIPT")
+        self._ini_get_filter(parser, "SCRIPT")
         self._ini_get(parser, "SCRIPT", "Command", "command")
+        self._ini_get_int(parser, "SCRIPT", "Concurrency", "concurrency")
+        self._ini_get_int(parser, "SCRIPT", "Timeout", "timeout")
+        self._ini_get_boolean(parser, "SCRIPT", "Stdin", "stdin")
 
     def _read_env(self):
         self._env_get_boolean("SCRIPT", "enabled")
         self._env_get_cron("SCRIPT_CRON", "cron")
+        self._env_get_queue("SCRIPT")
+        self._env_get_filter("SCRIPT")
         self._env_get("SCRIPT_COMMAND", "command")
+        self._env_get_int("SCRIPT_CONCURRENCY", "concurrency")
+        self._env_get_int("SCRIPT_TIMEOUT", "timeout")
+        self._env_get_boolean("SCRIPT_STDIN", "stdin")
 
 
 @dataclass
@@ -455,6 +599,9 @@ class DiscordConfig(NotifierConfig):
         self._ini_get(parser, "DISCORD", "Body", "body")
         self._ini_get_boolean(parser, "DISCORD", "DisableCommands", "disable_commands")
         self._ini_get_cron(parser, "DISCORD", "Cron", "cron")
+        self._ini_get_queue(parser, "DISCORD")
+        self._ini_get_filter(parser, "DISCORD")
+        self._ini_get_digest(parser, "DISCORD")
 
     def _read_env(self):
         self._env_get_boolean("DISCORD", "enabled")
@@ -464,6 +611,9 @@ class DiscordConfig(NotifierConfig):
         self._env_get("DISCORD_BODY", "body")
         self._env_get_boolean("DISCORD_DISABLE_COMMANDS", "disable_commands")
         self._env_get_cron("DISCORD_CRON", "cron")
+        self._env_get_queue("DISCORD")
+        self._env_get_filter("DISCORD")
+        self._env_get_digest("DISCORD")
 
 
 @dataclass
@@ -508,6 +658,11 @@ class LocationConfig(BaseConfig):
     enabled: bool = False
     google_maps_api_key: Union[str, None] = None
     origin_address: Union[str, None] = None
+    cache_ttl: int = 30
+    cache_size: int = 10000
+    provider: str = "google"
+    origin_coordinates: Union[list[str], None] = None
+    speeds: dict[str, float] = field(default_factory=dict)
 
     def _read_ini(self, parser: configparser.ConfigParser):
         self._ini_get_boolean(parser, "LOCATION", "Enabled", "enabled")
@@ -519,6 +674,11 @@ class LocationConfig(BaseConfig):
             log.warning(DEPRECATION_NOTICE.format("[LOCATION] Address", "OriginAddress"))
         self._ini_get(parser, "LOCATION", "Address", "origin_address")  # legacy support
         self._ini_get(parser, "LOCATION", "OriginAddress", "origin_address")
+        self._ini_get_int(parser, "LOCATION", "CacheTTL", "cache_ttl")
+        self._ini_get_int(parser, "LOCATION", "CacheSize", "cache_size")
+        self._ini_get(parser, "LOCATION", "Provider", "provider")
+        self._ini_get_list(parser, "LOCATION", "OriginCoordinates", "origin_coordinates")
+        self._ini_get_dict(parser, "LOCATION", "Speeds", "speeds")
 
     def _read_env(self):
         self._env_get_boolean("LOCATION", "enabled")
@@ -527,6 +687,11 @@ class LocationConfig(BaseConfig):
             log.warning(DEPRECATION_NOTICE.format("LOCATION_ADDRESS", "LOCATION_ORIGIN_ADDRESS"))
         self._env_get("LOCATION_ADDRESS", "origin_address")  # legacy support
         self._env_get("LOCATION_ORIGIN_ADDRESS", "origin_address")
+        self._env_get_int("LOCATION_CACHE_TTL", "cache_ttl")
+        self._env_get_int("LOCATION_CACHE_SIZE", "cache_size")
+        self._env_get("LOCATION_PROVIDER", "provider")
+        self._env_get_list("LOCATION_ORIGIN_COORDINATES", "origin_coordinates")
+        self._env_get_dict("LOCATION_SPEEDS", "speeds")
 
 
 @dataclass
@@ -536,16 +701,26 @@ class Config(BaseConfig):
     file: Union[str, None] = None
     item_ids: list[str] = field(default_factory=list)
     buy_item_ids: list[str] = field(default_factory=list)
+    item_groups: list[dict] = field(default_factory=list)
     sleep_time: int = 60
     schedule_cron: Cron = field(default_factory=Cron)
     debug: bool = False
     locale: str = "en_US"
     metrics: bool = False
     metrics_port: int = 8000
+    metrics_max_items: int = 1000
+    metrics_item_info: bool = True
+    metrics_state: bool = False
     disable_tests: bool = False
     quiet: bool = False
     docker: bool = False
     activity: bool = True
+    cache_path: Union[str, None] = None
+    outbox_max_attempts: int = 5
+    outbox_max_age: int = 3600
+    max_distance: Union[float, None] = None
+    max_duration: Union[float, None] = None
+    filter_travel_mode: str = "walking"
     tgtg: TgtgConfig = field(default_factory=TgtgConfig)
     location: LocationConfig = field(default_factory=LocationConfig)
     token_path: Union[str, None] = None
@@ -617,27 +792,45 @@ class Config(BaseConfig):
         self._ini_get_list(parser, "MAIN", "BuyItemIDs", "buy_item_ids")
         self._ini_get_int(parser, "MAIN", "SleepTime", "sleep_time")
         self._ini_get_cron(parser, "MAIN", "ScheduleCron", "schedule_cron")
+        self._ini_get_dict(parser, "MAIN", "ItemGroups", "item_groups")
         self._ini_get_boolean(parser, "MAIN", "Debug", "debug")
         self._ini_get(parser, "MAIN", "Locale", "locale")
         self._ini_get_boolean(parser, "MAIN", "Metrics", "metrics")
         self._ini_get_int(parser, "MAIN", "MetricsPort", "metrics_port")
+        self._ini_get_int(parser, "MAIN", "MetricsMaxItems", "metrics_max_items")
+        self._ini_get_boolean(parser, "MAIN", "MetricsItemInfo", "metrics_item_info")
+        self._ini_get_boolean(parser, "MAIN", "MetricsState", "metrics_state")
         self._ini_get_boolean(parser, "MAIN", "DisableTests", "disable_tests")
         self._ini_get_boolean(parser, "MAIN", "Quiet", "quiet")
         self._ini_get_boolean(parser, "MAIN", "Docker", "docker")
         self._ini_get_boolean(parser, "MAIN", "Activity", "activity")
+        self._ini_get(parser, "MAIN", "CachePath", "cache_path")
+        self._ini_get_int(parser, "MAIN", "OutboxMaxAttempts", "outbox_max_attempts")
+        self._ini_get_int(parser, "MAIN", "OutboxMaxAge", "outbox_max_age")
+        self._ini_get_filter(parser, "MAIN")
 
     def _read_env(self):
         self._env_get_list("ITEM_IDS", "item_ids")
         self._env_get_int("SLEEP_TIME", "sleep_time")
         self._env_get_cron("SCHEDULE_CRON", "schedule_cron")
+        self._env_get_dict("ITEM_GROUPS", "item_groups")
         self._env_get_boolean("DEBUG", "debug")
         self._env_get("LOCALE", "locale")
         self._env_get_boolean("METRICS", "metrics")
         self._env_get_int("METRICS_PORT", "metrics_port")
+        self._env_get_int("METRICS_MAX_ITEMS", "metrics_max_items")
+        self._env_get_boolean("METRICS_ITEM_INFO", "metrics_item_info")
+        self._env_get_boolean("METRICS_STATE", "metrics_state")
         self._env_get_boolean("DISABLE_TESTS", "disable_tests")
         self._env_get_boolean("QUIET", "quiet")
         self._env_get_boolean("DOCKER", "docker")
         self._env_get_boolean("ACTIVITY", "activity")
+        self._env_get("CACHE_PATH", "cache_path")
+        self._env_get_int("OUTBOX_MAX_ATTEMPTS", "outbox_max_attempts")
+        self._env_get_int("OUTBOX_MAX_AGE", "outbox_max_age")
+        self._env_get_float("MAX_DISTANCE", "max_distance")
+        self._env_get_float("MAX_DURATION", "max_duration")
+        self._env_get("FILTER_TRAVEL_MODE", "filter_travel_mode")
 
     def _open(self, file: str, mode: str) -> IO[Any]:
         if self.token_path is None:
@@ -1,31 +1,164 @@
 import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
 from typing import Union
 
-import pycron
 from cron_descriptor import Options, get_description
 
 log = logging.getLogger("tgtg")
 
+# days searched for the next activation or deactivation
+SEARCH_DAYS = 366 * 4 + 1
+# day of week names, Sunday is 0
+DAY_NAMES = ("sunday", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday")
+
+
+def parse_value(value: str, day_names: bool = False) -> int:
+    """Number of a cron field value, day of week values may also be names like mon or monday"""
+    value = value.strip().lower()
+    if value.isdigit():
+        return int(value)
+    if day_names:
+        for day, name in enumerate(DAY_NAMES):
+            if value in (name, name[:3]):
+                return day
+    raise ValueError(f"invalid value {value!r}")
+
+
+def parse_field(field: str, domain: range, day_names: bool = False) -> frozenset[int]:
+    """
+    Values of the domain matched by a cron field. Supports *, lists, ranges
+    a-b and a-b/step and steps */step, which like pycron match the multiples
+    of step. Day of week ranges wrap around the week, e.g. fri-mon.
+    """
+    field = field.strip()
+    if field == "*":
+        return frozenset(domain)
+    values: set[int] = set()
+    for part in filter(None, (part.strip() for part in field.split(","))):
+        interval, _, step = part.partition("/")
+        if interval.strip() == "*":
+            if not step:
+                raise ValueError(f"invalid value {part!r}")
+            divisor = parse_value(step, day_names)
+            if divisor == 0:
+                raise ValueError(f"invalid step {part!r}")
+            values.update(value for value in domain if value % divisor == 0)
+        elif "-" in interval:
+            start, end = (parse_value(bound, day_names) for bound in interval.split("-", 1))
+            matched = range(start, end + 1, parse_value(step, day_names) if step else 1)
+            values.update(matched)
+            if day_names and start > end:
+                values.update(range(start, 7))
+                values.update(range(0, end + 1))
+        elif step:
+            raise ValueError(f"invalid value {part!r}")
+        else:
+            values.add(parse_value(interval, day_names))
+    return frozenset(values.intersection(domain))
+
+
+@dataclass(frozen=True)
+class CronRule:
+    """Cron expression compiled to the sets of matching values"""
+
+    minutes: frozenset[int]
+    hours: frozenset[int]
+    days: frozenset[int]
+    months: frozenset[int]
+    weekdays: frozenset[int]
+    # either day field matches if both are restricted, as in pycron
+    any_day: bool
+
+    @classmethod
+    def compile(cls, cron: str) -> "CronRule":
+        minute, hour, dom, month, dow = cron.split()
+        return cls(
+            parse_field(minute, range(60)),
+            parse_field(hour, range(24)),
+            parse_field(dom, range(1, 32)),
+            parse_field(month, range(1, 13)),
+            parse_field(dow, range(7), True),
+            "*" not in dom and "*" not in dow,
+        )
+
+    def matches_day(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+        # Sunday is 0
+        in_days, in_weekdays = day.day in self.days, day.isoweekday() % 7 in self.weekdays
+        return in_days or in_weekdays if self.any_day else in_days and in_weekdays
+
 
 class Cron:
+    """
+    One or more cron expressions separated by semicolons.
+
+    The expressions are compiled once. is_now caches the current state
+    until the next activation or deactivation, so checking it is a
+    comparison with the cached boundary.
+    """
+
     def __init__(self, cron_str: Union[str, None] = None) -> None:
         self.crons = list(dict.fromkeys([cron.strip() for cron in cron_str.split(";")])) if cron_str else ["* * * * *"]
         self.options = Options()
         self.options.use_24hour_time_format = True
         self.options.day_of_week_start_index_zero = True
         try:
-            self.is_now
+            self.rules = [CronRule.compile(cron) for cron in self.crons]
         except ValueError as err:
             raise ValueError(f"Cron expression parsing error - {err}") from err
         for cron in self.crons:
             _, _, _, _, dow = cron.split()
             if any(int(day) > 6 for day in dow.split("-") if day.isdigit()):
                 raise ValueError("Cron expression parsing error - day of week must be between 0 and 6 (Sunday=0)")
+        # current state, the time it was determined and the time it changes
+        self._window: tuple[bool, datetime, datetime] = (False, datetime.max, datetime.min)
+
+    def matches(self, dt: datetime) -> bool:
+        """Returns True if the cron expression matches the time"""
+        return any(dt.minute in rule.minutes and dt.hour in rule.hours and rule.matches_day(dt.date()) for rule in self.rules)
+
+    def _next(self, start: datetime, active: bool) -> Union[datetime, None]:
+        """First minute from start on at which matches() returns active"""
+        start = start.replace(second=0, microsecond=0)
+        for offset in range(SEARCH_DAYS):
+            day = start.date() + timedelta(days=offset)
+            first_hour = start.hour if offset == 0 else 0
+            rules = [rule for rule in self.rules if rule.matches_day(day)]
+            if not rules:
+                if active:
+                    continue
+                return datetime.combine(day, time(first_hour, start.minute if offset == 0 else 0))
+            for hour in range(first_hour, 24):
+                minutes = frozenset().union(*(rule.minutes for rule in rules if hour in rule.hours))
+                if len(minutes) == (0 if active else 60):
+                    continue
+                first_minute = start.minute if offset == 0 and hour == start.hour else 0
+                for minute in range(first_minute, 60):
+                    if (minute in minutes) == active:
+                        return datetime.combine(day, time(hour, minute))
+        return None
+
+    def next_activation(self, now: Union[datetime, None] = None) -> Union[datetime, None]:
+        """Start of the next matching minute, now if the expression matches now. None if it never matches."""
+        now = now or datetime.now()
+        return now if self.matches(now) else self._next(now, True)
+
+    def next_deactivation(self, now: Union[datetime, None] = None) -> Union[datetime, None]:
+        """Start of the next minute that does not match, now if the expression does not match. None if it always matches."""
+        now = now or datetime.now()
+        return self._next(now, False) if self.matches(now) else now
 
     @property
     def is_now(self) -> bool:
         """Returns True if the cron expression matches the current time"""
-        return any(pycron.is_now(cron) for cron in self.crons)
+        now = datetime.now()
+        active, since, until = self._window
+        if not since <= now < until:
+            active = self.matches(now)
+            self._window = (active, now, self._next(now, not active) or datetime.max)
+        return active
 
     def get_description(self, locale: str = "en") -> str:
         """Returns a human-readable description of the cron expression"""
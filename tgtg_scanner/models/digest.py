@@ -0,0 +1,53 @@
+import re
+from typing import Callable
+
+from tgtg_scanner.errors import MaskConfigurationError
+from tgtg_scanner.models.item import Item
+
+DIGEST_ATTRS = ["count"]
+
+
+class Digest:
+    """
+    Items detected within one digest window of a notifier.
+
+    Rendered as one message from a header, one row per item and a footer.
+    Header and footer may contain the variable ${{count}}, rows contain the
+    usual item variables.
+    """
+
+    def __init__(self, items: list[Item]):
+        self.items = items
+
+    @property
+    def count(self) -> int:
+        return len(self.items)
+
+    @staticmethod
+    def check_mask(header: str, row: str, footer: str) -> None:
+        """
+        Checks whether the variables in the digest templates are available
+
+        Raises MaskConfigurationError
+        """
+        for text in (header, footer):
+            for match in re.finditer(r"\${{([a-zA-Z0-9_]+)}}", text):
+                if not match.group(1) in DIGEST_ATTRS:
+                    raise MaskConfigurationError(match.group(0))
+        Item.check_mask(row)
+
+    def unmask(
+        self,
+        header: str,
+        row: str,
+        footer: str,
+        unmask_row: Callable[[str, Item], str] = lambda text, item: item.unmask(text),
+    ) -> str:
+        """
+        Renders the digest message.
+
+        unmask_row can be used to escape item values, e.g. for markdown.
+        """
+        count = str(self.count)
+        rows = "".join(unmask_row(row, item) for item in self.items)
+        return header.replace("${{count}}", count) + rows + footer.replace("${{count}}", count)
@@ -0,0 +1,53 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Union
+
+from tgtg_scanner.errors import ConfigurationError
+from tgtg_scanner.models.item import Item
+from tgtg_scanner.models.location import Location
+
+log = logging.getLogger("tgtg")
+
+
+@dataclass
+class DistanceFilter:
+    """
+    Drops items that are too far away.
+
+    Only cached or offline distances are used, so checking an item never
+    requests Google Maps. Items without a known distance pass the filter.
+    """
+
+    max_distance: Union[float, None] = None
+    max_duration: Union[float, None] = None
+    travel_mode: str = "walking"
+
+    @classmethod
+    def from_config(cls, config: Any) -> "DistanceFilter":
+        """Filter from the MaxDistance (km), MaxDuration (minutes) and FilterTravelMode options"""
+        if config.filter_travel_mode not in Location.MODES:
+            raise ConfigurationError(
+                f"Invalid filter travel mode '{config.filter_travel_mode}' - use one of {', '.join(Location.MODES)}"
+            )
+        return cls(
+            None if config.max_distance is None else config.max_distance * 1000,
+            None if config.max_duration is None else config.max_duration * 60,
+            config.filter_travel_mode,
+        )
+
+    @property
+    def active(self) -> bool:
+        return self.max_distance is not None or self.max_duration is not None
+
+    def accepts(self, item: Item) -> bool:
+        """False if the item is known to be farther away than allowed"""
+        if not self.active or item.location is None:
+            return True
+        distance_time = item.location.cached_distance_time(item.pickup_location, self.travel_mode, item.pickup_coordinates)
+        if distance_time is None:
+            return True
+        if self.max_distance is not None and distance_time.distance > self.max_distance:
+            return False
+        if self.max_duration is not None and distance_time.duration > self.max_duration:
+            return False
+        return True
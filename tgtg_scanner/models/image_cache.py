@@ -0,0 +1,215 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http import HTTPStatus
+from pathlib import Path
+from typing import Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger("tgtg")
+
+MEMORY_BUDGET = 16 * 1024 * 1024  # 16 MB
+DISK_BUDGET = 128 * 1024 * 1024  # 128 MB
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_WORKERS = 4
+
+
+def is_image_url(url: Union[str, None]) -> bool:
+    """Returns True if the url can be downloaded, False for missing images like the "-" placeholder"""
+    return bool(url) and str(url).startswith(("http://", "https://"))
+
+
+class ImageCache:
+    """
+    Process wide cache for item images.
+
+    Images are kept in a memory tier and, if a cache path is configured,
+    in a disk tier. Both tiers have a byte budget and evict the least
+    recently used images first. Concurrent requests for the same url
+    share one download.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path, None] = None,
+        memory_budget: int = MEMORY_BUDGET,
+        disk_budget: int = DISK_BUDGET,
+        timeout: int = DOWNLOAD_TIMEOUT,
+        max_workers: int = DOWNLOAD_WORKERS,
+    ) -> None:
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.timeout = timeout
+        self.path: Union[Path, None] = None
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_size = 0
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image_cache")
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        if path is not None:
+            self.set_path(path)
+
+    def set_path(self, path: Union[str, Path, None]) -> None:
+        """Enables the disk tier in the given directory"""
+        with self._lock:
+            self._disk.clear()
+            self._disk_size = 0
+            self.path = None
+            if path is None:
+                return
+            self.path = Path(path)
+            try:
+                self.path.mkdir(parents=True, exist_ok=True)
+                files = sorted(
+                    (file for file in self.path.iterdir() if file.is_file()),
+                    key=lambda file: file.stat().st_mtime,
+                )
+                for file in files:
+                    size = file.stat().st_size
+                    self._disk[file.name] = size
+                    self._disk_size += size
+                self._evict_disk()
+            except OSError as err:
+                log.warning("Image cache path not usable - %s", err)
+                self.path = None
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get_cached(self, url: str) -> Union[bytes, None]:
+        """Returns the image if it is cached, without downloading it"""
+        with self._lock:
+            data = self._memory.get(url)
+            if data is not None:
+                self._memory.move_to_end(url)
+                return data
+            data = self._read_disk(url)
+            if data is not None:
+                self._store_memory(url, data)
+            return data
+
+    def get(self, url: str, timeout: Union[float, None] = None) -> Union[bytes, None]:
+        """Returns the image, downloading it if necessary.
+
+        Args:
+            url (str): image url
+            timeout (float, optional): max seconds to wait for a running download.
+                Waits for the download to finish if None.
+        """
+        data = self.get_cached(url)
+        if data is not None:
+            return data
+        try:
+            return self.prefetch(url).result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+
+    def prefetch(self, url: str) -> Future:
+        """Starts downloading the image in the background if it is not cached yet"""
+        with self._lock:
+            pending = self._pending.get(url)
+            if pending is not None:
+                return pending
+            data = self._memory.get(url)
+            if data is not None:
+                done: Future = Future()
+                done.set_result(data)
+                return done
+            future = self._executor.submit(self._download, url)
+            self._pending[url] = future
+            return future
+
+    def _download(self, url: str) -> Union[bytes, None]:
+        try:
+            data = self._read_disk(url)
+            if data is None:
+                response = self._session.get(url, timeout=self.timeout)
+                if not response.status_code == HTTPStatus.OK:
+                    log.warning("Get Image Error: %s - %s", response.status_code, response.content)
+                    return None
+                data = response.content
+                self._write_disk(url, data)
+            with self._lock:
+                self._store_memory(url, data)
+            return data
+        except requests.RequestException as err:
+            log.warning("Get Image Error: %s", err)
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def _store_memory(self, url: str, data: bytes) -> None:
+        if len(data) > self.memory_budget:
+            return
+        if url in self._memory:
+            self._memory_size -= len(self._memory.pop(url))
+        self._memory[url] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _read_disk(self, url: str) -> Union[bytes, None]:
+        if self.path is None:
+            return None
+        key = self._key(url)
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        file = self.path / key
+        try:
+            data = file.read_bytes()
+            os.utime(file)
+            return data
+        except OSError:
+            with self._lock:
+                self._disk_size -= self._disk.pop(key, 0)
+            return None
+
+    def _write_disk(self, url: str, data: bytes) -> None:
+        if self.path is None or len(data) > self.disk_budget:
+            return
+        key = self._key(url)
+        try:
+            (self.path / key).write_bytes(data)
+        except OSError as err:
+            log.warning("Failed writing image cache - %s", err)
+            return
+        with self._lock:
+            self._disk_size -= self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._disk_size += len(data)
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while self._disk_size > self.disk_budget and self._disk and self.path is not None:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                (self.path / key).unlink()
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Clears the memory tier"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+
+
+image_cache = ImageCache()
@@ -1,14 +1,15 @@
 import datetime
+import functools
 import logging
 import re
-from http import HTTPStatus
 from typing import Any, Union
 
+import babel
 import babel.numbers
 import humanize
-import requests
 
 from tgtg_scanner.errors import MaskConfigurationError
+from tgtg_scanner.models.image_cache import image_cache, is_image_url
 from tgtg_scanner.models.location import DistanceTime, Location
 
 ATTRS = [
@@ -44,9 +45,31 @@ ATTRS = [
     "duration_biking",
 ]
 
+FORMAT_CACHE_SIZE = 4096
+
 log = logging.getLogger("tgtg")
 
 
+@functools.lru_cache(maxsize=None)
+def get_locale(locale: str) -> babel.Locale:
+    """
+    Returns the resolved babel Locale for the locale identifier.
+    Locales are parsed only once per process.
+    """
+    return babel.Locale.parse(locale)
+
+
+@functools.lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_number(number: float, currency: Union[str, None], locale: str) -> str:
+    """
+    Formats a number as decimal or, if a currency is given, as currency amount.
+    Results are cached by (number, currency, locale).
+    """
+    if currency is None or currency == "-":
+        return babel.numbers.format_decimal(number, locale=get_locale(locale))
+    return babel.numbers.format_currency(number, currency, locale=get_locale(locale))
+
+
 class Item:
     """
     Takes the raw data from the TGTG API and
@@ -54,12 +77,17 @@ class Item:
     """
 
     def __init__(self, data: dict, location: Union[Location, None] = None, locale: str = "en_US"):
+        self._data = data
         self.items_available: int = data.get("items_available", 0)
         self.display_name: str = data.get("display_name", "-")
         self.favorite: str = "Yes" if data.get("favorite", False) else "No"
         self.pickup_interval_start: Union[str, None] = data.get("pickup_interval", {}).get("start", None)
         self.pickup_interval_end: Union[str, None] = data.get("pickup_interval", {}).get("end", None)
         self.pickup_location: str = data.get("pickup_location", {}).get("address", {}).get("address_line", "-")
+        coordinates: dict = data.get("pickup_location", {}).get("location", {})
+        self.pickup_coordinates: Union[tuple[float, float], None] = None
+        if "latitude" in coordinates and "longitude" in coordinates:
+            self.pickup_coordinates = (float(coordinates["latitude"]), float(coordinates["longitude"]))
 
         item: dict = data.get("item", {})
         self.item_id: str = item.get("item_id", None)
@@ -90,6 +118,10 @@ class Item:
         self.location = location
         self.locale = locale
 
+    def to_dict(self) -> dict:
+        """Raw item data as returned by the TGTG API"""
+        return self._data
+
     @property
     def rating(self) -> str:
         if self._rating is None:
@@ -105,12 +137,10 @@ class Item:
         return self._format_currency(self._value)
 
     def _format_decimal(self, number: float) -> str:
-        return babel.numbers.format_decimal(number, locale=self.locale)
+        return format_number(number, None, self.locale)
 
     def _format_currency(self, number: float) -> str:
-        if self.currency == "-":
-            return self._format_decimal(number)
-        return babel.numbers.format_currency(number, self.currency, locale=self.locale)
+        return format_number(number, self.currency, self.locale)
 
     @staticmethod
     def _datetimeparse(datestr: str) -> datetime.datetime:
@@ -134,11 +164,7 @@ class Item:
 
     @staticmethod
     def get_image(url: str) -> Union[bytes, None]:
-        response = requests.get(url)
-        if not response.status_code == HTTPStatus.OK:
-            log.warning("Get Image Error: %s - %s", response.status_code, response.content)
-            return None
-        return response.content
+        return image_cache.get(url) if is_image_url(url) else None
 
     @property
     def item_logo_bytes(self) -> Union[bytes, None]:
@@ -192,7 +218,7 @@ class Item:
     def _get_distance_time(self, travel_mode: str) -> Union[DistanceTime, None]:
         if self.location is None:
             return None
-        return self.location.calculate_distance_time(self.pickup_location, travel_mode)
+        return self.location.calculate_distance_time(self.pickup_location, travel_mode, self.pickup_coordinates)
 
     def _get_distance(self, travel_mode: str) -> str:
         distance_time = self._get_distance_time(travel_mode)
@@ -0,0 +1,69 @@
+import logging
+from dataclasses import dataclass, field
+from random import random
+from typing import Any
+
+from tgtg_scanner.errors import ConfigurationError
+from tgtg_scanner.models.cron import Cron
+
+log = logging.getLogger("tgtg")
+
+
+@dataclass
+class ItemGroup:
+    """
+    Items scanned on a common schedule.
+
+    A group is fetched when its cron schedule is active and sleep_time
+    seconds have passed since its last fetch. Groups with a higher
+    priority are fetched first. The default group contains the ItemIDs
+    and the favorites and is scanned on the ScheduleCron schedule.
+    """
+
+    name: str
+    item_ids: list[str] = field(default_factory=list)
+    cron: Cron = field(default_factory=Cron)
+    sleep_time: int = 60
+    priority: int = 0
+    favorites: bool = False
+    # monotonic time of the next fetch
+    next_fetch: float = 0
+
+    @classmethod
+    def from_config(cls, config: Any) -> list["ItemGroup"]:
+        """Default group and the groups from the ItemGroups option, ordered by priority"""
+        groups = []
+        for index, group in enumerate(config.item_groups):
+            name = str(index)
+            try:
+                name = str(group.get("name", index))
+                item_ids = [str(item_id) for item_id in group["items"] if str(item_id) != ""]
+                groups.append(
+                    cls(
+                        name,
+                        item_ids,
+                        Cron(group.get("cron")),
+                        int(group.get("sleep_time", config.sleep_time)),
+                        int(group.get("priority", 0)),
+                    )
+                )
+            except (AttributeError, KeyError, TypeError, ValueError) as err:
+                raise ConfigurationError(f"Invalid item group {name} - {err!r}") from err
+        grouped = {item_id for group in groups for item_id in group.item_ids}
+        default_ids = dict.fromkeys(config.item_ids + config.buy_item_ids)
+        groups.append(
+            cls(
+                "default",
+                [item_id for item_id in default_ids if item_id != "" and item_id not in grouped],
+                config.schedule_cron,
+                config.sleep_time,
+                favorites=True,
+            )
+        )
+        return sorted(groups, key=lambda group: -group.priority)
+
+    def due(self, now: float) -> bool:
+        return now >= self.next_fetch and self.cron.is_now
+
+    def fetched(self, now: float) -> None:
+        self.next_fetch = now + self.sleep_time * (0.9 + 0.2 * random())
@@ -1,13 +1,51 @@
 import logging
+import math
+import re
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Union
+from pathlib import Path
+from time import monotonic
+from typing import TYPE_CHECKING, Iterable, Sequence, Union
 
 import googlemaps
 
 from tgtg_scanner.errors import LocationConfigurationError
+from tgtg_scanner.models.location_cache import CACHE_SIZE, CACHE_TTL, LocationCache
+
+if TYPE_CHECKING:
+    from tgtg_scanner.models.metrics import Metrics
 
 log = logging.getLogger("tgtg")
 
+# max number of destinations per Distance Matrix request
+MAX_DESTINATIONS = 25
+TRAVEL_MODE_VARIABLE = re.compile(r"\${{(?:distance|duration)_(walking|driving|transit|biking)}}")
+PROVIDERS = ["google", "offline"]
+EARTH_RADIUS = 6371000.0
+# ratio of travel distance to great-circle distance
+DETOUR_FACTOR = 1.3
+# average speeds in km/h for offline estimates
+SPEEDS = {"walking": 5.0, "bicycling": 15.0, "transit": 20.0, "driving": 30.0}
+# seconds to use the offline estimate after the Google Maps quota was exceeded
+QUOTA_BACKOFF = 3600
+QUOTA_STATUSES = ("OVER_QUERY_LIMIT", "OVER_DAILY_LIMIT")
+
+Coordinates = tuple[float, float]
+
+
+def haversine(origin: Coordinates, destinations: Sequence[Coordinates]) -> list[float]:
+    """Great-circle distances in meters from the origin to all destinations"""
+    lat1 = math.radians(origin[0])
+    lon1 = math.radians(origin[1])
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat, lon in destinations:
+        lat2 = math.radians(lat)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin((math.radians(lon) - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a))))
+    return distances
+
 
 @dataclass
 class DistanceTime:
@@ -25,67 +63,258 @@ class Location:
     DRIVING_MODE = "driving"
     PUBLIC_TRANSPORT_MODE = "transit"
     BIKING_MODE = "bicycling"
+    # travel modes as used in item variables
+    MODES = {"walking": WALKING_MODE, "driving": DRIVING_MODE, "transit": PUBLIC_TRANSPORT_MODE, "biking": BIKING_MODE}
 
-    def __init__(self, enabled: bool = False, api_key: Union[str, None] = None, origin: Union[str, None] = None) -> None:
+    def __init__(
+        self,
+        enabled: bool = False,
+        api_key: Union[str, None] = None,
+        origin: Union[str, None] = None,
+        travel_modes: Iterable[str] = (),
+        cache_path: Union[str, Path, None] = None,
+        cache_ttl: int = CACHE_TTL,
+        cache_size: int = CACHE_SIZE,
+        metrics: Union["Metrics", None] = None,
+        provider: str = "google",
+        origin_coordinates: Union[Sequence[Union[str, float]], None] = None,
+        speeds: Union[dict[str, float], None] = None,
+    ) -> None:
         """
         Initializes Location class.
         First run flag important only for validating origin address.
+        travel_modes are resolved ahead of time for watched destinations.
+        Results are stored in a persistent cache if a cache_path is given.
+
+        The offline provider estimates distances and durations from the
+        origin_coordinates. With the google provider the estimate is used
+        when the Maps quota is exceeded and origin_coordinates are given.
         """
         self.enabled = enabled
         self.origin = origin
+        self.metrics = metrics
+        self.provider = provider
+        self.origin_coordinates: Union[Coordinates, None] = None
+        self.speeds = dict(SPEEDS)
+        self.cache_size = cache_size
+        self.cache: Union[LocationCache, None] = None
+        self._quota_exceeded_until = 0.0
         if enabled:
+            if provider not in PROVIDERS:
+                raise LocationConfigurationError(f"Invalid location provider {provider}")
+            try:
+                if origin_coordinates is not None:
+                    latitude, longitude = (float(value) for value in origin_coordinates)
+                    self.origin_coordinates = (latitude, longitude)
+                for mode, speed in (speeds or {}).items():
+                    self.speeds[self.MODES.get(mode, mode)] = float(speed)
+            except (TypeError, ValueError) as exc:
+                raise LocationConfigurationError(f"Invalid origin coordinates or speeds - {exc}") from exc
+            if provider == "offline" and self.origin_coordinates is None:
+                raise LocationConfigurationError("Offline location provider requires origin coordinates")
+        if enabled and provider == "google":
+            if cache_path is not None:
+                self.cache = LocationCache(cache_path, cache_ttl, cache_size)
             if api_key is None or self.origin is None:
                 raise LocationConfigurationError("Location enabled but no API key or origin address given")
             try:
-                self.gmaps = googlemaps.Client(key=api_key)
+                # fall back to the offline estimate instead of waiting for the quota
+                self.gmaps = googlemaps.Client(key=api_key, retry_over_query_limit=self.origin_coordinates is None)
                 if not self._is_address_valid(self.origin):
                     raise LocationConfigurationError("Invalid origin address")
             except (ValueError, googlemaps.exceptions.ApiError) as exc:
                 raise LocationConfigurationError(exc) from exc
 
-        # cached DistanceTime object for each item_id+mode
-        self.distancetime_dict: dict[str, DistanceTime] = {}
+        # recently used DistanceTime objects for each destination+mode, None for unreachable destinations
+        self.distancetime_dict: OrderedDict[str, Union[DistanceTime, None]] = OrderedDict()
+        self.travel_modes: set[str] = set(travel_modes)
+        # destinations with their coordinates that are resolved on the next prefetch
+        self.pending: dict[str, Union[Coordinates, None]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def used_travel_modes(text: str) -> set[str]:
+        """Travel modes of all distance and duration variables in the text"""
+        return set(TRAVEL_MODE_VARIABLE.findall(text))
+
+    def watch(self, destination: str, coordinates: Union[Coordinates, None] = None) -> None:
+        """Resolve the destination on the next prefetch"""
+        if self.enabled and self.travel_modes:
+            with self._lock:
+                self.pending[destination] = coordinates
+
+    def prefetch(self) -> None:
+        """Resolves all watched destinations for all known travel modes"""
+        if not self.enabled:
+            return
+        with self._lock:
+            destinations, self.pending = self.pending, {}
+            travel_modes = list(self.travel_modes)
+        if self.provider == "offline":
+            known = [(dest, coordinates) for dest, coordinates in destinations.items() if coordinates is not None]
+            for travel_mode in travel_modes:
+                estimates = self.estimate([coordinates for _, coordinates in known], travel_mode)
+                with self._lock:
+                    for (destination, _), estimate in zip(known, estimates):
+                        self._remember(self._key(destination, travel_mode), estimate)
+        elif not self.quota_exceeded:
+            self._resolve(destinations, travel_modes)
+
+    def estimate(self, destinations: Sequence[Coordinates], travel_mode: str) -> list[DistanceTime]:
+        """Offline estimates of the travel distance and duration to all destinations"""
+        if self.origin_coordinates is None:
+            return []
+        speed = self.speeds.get(self.MODES.get(travel_mode, travel_mode), SPEEDS["walking"]) / 3.6
+        return [
+            DistanceTime(distance * DETOUR_FACTOR, distance * DETOUR_FACTOR / speed, travel_mode)
+            for distance in haversine(self.origin_coordinates, destinations)
+        ]
 
-    def calculate_distance_time(self, destination: str, travel_mode: str) -> Union[DistanceTime, None]:
+    def cached_distance_time(
+        self, destination: str, travel_mode: str, coordinates: Union[Coordinates, None] = None
+    ) -> Union[DistanceTime, None]:
+        """Distance and time from the cache or the offline estimate. Never requests Google Maps."""
+        if not self.enabled:
+            return None
+        key = self._key(destination, travel_mode)
+        if self._cached(key, travel_mode):
+            with self._lock:
+                return self.distancetime_dict.get(key)
+        if coordinates is not None and self.origin_coordinates is not None:
+            return self.estimate([coordinates], travel_mode)[0]
+        return None
+
+    def calculate_distance_time(
+        self, destination: str, travel_mode: str, coordinates: Union[Coordinates, None] = None
+    ) -> Union[DistanceTime, None]:
         """
         Calculates the distance and time taken to travel from origin to
         destination using the given mode of transportation.
         Returns distance and time in km and minutes respectively.
+
+        Other watched destinations are resolved in the same request.
+        Coordinates of the destination are needed for offline estimates.
         """
         if not self.enabled:
             log.debug("Location service disabled")
             return None
 
-        key = f"{destination}_{travel_mode}"
-
+        key = self._key(destination, travel_mode)
         # use cached value if available
-        if key in self.distancetime_dict:
-            return self.distancetime_dict[key]
+        if self._cached(key, travel_mode):
+            self._observe("distance", "hit")
+            with self._lock:
+                return self.distancetime_dict.get(key)
+        self._observe("distance", "miss")
+        with self._lock:
+            self.travel_modes.add(travel_mode)
+            destinations = {destination: coordinates, **self.pending}
+        if self.provider == "offline":
+            if coordinates is None:
+                return None
+            estimate = self.estimate([coordinates], travel_mode)[0]
+            with self._lock:
+                self._remember(key, estimate)
+            return estimate
+        if not self.quota_exceeded:
+            self._resolve(destinations, [travel_mode])
+        with self._lock:
+            if key in self.distancetime_dict:
+                return self.distancetime_dict[key]
+        if self.quota_exceeded and coordinates is not None:
+            # not cached, so Google Maps is used again once the quota is reset
+            return self.estimate([coordinates], travel_mode)[0]
+        return None
 
-        if not self._is_address_valid(destination):
-            return None
+    @property
+    def quota_exceeded(self) -> bool:
+        """True while Google Maps requests are replaced by offline estimates"""
+        return self.origin_coordinates is not None and monotonic() < self._quota_exceeded_until
 
-        log.debug(f"Sending Google Maps API request: {destination} using {travel_mode} mode")
+    def _key(self, destination: str, travel_mode: str) -> str:
+        return LocationCache.key(self.origin or "", destination, self.MODES.get(travel_mode, travel_mode))
 
-        # calculate distance and time
-        directions = self.gmaps.directions(self.origin, destination, mode=travel_mode)
-        distance_time = DistanceTime(
-            float(directions[0]["legs"][0]["distance"]["value"]),
-            float(directions[0]["legs"][0]["duration"]["value"]),
-            travel_mode,
-        )
+    def _cached(self, key: str, travel_mode: str) -> bool:
+        """Looks up the key in memory and in the persistent cache"""
+        with self._lock:
+            if key in self.distancetime_dict:
+                self.distancetime_dict.move_to_end(key)
+                return True
+        if self.cache is None:
+            return False
+        row = self.cache.get(key)
+        if row is None:
+            return False
+        distance, duration = row
+        with self._lock:
+            self._remember(key, None if distance is None or duration is None else DistanceTime(distance, duration, travel_mode))
+        return True
 
-        # cache value
+    def _remember(self, key: str, distance_time: Union[DistanceTime, None]) -> None:
+        """Stores a result in memory. The caller holds the lock."""
         self.distancetime_dict[key] = distance_time
+        self.distancetime_dict.move_to_end(key)
+        while len(self.distancetime_dict) > self.cache_size:
+            self.distancetime_dict.popitem(last=False)
 
-        return distance_time
+    def _observe(self, kind: str, result: str) -> None:
+        if self.metrics is not None:
+            self.metrics.location_cache_requests.labels(kind, result).inc()
+
+    def _resolve(self, destinations: Iterable[str], travel_modes: Iterable[str]) -> None:
+        """Fills the cache with Distance Matrix requests of up to MAX_DESTINATIONS destinations.
+        Requests are sent without holding the lock, so cache lookups of other threads do not wait for them."""
+        for travel_mode in travel_modes:
+            missing = sorted(dest for dest in destinations if not self._cached(self._key(dest, travel_mode), travel_mode))
+            for start in range(0, len(missing), MAX_DESTINATIONS):
+                batch = missing[start : start + MAX_DESTINATIONS]  # noqa: E203
+                log.debug("Sending Google Maps API request: %s destinations using %s mode", len(batch), travel_mode)
+                try:
+                    matrix = self.gmaps.distance_matrix([self.origin], batch, mode=self.MODES.get(travel_mode, travel_mode))
+                except googlemaps.exceptions.ApiError as exc:
+                    log.warning("Google Maps API request failed - %s", exc)
+                    if exc.status in QUOTA_STATUSES and self.origin_coordinates is not None:
+                        log.warning("Using offline distance estimates for %s minutes", QUOTA_BACKOFF // 60)
+                        self._quota_exceeded_until = monotonic() + QUOTA_BACKOFF
+                    return
+                except googlemaps.exceptions.TransportError as exc:
+                    log.warning("Google Maps API request failed - %s", exc)
+                    return
+                except googlemaps.exceptions.Timeout:
+                    log.warning("Google Maps API request timed out")
+                    return
+                results: dict[str, Union[DistanceTime, None]] = {}
+                for destination, element in zip(batch, matrix["rows"][0]["elements"]):
+                    distance_time = None
+                    if element.get("status") == "OK":
+                        distance_time = DistanceTime(
+                            float(element["distance"]["value"]), float(element["duration"]["value"]), travel_mode
+                        )
+                    else:
+                        log.debug("No route to %s using %s mode: %s", destination, travel_mode, element.get("status"))
+                    results[self._key(destination, travel_mode)] = distance_time
+                with self._lock:
+                    for key, distance_time in results.items():
+                        self._remember(key, distance_time)
+                entries: dict[str, tuple[Union[float, None], Union[float, None]]] = {
+                    key: (None, None) if result is None else (result.distance, result.duration) for key, result in results.items()
+                }
+                if self.cache is not None:
+                    self.cache.set(entries)
 
     def _is_address_valid(self, address: str) -> bool:
         """
         Checks if the given address is valid using the
         Google Maps Geocoding API.
         """
-        if len(self.gmaps.geocode(address)) == 0:
+        if self.cache is not None:
+            valid = self.cache.get_geocode(address)
+            self._observe("geocode", "miss" if valid is None else "hit")
+            if valid is not None:
+                return valid
+        valid = len(self.gmaps.geocode(address)) > 0
+        if self.cache is not None:
+            self.cache.set_geocode(address, valid)
+        if not valid:
             log.debug(f"Invalid address: {address}")
-            return False
-        return True
+        return valid
@@ -0,0 +1,103 @@
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from time import time
+from typing import Union
+
+log = logging.getLogger("tgtg")
+
+CACHE_TTL = 30 * 24 * 3600
+CACHE_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS distance (
+    key TEXT PRIMARY KEY,
+    distance REAL,
+    duration REAL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS distance_used ON distance (used);
+CREATE TABLE IF NOT EXISTS geocode (
+    address TEXT PRIMARY KEY,
+    valid INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+def normalize(text: str) -> str:
+    """Cache key for an address or travel mode"""
+    return " ".join(text.split()).casefold()
+
+
+class LocationCache:
+    """
+    Persistent SQLite cache for Google Maps results.
+
+    Stores distance and duration per (origin, destination, travel mode) and
+    the validity of geocoded addresses. Entries expire after ttl seconds.
+    The least recently used distances are removed when more than size
+    entries are stored. Unreachable destinations are stored without values.
+    """
+
+    def __init__(self, path: Union[str, Path], ttl: int = CACHE_TTL, size: int = CACHE_SIZE) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.size = size
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        with self._lock, self._db:
+            expired = time() - self.ttl
+            self._db.execute("DELETE FROM distance WHERE created < ?", (expired,))
+            self._db.execute("DELETE FROM geocode WHERE created < ?", (expired,))
+
+    @staticmethod
+    def key(origin: str, destination: str, travel_mode: str) -> str:
+        return "\n".join(normalize(text) for text in (origin, destination, travel_mode))
+
+    def get(self, key: str) -> Union[tuple[Union[float, None], Union[float, None]], None]:
+        """Returns (distance, duration) or None if the key is not cached"""
+        now = time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT distance, duration FROM distance WHERE key = ? AND created >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE distance SET used = ? WHERE key = ?", (now, key))
+        return row
+
+    def set(self, entries: dict[str, tuple[Union[float, None], Union[float, None]]]) -> None:
+        """Stores (distance, duration) tuples and evicts the least recently used entries"""
+        now = time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO distance (key, distance, duration, created, used) VALUES (?, ?, ?, ?, ?)",
+                [(key, distance, duration, now, now) for key, (distance, duration) in entries.items()],
+            )
+            self._db.execute(
+                "DELETE FROM distance WHERE key IN (SELECT key FROM distance ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.size,),
+            )
+
+    def get_geocode(self, address: str) -> Union[bool, None]:
+        """Returns the cached validity of the address or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT valid FROM geocode WHERE address = ? AND created >= ?", (normalize(address), time() - self.ttl)
+            ).fetchone()
+        return None if row is None else bool(row[0])
+
+    def set_geocode(self, address: str, valid: bool) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode (address, valid, created) VALUES (?, ?, ?)",
+                (normalize(address), int(valid), time()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -1,46 +1,250 @@
 import logging
+from datetime import datetime
+from socketserver import ThreadingMixIn
+from threading import Thread
+from time import monotonic
+from typing import Any, Iterable, Union
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
 
-from prometheus_client import Counter, Gauge, start_http_server
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    Info,
+    make_wsgi_app,
+    start_http_server,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
 
 from tgtg_scanner.models.item import Item
+from tgtg_scanner.models.state import StateApp, StateStore
 
 log = logging.getLogger("tgtg")
 
+# address of the metrics server, all interfaces like start_http_server
+METRICS_ADDR = "0.0.0.0"
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI server handling each request in a thread, so long polls do not block scrapes"""
+
+    daemon_threads = True
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler without access logs"""
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class RuntimeCollector(Collector):
+    """
+    Reads the state of the TGTG client and the notifiers on every scrape.
+    """
+
+    def __init__(self) -> None:
+        self.client: Any = None
+        self.notifiers: list[Any] = []
+
+    def describe(self) -> list[Metric]:
+        return []
+
+    def collect(self) -> Iterable[Metric]:
+        if self.client is not None:
+            errors = CounterMetricFamily(
+                "tgtg_api_errors", "Count of failed TGTG API requests by endpoint and status", labels=["endpoint", "status"]
+            )
+            for (endpoint, status), count in list(self.client.api_errors.items()):
+                errors.add_metric([endpoint, str(status)], count)
+            yield errors
+            yield CounterMetricFamily(
+                "tgtg_token_refreshes", "Count of TGTG access token refreshes", value=self.client.token_refresh_count
+            )
+            if self.client.last_time_token_refreshed is not None:
+                age = (datetime.now() - self.client.last_time_token_refreshed).total_seconds()
+                yield GaugeMetricFamily("tgtg_token_age_seconds", "Age of the TGTG access token", value=age)
+        alive = GaugeMetricFamily("tgtg_notifier_alive", "1 if the notifier is running", labels=["notifier"])
+        for notifier in self.notifiers:
+            alive.add_metric([notifier.name], float(notifier.is_alive))
+        yield alive
+
 
 class Metrics:
     """
     Provides a prometheus metrics client.
+
+    Item series are labeled by item_id only. The display name is exported
+    in the tgtg_item_info metric if item_info is enabled. Series of at most
+    max_items items are kept, series of removed items are deleted.
+
+    Process metrics like the resident memory are exported by the default registry.
     """
 
-    def __init__(self, port: int = 8000):
+    def __init__(
+        self,
+        port: int = 8000,
+        max_items: int = 1000,
+        item_info: bool = True,
+        registry: CollectorRegistry = REGISTRY,
+    ):
         self.port = port
-        self.item_count = Gauge("tgtg_item_count", "Currently available Magic Bags", ["item_id", "display_name"])
-        self.item_price = Gauge("tgtg_item_price", "Price for a Magic Bag", ["item_id", "display_name"])
-        self.item_value = Gauge("tgtg_item_value", "Value for a Magic Bag", ["item_id", "display_name"])
+        self.max_items = max_items
+        self.item_info = item_info
+        self.registry = registry
+        # item ids with exported series
+        self.items: set[str] = set()
+        self.item_count = Gauge("tgtg_item_count", "Currently available Magic Bags", ["item_id"], registry=registry)
+        self.item_price = Gauge("tgtg_item_price", "Price for a Magic Bag", ["item_id"], registry=registry)
+        self.item_value = Gauge("tgtg_item_value", "Value for a Magic Bag", ["item_id"], registry=registry)
+        self.item = Info("tgtg_item", "Display name of a Magic Bag", ["item_id"], registry=registry)
+        self._last_success = monotonic()
+        self.seconds_since_success = Gauge(
+            "tgtg_scan_seconds_since_success",
+            "Seconds since the last successful scan cycle",
+            registry=registry,
+        )
+        self.seconds_since_success.set_function(lambda: monotonic() - self._last_success)
+        self.consecutive_errors = Gauge(
+            "tgtg_scan_consecutive_errors",
+            "Count of failed scan cycles since the last successful one",
+            registry=registry,
+        )
+        self.runtime = RuntimeCollector()
+        registry.register(self.runtime)
         self.get_favorites_errors = Counter(
             "tgtg_get_favorites_errors",
             "Count of request errors fetching tgtg favorites",
+            registry=registry,
         )
         self.send_notifications = Counter(
             "tgtg_send_notifications",
             "Count of send notifications",
-            ["item_id", "display_name"],
+            ["item_id"],
+            registry=registry,
+        )
+        self.notification_fanout = Histogram(
+            "tgtg_notification_fanout_seconds",
+            "Time until a notification reached all recipients of a notifier",
+            ["notifier"],
+            registry=registry,
+        )
+        self.notifier_send_duration = Histogram(
+            "tgtg_notifier_send_seconds",
+            "Time spent sending one notification",
+            ["notifier"],
+            registry=registry,
+        )
+        self.notifier_queue_depth = Gauge(
+            "tgtg_notifier_queue_depth",
+            "Notifications waiting in the queue of a notifier",
+            ["notifier"],
+            registry=registry,
+        )
+        self.notifier_dropped = Counter(
+            "tgtg_notifier_dropped",
+            "Count of notifications dropped by a full notifier queue",
+            ["notifier", "reason"],
+            registry=registry,
+        )
+        self.notifier_failures = Counter(
+            "tgtg_notifier_failures",
+            "Count of failed attempts to send a notification",
+            ["notifier"],
+            registry=registry,
+        )
+        self.webhook_request_duration = Histogram(
+            "tgtg_webhook_request_seconds",
+            "Duration of webhook requests per endpoint",
+            ["notifier", "endpoint"],
+            registry=registry,
+        )
+        self.webhook_retries = Counter(
+            "tgtg_webhook_retries",
+            "Count of retried webhook requests per endpoint",
+            ["notifier", "endpoint"],
+            registry=registry,
+        )
+        self.script_duration = Histogram(
+            "tgtg_script_seconds",
+            "Run time of script notifier commands",
+            registry=registry,
+        )
+        self.script_exit_codes = Counter(
+            "tgtg_script_exit_codes",
+            "Count of finished script notifier commands by exit code",
+            ["exit_code"],
+            registry=registry,
+        )
+        self.location_cache_requests = Counter(
+            "tgtg_location_cache_requests",
+            "Count of distance and geocode lookups by cache result",
+            ["kind", "result"],
+            registry=registry,
         )
 
-    def enable_metrics(self) -> None:
+    def enable_metrics(self, state: Union[StateStore, None] = None) -> None:
         """
-        Start the metrics http server.
+        Start the metrics http server. Serves the JSON state api on /state if state is given.
         """
-        start_http_server(self.port)
+        if state is None:
+            start_http_server(self.port, METRICS_ADDR)
+        else:
+            app = StateApp(state, make_wsgi_app(self.registry))
+            server = make_server(METRICS_ADDR, self.port, app, ThreadingWSGIServer, handler_class=QuietRequestHandler)
+            Thread(target=server.serve_forever, name="metrics", daemon=True).start()
         log.info("Metrics server startet on port %s", self.port)
 
     def update(self, item: Item) -> None:
         """
         Update the metrics.
         """
+        if item.item_id not in self.items:
+            if len(self.items) >= self.max_items:
+                log.debug("Metrics limit of %s items reached - skipping %s", self.max_items, item.item_id)
+                return
+            self.items.add(item.item_id)
         try:
-            self.item_count.labels(item.item_id, item.display_name).set(item.items_available)
-            self.item_price.labels(item.item_id, item.display_name).set(item._price)
-            self.item_value.labels(item.item_id, item.display_name).set(item._value)
+            self.item_count.labels(item.item_id).set(item.items_available)
+            self.item_price.labels(item.item_id).set(item._price)
+            self.item_value.labels(item.item_id).set(item._value)
+            if self.item_info:
+                self.item.labels(item.item_id).info({"display_name": item.display_name})
         except ValueError as err:
             log.warning("Error updating metrics: %s", err)
+
+    def scan_succeeded(self) -> None:
+        """
+        Record a successful scan cycle.
+        """
+        self._last_success = monotonic()
+        self.consecutive_errors.set(0)
+
+    def scan_failed(self) -> None:
+        """
+        Record a failed scan cycle.
+        """
+        self.consecutive_errors.inc()
+
+    def count_notification(self, item: Item) -> None:
+        """
+        Count a notification for the item.
+        """
+        if item.item_id in self.items:
+            self.send_notifications.labels(item.item_id).inc()
+
+    def retain(self, item_ids: Iterable[str]) -> None:
+        """
+        Remove the series of all items that are not in item_ids.
+        """
+        keep = set(item_ids)
+        for item_id in self.items - keep:
+            for metric in (self.item_count, self.item_price, self.item_value, self.item, self.send_notifications):
+                try:
+                    metric.remove(item_id)
+                except KeyError:
+                    pass
+        self.items &= keep
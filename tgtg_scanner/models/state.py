@@ -0,0 +1,209 @@
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator, Union
+from urllib.parse import parse_qs
+
+from tgtg_scanner.models.item import Item
+
+log = logging.getLogger("tgtg")
+
+# default and max seconds a ?since= request waits for changes
+LONG_POLL_TIMEOUT = 30
+LONG_POLL_MAX_TIMEOUT = 120
+# number of stock change events kept for reconnecting event stream clients
+EVENT_BUFFER_SIZE = 1000
+# seconds between keepalive comments on idle event streams
+EVENT_KEEPALIVE = 15
+
+StartResponse = Callable[[str, list[tuple[str, str]]], Any]
+WSGIApp = Callable[[dict, StartResponse], Iterable[bytes]]
+
+
+class StateStore:
+    """
+    Versioned copy of the scanner state.
+
+    Every new item, changed amount and removed item increments the version.
+    Each item remembers the version of its last change, so clients can
+    request only the items that changed since a version they know.
+    The last events_size changes are kept as events with the version as id.
+    """
+
+    def __init__(self, events_size: int = EVENT_BUFFER_SIZE) -> None:
+        self.version = 0
+        self._items: dict[str, tuple[int, Item]] = {}
+        # versions of removed items
+        self._removed: dict[str, int] = {}
+        self._events: deque[tuple[int, dict]] = deque(maxlen=events_size)
+        self._changed = threading.Condition()
+
+    def _add_event(self, item_id: str, old: Union[int, None], new: Union[int, None]) -> None:
+        self._events.append(
+            (
+                self.version,
+                {
+                    "item_id": item_id,
+                    "old": old,
+                    "new": new,
+                    "timestamp": datetime.now().astimezone().isoformat(timespec="seconds"),
+                },
+            )
+        )
+
+    def update(self, item: Item) -> None:
+        with self._changed:
+            entry = self._items.get(item.item_id)
+            self.version += 1
+            self._items[item.item_id] = (self.version, item)
+            self._removed.pop(item.item_id, None)
+            self._add_event(item.item_id, None if entry is None else entry[1].items_available, item.items_available)
+            self._changed.notify_all()
+
+    def remove(self, item_id: str) -> None:
+        with self._changed:
+            entry = self._items.pop(item_id, None)
+            if entry is None:
+                return
+            self.version += 1
+            self._removed[item_id] = self.version
+            self._add_event(item_id, entry[1].items_available, None)
+            self._changed.notify_all()
+
+    @staticmethod
+    def item_dict(version: int, item: Item) -> dict:
+        return {
+            "item_id": item.item_id,
+            "display_name": item.display_name,
+            "items_available": item.items_available,
+            "price": item._price,
+            "value": item._value,
+            "currency": item.currency,
+            "pickup_interval_start": item.pickup_interval_start,
+            "pickup_interval_end": item.pickup_interval_end,
+            "pickup_location": item.pickup_location,
+            "link": item.link,
+            "scanned_on": item.scanned_on,
+            "version": version,
+        }
+
+    def get(self, item_id: str) -> Union[dict, None]:
+        with self._changed:
+            entry = self._items.get(item_id)
+        return None if entry is None else self.item_dict(*entry)
+
+    def snapshot(self) -> dict:
+        with self._changed:
+            return {
+                "version": self.version,
+                "items": {item_id: self.item_dict(*entry) for item_id, entry in self._items.items()},
+            }
+
+    def changes(self, since: int, timeout: float = 0) -> dict:
+        """
+        Items changed and removed after the version since. Waits up to
+        timeout seconds for a change if there is none yet. A version newer
+        than the current one, e.g. from before a restart, returns all items.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != since, timeout)
+            if since > self.version:
+                since = 0
+            return {
+                "version": self.version,
+                "items": {
+                    item_id: self.item_dict(version, item) for item_id, (version, item) in self._items.items() if version > since
+                },
+                "removed": [item_id for item_id, version in self._removed.items() if version > since],
+            }
+
+    def events(self, since: int, timeout: float = 0) -> tuple[int, list[tuple[int, dict]]]:
+        """
+        Returns the current version and the buffered events after the
+        version since. Waits up to timeout seconds for a change if there is
+        none yet. A version newer than the current one replays all events.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != since, timeout)
+            if since > self.version:
+                since = 0
+            return self.version, [event for event in self._events if event[0] > since]
+
+
+class StateApp:
+    """
+    WSGI app serving the state as JSON.
+
+    GET /state returns all items, /state?since=<version> waits for changes
+    after the version and returns only the changed items. GET /state/<item_id>
+    returns a single item. Responses carry an ETag and answer a matching
+    If-None-Match header with 304. GET /events streams stock changes as
+    server-sent events, resuming after the Last-Event-ID header if given.
+    All other paths are passed to fallback, e.g. the Prometheus metrics app.
+    """
+
+    def __init__(self, store: StateStore, fallback: WSGIApp) -> None:
+        self.store = store
+        self.fallback = fallback
+
+    def __call__(self, environ: dict, start_response: StartResponse) -> Iterable[bytes]:
+        path = environ.get("PATH_INFO", "").rstrip("/")
+        if path not in ("/state", "/events") and not path.startswith("/state/"):
+            return self.fallback(environ, start_response)
+        if environ.get("REQUEST_METHOD", "GET") != "GET":
+            return self._respond(start_response, "405 Method Not Allowed", {"error": "method not allowed"})
+        if path == "/events":
+            try:
+                since = int(environ.get("HTTP_LAST_EVENT_ID") or self.store.version)
+            except ValueError:
+                return self._respond(start_response, "400 Bad Request", {"error": "invalid Last-Event-ID"})
+            start_response(
+                "200 OK", [("Content-Type", "text/event-stream"), ("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")]
+            )
+            return self._stream(since)
+        if path == "/state":
+            query = parse_qs(environ.get("QUERY_STRING", ""))
+            if "since" not in query:
+                data = self.store.snapshot()
+                return self._respond(start_response, "200 OK", data, f'"{data["version"]}"', environ)
+            try:
+                since = int(query["since"][0])
+                timeout = min(float(query.get("timeout", [LONG_POLL_TIMEOUT])[0]), LONG_POLL_MAX_TIMEOUT)
+            except ValueError:
+                return self._respond(start_response, "400 Bad Request", {"error": "invalid since or timeout"})
+            data = self.store.changes(since, max(timeout, 0))
+            return self._respond(start_response, "200 OK", data, f'"{data["version"]}"')
+        item = self.store.get(path.removeprefix("/state/"))
+        if item is None:
+            return self._respond(start_response, "404 Not Found", {"error": "unknown item"})
+        return self._respond(start_response, "200 OK", item, f'"{item["item_id"]}-{item["version"]}"', environ)
+
+    def _stream(self, since: int) -> Iterator[bytes]:
+        yield b"retry: 5000\n\n"
+        while True:
+            since, events = self.store.events(since, EVENT_KEEPALIVE)
+            if not events:
+                yield b": keepalive\n\n"
+            for event_id, data in events:
+                yield f"id: {event_id}\nevent: stock\ndata: {json.dumps(data)}\n\n".encode()
+
+    @staticmethod
+    def _respond(
+        start_response: StartResponse,
+        status: str,
+        data: dict,
+        etag: Union[str, None] = None,
+        environ: Union[dict, None] = None,
+    ) -> Iterable[bytes]:
+        headers = [("Cache-Control", "no-cache")]
+        if etag is not None:
+            headers.append(("ETag", etag))
+            if environ is not None and etag in (tag.strip() for tag in environ.get("HTTP_IF_NONE_MATCH", "").split(",")):
+                start_response("304 Not Modified", headers)
+                return [b""]
+        body = json.dumps(data).encode()
+        headers += [("Content-Type", "application/json"), ("Content-Length", str(len(body)))]
+        start_response(status, headers)
+        return [body]
@@ -0,0 +1,145 @@
+import json
+import re
+from typing import Any, Callable, Union
+
+from tgtg_scanner.errors import MaskConfigurationError
+from tgtg_scanner.models.item import ATTRS, Item
+
+try:
+    import orjson
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value)
+
+except ImportError:  # pragma: no cover
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+VARIABLE = re.compile(r"\${{([a-zA-Z0-9_]+)}}")
+NUMBER = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?")
+# marks a variable that is not enclosed in quotes in a JSON template
+BARE = "\x00"
+
+
+class Template:
+    """
+    Text with item variables, parsed once.
+
+    Rendering joins the literal parts with the item values
+    instead of searching the text for variables on every call.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.parts: list[tuple[bool, str]] = []
+        position = 0
+        for match in VARIABLE.finditer(text):
+            if match.group(1) not in ATTRS:
+                raise MaskConfigurationError(match.group(0))
+            if match.start() > position:
+                self.parts.append((False, text[position : match.start()]))
+            self.parts.append((True, match.group(1)))
+            position = match.end()
+        if position < len(text):
+            self.parts.append((False, text[position:]))
+
+    @property
+    def variables(self) -> list[str]:
+        """Names of the variables used in the template"""
+        return [value for is_variable, value in self.parts if is_variable]
+
+    def values(self, item: Item) -> dict[str, Any]:
+        """Values of all variables for the item"""
+        return {name: getattr(item, name) for name in self.variables}
+
+    def render(self, item: Union[Item, dict[str, Any]]) -> str:
+        """Replaces the variables with the item values"""
+        values = item if isinstance(item, dict) else self.values(item)
+        return "".join(str(values[value]) if is_variable else value for is_variable, value in self.parts)
+
+    def __repr__(self) -> str:
+        return f"Template({self.text!r})"
+
+
+class JsonTemplate:
+    """
+    JSON document with item variables, parsed once.
+
+    Variables inside JSON strings are inserted as text and escaped by the encoder.
+    Variables outside of strings, e.g. ``{"amount": ${{items_available}}}``, are
+    inserted as typed values: numbers stay numbers, everything else becomes a string.
+    Rendering serializes the tree directly to bytes, using orjson if it is installed.
+
+    Raises ValueError if the template is not valid JSON.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.variables: set[str] = set()
+        tree = json.loads(self._quote_bare_variables(text), strict=False)
+        self._render = self._compile(tree)
+
+    def _quote_bare_variables(self, text: str) -> str:
+        """Encloses variables outside of JSON strings in quotes, so the template can be parsed"""
+        result = []
+        position = 0
+        in_string = False
+        escaped = False
+        while position < len(text):
+            char = text[position]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            else:
+                match = VARIABLE.match(text, position)
+                if match:
+                    result.append(f'"{BARE}{match.group(0)}"')
+                    position = match.end()
+                    continue
+            result.append(char)
+            position += 1
+        return "".join(result)
+
+    def _compile(self, node: Any) -> Callable[[Item], Any]:
+        if isinstance(node, dict):
+            entries = [(self._compile(key), self._compile(value)) for key, value in node.items()]
+            return lambda item: {str(key(item)): value(item) for key, value in entries}
+        if isinstance(node, list):
+            values = [self._compile(value) for value in node]
+            return lambda item: [value(item) for value in values]
+        if isinstance(node, str):
+            if node.startswith(BARE):
+                template = Template(node[len(BARE) :])
+                self.variables.update(template.variables)
+                name = template.variables[0]
+                return lambda item: self._typed(getattr(item, name))
+            template = Template(node)
+            if not template.variables:
+                return lambda item: node
+            self.variables.update(template.variables)
+            return template.render
+        return lambda item: node
+
+    @staticmethod
+    def _typed(value: Any) -> Any:
+        if isinstance(value, (bool, int, float)) or value is None:
+            return value
+        value = str(value)
+        if NUMBER.fullmatch(value):
+            return json.loads(value)
+        return value
+
+    def render(self, item: Item) -> bytes:
+        """Renders the template as UTF-8 encoded JSON"""
+        return dumps(self._render(item))
+
+    def __repr__(self) -> str:
+        return f"JsonTemplate({self.text!r})"
@@ -1,57 +1,135 @@
 import logging
+import re
+from collections import OrderedDict
 from typing import Union
 
 import apprise
 
-from tgtg_scanner.errors import AppriseConfigurationError, MaskConfigurationError
+from tgtg_scanner.errors import (
+    AppriseConfigurationError,
+    MaskConfigurationError,
+    NotificationError,
+)
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
+from tgtg_scanner.models.digest import Digest
 from tgtg_scanner.models.reservations import Reservation
+from tgtg_scanner.models.template import Template
 from tgtg_scanner.notifiers.base import Notifier
 
 log = logging.getLogger("tgtg")
 
+# max number of prepared Apprise objects for URLs with item variables
+URL_CACHE_SIZE = 32
+# optional tags in front of a URL, e.g. "family,mobile=ntfy://topic"
+TAGGED_URL = re.compile(r"^([\w,-]+)=(\S+://\S*)$")
+
 
 class Apprise(Notifier):
     """
     Notifier for Apprise. \n
     For more information on Apprise visit\n
     https://github.com/caronc/apprise
+
+    The Apprise object is built once. Apprise sends to several
+    targets in parallel. URLs with item variables are prepared per
+    item and kept in a small LRU cache.
     """
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.apprise)
         self.enabled = config.apprise.enabled
         self.title = config.apprise.title
         self.body = config.apprise.body
         self.url = config.apprise.url
+        self.tags = config.apprise.tags
         self.cron = config.apprise.cron
+        self.targets: list[tuple[Template, list[str]]] = []
+        self._apobj: Union[apprise.Apprise, None] = None
+        self._cache: OrderedDict[tuple[str, ...], apprise.Apprise] = OrderedDict()
         if self.enabled:
             if self.url is None or self.body is None or self.title is None:
                 raise AppriseConfigurationError()
             try:
-                Item.check_mask(self.title)
-                Item.check_mask(self.body)
-                Item.check_mask(self.url)
+                self._title = Template(self.title)
+                self._body = Template(self.body)
+                self.targets = self._parse_urls(self.url)
+                Digest.check_mask(self.digest_header, self.digest_row, self.digest_footer)
             except MaskConfigurationError as exc:
                 raise AppriseConfigurationError(exc.message) from exc
+            if not self.targets:
+                raise AppriseConfigurationError()
+            if not any(url.variables for url, _ in self.targets):
+                self._apobj = self._create([url.text for url, _ in self.targets])
+
+    @staticmethod
+    def _parse_urls(text: str) -> list[tuple[Template, list[str]]]:
+        """Splits the whitespace separated URL option into URL templates with their tags"""
+        targets = []
+        for entry in text.split():
+            tags: list[str] = []
+            match = TAGGED_URL.match(entry)
+            if match:
+                tags = [tag for tag in match.group(1).split(",") if tag]
+                entry = match.group(2)
+            targets.append((Template(entry), tags))
+        return targets
+
+    def _create(self, urls: list[str]) -> apprise.Apprise:
+        apobj = apprise.Apprise()
+        for url, (_, tags) in zip(urls, self.targets):
+            if not apobj.add(url, tag=tags or None):
+                raise AppriseConfigurationError(f"Invalid Apprise URL {url}")
+        return apobj
+
+    def _apprise(self, item: Item) -> apprise.Apprise:
+        """Apprise object for the item. Only URLs with item variables are prepared per item."""
+        if self._apobj is not None:
+            return self._apobj
+        urls = tuple(url.render(item) for url, _ in self.targets)
+        log.debug("Apprise urls: %s", urls)
+        apobj = self._cache.get(urls)
+        if apobj is None:
+            apobj = self._create(list(urls))
+            self._cache[urls] = apobj
+            if len(self._cache) > URL_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(urls)
+        return apobj
+
+    def _notify(self, apobj: apprise.Apprise, title: str, body: str) -> None:
+        log.debug("Apprise title: %s", title)
+        log.debug("Apprise body: %s", body)
+        if self.tags:
+            result = apobj.notify(title=title, body=body, tag=self.tags)
+        else:
+            result = apobj.notify(title=title, body=body)
+        if result is None:
+            log.warning("No Apprise URL matches the tags %s", self.tags)
+        elif not result:
+            # retrying would send duplicates to the targets that succeeded
+            if len(apobj) == 1:
+                raise NotificationError("Apprise notification failed")
+            log.error("Apprise notification failed for some targets")
 
     def _send(self, item: Union[Item, Reservation]) -> None:
-        """Sends item information via configured Apprise URL"""
+        """Sends item information via configured Apprise URLs"""
         if isinstance(item, Item):
-            if self.url is None or self.body is None or self.title is None:
+            if not self.targets:
                 raise AppriseConfigurationError()
-            url = item.unmask(self.url)
-            title = item.unmask(self.title)
-            body = item.unmask(self.body)
-
-            log.debug("Apprise url: %s", url)
-            log.debug("Apprise title: %s", title)
-            log.debug("Apprise body: %s", body)
-
-            apobj = apprise.Apprise()
-            apobj.add(self.url)
-            apobj.notify(title=title, body=body)
-            apobj.clear()
+            self._notify(self._apprise(item), self._title.render(item), self._body.render(item))
+
+    def _send_digest(self, digest: Digest) -> None:
+        """Sends several items as one notification. Title and url are taken from the first item."""
+        if not self.targets:
+            raise AppriseConfigurationError()
+        first = digest.items[0]
+        body = digest.unmask(self.digest_header, self.digest_row, self.digest_footer)
+        self._notify(self._apprise(first), self._title.render(first), body)
+
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        return [self.title, self.body, self.url, *super().templates]
 
     def __repr__(self) -> str:
         return f"Apprise: {self.url}"
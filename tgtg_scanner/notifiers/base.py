@@ -1,11 +1,13 @@
 import logging
-import threading
 from abc import ABC, abstractmethod
-from queue import Queue
 from typing import Union
 
-from tgtg_scanner.models import Config, Cron, Favorites, Item, Reservations
+from tgtg_scanner.models import Config, Cron, Favorites, Item, Metrics, Reservations
+from tgtg_scanner.models.config import NotifierConfig
+from tgtg_scanner.models.digest import Digest
+from tgtg_scanner.models.distance_filter import DistanceFilter
 from tgtg_scanner.models.reservations import Reservation
+from tgtg_scanner.notifiers.dispatcher import Dispatcher, get_dispatcher
 
 log = logging.getLogger("tgtg")
 
@@ -14,40 +16,62 @@ class Notifier(ABC):
     """Base Notifier"""
 
     @abstractmethod
-    def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
+    def __init__(
+        self,
+        config: Config,
+        reservations: Reservations,
+        favorites: Favorites,
+        section: Union[NotifierConfig, None] = None,
+    ):
         self.config = config
         self.enabled = False
         self.reservations = reservations
         self.favorites = favorites
         self.cron = Cron()
-        self.thread = threading.Thread(target=self._run)
-        self.queue: Queue[Union[Item, Reservation, None]] = Queue()
+        self.metrics: Union[Metrics, None] = None
+        self.dispatcher: Dispatcher = get_dispatcher()
+        # max number of notifications this notifier sends at the same time
+        self.concurrency = 1
+        # max number of queued notifications and what to do when the queue is full
+        self.queue_size = 100
+        self.queue_policy = "drop_oldest"
+        # items known to be farther away are not notified
+        self.distance_filter = DistanceFilter()
+        # items detected within digest_window milliseconds after a notification are sent as one digest
+        self.digest_window = 0
+        self.digest_header = ""
+        self.digest_row = ""
+        self.digest_footer = ""
+        # options shared by all notifiers from the config section of the notifier
+        if section is not None:
+            self.queue_size = section.queue_size
+            self.queue_policy = section.queue_policy
+            self.distance_filter = DistanceFilter.from_config(section)
+            self.digest_window = section.digest_window
+            self.digest_header = section.digest_header
+            self.digest_row = section.digest_row
+            self.digest_footer = section.digest_footer
 
     @property
     def name(self):
         """Get notifier name"""
         return self.__class__.__name__
 
-    def _run(self) -> None:
-        """Run notifier"""
-        self.config.set_locale()
-        while True:
-            try:
-                item = self.queue.get()
-                if item is None:
-                    break
-                log.debug("Sending %s Notification", self.name)
-                self._send(item)
-            except KeyboardInterrupt:
-                pass
-            except Exception as exc:
-                log.error("Failed sending %s: %s", self.name, exc)
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        """Texts with item variables, e.g. to find the used travel modes"""
+        return [self.digest_header, self.digest_row, self.digest_footer]
+
+    @property
+    def is_alive(self) -> bool:
+        """True if the notifier is running on the dispatcher"""
+        return self.dispatcher.is_running(self)
 
     def start(self) -> None:
-        """Run notifier in thread"""
+        """Register notifier on the dispatcher"""
         if self.enabled:
-            log.debug("Starting %s Notifier thread", self.name)
-            self.thread.start()
+            log.debug("Starting %s Notifier", self.name)
+            self.dispatcher.register(self)
 
     def send(self, item: Union[Item, Reservation]) -> None:
         """Send notification"""
@@ -55,24 +79,39 @@ class Notifier(ABC):
             log.error("Invalid item type: %s", type(item))
             return
         if self.enabled and self.cron.is_now:
-            self.queue.put(item)
-            if not self.thread.is_alive():
-                log.debug("%s Notifier thread is dead. Restarting", self.name)
-                self.thread = threading.Thread(target=self._run)
+            if isinstance(item, Item) and not self.distance_filter.accepts(item):
+                log.debug("%s Notifier skips %s - too far away", self.name, item.display_name)
+                return
+            if not self.is_alive:
+                log.debug("%s Notifier is not running. Restarting", self.name)
+                self.dispatcher.unregister(self)
                 self.start()
+            self.dispatcher.submit(self, item)
+
+    async def _astart(self) -> None:
+        """Set up the notifier on the dispatcher event loop"""
+        pass
+
+    async def _astop(self) -> None:
+        """Tear down the notifier on the dispatcher event loop"""
+        pass
 
     @abstractmethod
     def _send(self, item: Union[Item, Reservation]) -> None:
         """Send Item information"""
         pass
 
+    def _send_digest(self, digest: Digest) -> None:
+        """Send several items at once. Sends one notification per item by default."""
+        for item in digest.items:
+            self._send(item)
+
     def stop(self) -> None:
         """Stop notifier"""
-        if self.thread.is_alive():
-            log.debug("Stopping %s Notifier thread", self.name)
-            self.queue.put(None)
-            self.thread.join()
-            log.debug("%s Notifier thread stopped", self.name)
+        if self.is_alive:
+            log.debug("Stopping %s Notifier", self.name)
+            self.dispatcher.unregister(self)
+            log.debug("%s Notifier stopped", self.name)
 
     @abstractmethod
     def __repr__(self) -> str:
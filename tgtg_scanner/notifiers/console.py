@@ -3,6 +3,7 @@ from typing import Union
 
 from tgtg_scanner.errors import ConsoleConfigurationError, MaskConfigurationError
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
+from tgtg_scanner.models.digest import Digest
 from tgtg_scanner.models.reservations import Reservation
 from tgtg_scanner.notifiers.base import Notifier
 
@@ -13,7 +14,7 @@ class Console(Notifier):
     """Notifier for the console output"""
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.console)
         self.enabled = config.console.enabled
         self.body = config.console.body
         self.cron = config.console.cron
@@ -21,6 +22,7 @@ class Console(Notifier):
         if self.enabled:
             try:
                 Item.check_mask(self.body)
+                Digest.check_mask(self.digest_header, self.digest_row, self.digest_footer)
             except MaskConfigurationError as exc:
                 raise ConsoleConfigurationError(exc.message) from exc
 
@@ -29,5 +31,12 @@ class Console(Notifier):
             message = item.unmask(self.body)
             print(message)
 
+    def _send_digest(self, digest: Digest) -> None:
+        print(digest.unmask(self.digest_header, self.digest_row, self.digest_footer))
+
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        return [self.body, *super().templates]
+
     def __repr__(self) -> str:
         return "Console stdout"
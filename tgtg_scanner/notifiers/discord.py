@@ -1,14 +1,14 @@
 import asyncio
 import datetime
 import logging
-from queue import Empty
 from typing import Union
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 from tgtg_scanner.errors import DiscordConfigurationError, MaskConfigurationError
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
+from tgtg_scanner.models.digest import Digest
 from tgtg_scanner.models.reservations import Reservation
 from tgtg_scanner.notifiers.base import Notifier
 
@@ -16,12 +16,14 @@ log = logging.getLogger("tgtg")
 
 discord.VoiceClient.warn_nacl = False
 
+READY_TIMEOUT = 60
+
 
 class Discord(Notifier):
     """Notifier for Discord"""
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.discord)
         self.enabled = config.discord.enabled
         self.prefix = config.discord.prefix
         self.token = config.discord.token
@@ -33,12 +35,14 @@ class Discord(Notifier):
         self.bot_id = None
         self.channel_id = None
         self.server_id = None
+        self._bot_task: Union[asyncio.Task, None] = None
 
         if self.enabled:
             if self.token is None or self.channel == 0:
                 raise DiscordConfigurationError()
             try:
                 Item.check_mask(self.body)
+                Digest.check_mask(self.digest_header, self.digest_row, self.digest_footer)
             except MaskConfigurationError as exc:
                 raise DiscordConfigurationError(exc.message) from exc
             self.bot = commands.Bot(command_prefix=self.prefix, intents=discord.Intents.all())
@@ -53,42 +57,51 @@ class Discord(Notifier):
 
     async def _send(self, item: Union[Item, Reservation]) -> None:  # type: ignore[override]
         """Sends item information using Discord bot"""
+        if isinstance(item, Item) and not self._is_muted():
+            # rendering may request distances from Google Maps, keep it off the event loop
+            await self._send_message(await asyncio.to_thread(item.unmask, self.body))
+
+    async def _send_digest(self, digest: Digest) -> None:  # type: ignore[override]
+        """Sends several items as one message"""
+        if not self._is_muted():
+            await self._send_message(
+                await asyncio.to_thread(digest.unmask, self.digest_header, self.digest_row, self.digest_footer)
+            )
+
+    def _is_muted(self) -> bool:
         if self.mute and self.mute > datetime.datetime.now():
-            return
+            return True
         if self.mute:
             log.info("Reactivated Discord Notifications")
             self.mute = None
-        if isinstance(item, Item):
-            message = item.unmask(self.body)
-            self.bot.dispatch("send_notification", message)
-
-    @tasks.loop(seconds=1)
-    async def _listen_for_items(self):
-        """Method for polling notifications every second"""
-        try:
-            item = self.queue.get(block=False)
-            if item is None:
-                self.bot.dispatch("close")
-                return
-            log.debug("Sending %s Notification", self.name)
-            await self._send(item)
-        except Empty:
-            pass
-        except Exception as exc:
-            log.error("Failed sending %s: %s", self.name, exc)
-
-    def _run(self):
-        self.config.set_locale()
-        # Setting event loop explicitly for python 3.9 compatibility
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        return False
+
+    async def _send_message(self, message: str) -> None:
+        if self._bot_task is None or self._bot_task.done():
+            raise RuntimeError("Discord bot is not running")
+        # fail fast if the bot stops before it gets ready
+        ready = asyncio.ensure_future(self.bot.wait_until_ready())
+        await asyncio.wait([ready, self._bot_task], timeout=READY_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        if not ready.done():
+            ready.cancel()
+            raise RuntimeError("Discord bot is not ready")
+        self.bot.dispatch("send_notification", message)
+
+    async def _astart(self) -> None:
         self.bot = commands.Bot(command_prefix=self.prefix, intents=discord.Intents.all())
         # Events include methods for post-init, shutting down, and notification sending
         self._setup_events()
         if not self.disable_commands:
             # Commands are handled separately, in case commands are not enabled
             self._setup_commands()
-        asyncio.run(self._start_bot())
+        self._bot_task = asyncio.get_running_loop().create_task(self._start_bot())
+
+    async def _astop(self) -> None:
+        if not self.bot.is_closed():
+            await self.bot.close()
+        if self._bot_task is not None:
+            await asyncio.wait([self._bot_task], timeout=READY_TIMEOUT)
+            self._bot_task = None
 
     async def _start_bot(self):
         async with self.bot:
@@ -101,7 +114,6 @@ class Discord(Notifier):
             self.bot_id = self.bot.user.id
             self.channel_id = self.channel
             self.server_id = self.bot.guilds[0].id if len(self.bot.guilds) > 0 else 0
-            self._listen_for_items.start()
 
         @self.bot.event
         async def on_send_notification(message):
@@ -137,7 +149,7 @@ class Discord(Notifier):
         @self.bot.command(name="listfavorites")
         async def _list_favorites(ctx):
             """List favorites using display name"""
-            favorites = self.favorites.get_favorites()
+            favorites = await asyncio.to_thread(self.favorites.get_favorites)
             if not favorites:
                 await ctx.send("You currently don't have any favorites.")
             else:
@@ -146,7 +158,7 @@ class Discord(Notifier):
         @self.bot.command(name="listfavoriteids")
         async def _list_favorite_ids(ctx):
             """List favorites using id"""
-            favorites = self.favorites.get_favorites()
+            favorites = await asyncio.to_thread(self.favorites.get_favorites)
             if not favorites:
                 await ctx.send("You currently don't have any favorites.")
             else:
@@ -172,7 +184,7 @@ class Discord(Notifier):
                 )
                 return
 
-            self.favorites.add_favorites(item_ids)
+            await asyncio.to_thread(self.favorites.add_favorites, item_ids)
             await ctx.send(f"Added the following item ids to favorites: {' '.join(item_ids)}")
             log.debug('Added the following item ids to favorites: "%s"', item_ids)
 
@@ -196,7 +208,7 @@ class Discord(Notifier):
                 )
                 return
 
-            self.favorites.remove_favorite(item_ids)
+            await asyncio.to_thread(self.favorites.remove_favorite, item_ids)
             await ctx.send(f"Removed the following item ids from favorites: {' '.join(item_ids)}")
             log.debug('Removed the following item ids from favorites: "%s"', item_ids)
 
@@ -226,5 +238,9 @@ class Discord(Notifier):
 
             await ctx.send(response)
 
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        return [self.body, *super().templates]
+
     def __repr__(self) -> str:
         return f"Discord: Channel ID {self.channel}"
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from itertools import count
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Hashable, Union
+
+from tgtg_scanner.models import Item, Metrics
+from tgtg_scanner.models.digest import Digest
+from tgtg_scanner.models.reservations import Reservation
+from tgtg_scanner.notifiers.outbox import Notification, Outbox
+
+if TYPE_CHECKING:
+    from tgtg_scanner.notifiers.base import Notifier
+
+log = logging.getLogger("tgtg")
+
+MAX_WORKERS = 8
+STOP_TIMEOUT = 60
+BLOCK_TIMEOUT = 10
+RETRY_INTERVAL = 1
+
+
+class _Channel:
+    """Bounded queue and worker tasks of one notifier.
+
+    Lives on the dispatcher event loop. When the queue is full the overflow
+    policy of the notifier decides what happens with a new item:
+
+    - ``drop_oldest``: the oldest queued item is discarded
+    - ``coalesce``: a queued item with the same item id is replaced by the new
+      one, otherwise the oldest queued item is discarded
+    - ``block``: the caller waits up to ``BLOCK_TIMEOUT`` seconds for free space
+    """
+
+    def __init__(self, notifier: Notifier, metrics: Union[Metrics, None] = None, outbox: Union[Outbox, None] = None) -> None:
+        self.notifier = notifier
+        self.metrics = metrics
+        self.outbox = outbox
+        self.maxsize = notifier.queue_size
+        self.policy = notifier.queue_policy
+        self.items: OrderedDict[Hashable, Notification] = OrderedDict()
+        self.workers: list[asyncio.Task] = []
+        self.ready = asyncio.Event()
+        self.closing = False
+        # end of the current digest window, see Dispatcher._work
+        self.digest_until = 0.0
+        self._counter = count()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+
+    @property
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self.items)
+
+    def _key(self, notification: Notification) -> Hashable:
+        if self.policy == "coalesce" and isinstance(notification.item, Item):
+            return notification.item.item_id
+        return next(self._counter)
+
+    def _drop(self, reason: str, notification: Notification) -> None:
+        log.debug("%s queue: dropped notification (%s)", self.notifier.name, reason)
+        if self.outbox is not None:
+            self.outbox.done(notification)
+        if self.metrics is not None:
+            self.metrics.notifier_dropped.labels(self.notifier.name, reason).inc()
+
+    def _update_depth(self) -> None:
+        if self.metrics is not None:
+            self.metrics.notifier_queue_depth.labels(self.notifier.name).set(len(self.items))
+
+    def put(self, notification: Notification) -> None:
+        """Queue a notification without waiting. Applies the overflow policy if the queue is full."""
+        key = self._key(notification)
+        if key in self.items:
+            self._drop("coalesced", self.items[key])
+            self.items[key] = notification
+            return
+        if self.full:
+            _, oldest = self.items.popitem(last=False)
+            self._drop("overflow", oldest)
+        self.items[key] = notification
+        self._not_empty.set()
+        self._update_depth()
+
+    async def put_wait(self, notification: Notification) -> None:
+        """Queue a notification, waiting for free space if the queue is full"""
+        while self.full and not self.closing:
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.put(notification)
+
+    async def get(self, timeout: Union[float, None] = None) -> Union[Notification, None]:
+        """Next queued notification.
+
+        None if the channel is closing and the queue is drained or
+        no notification arrived within timeout seconds.
+        """
+        await self.ready.wait()
+        while not self.items:
+            if self.closing:
+                return None
+            self._not_empty.clear()
+            try:
+                await asyncio.wait_for(self._not_empty.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        _, notification = self.items.popitem(last=False)
+        self._not_full.set()
+        self._update_depth()
+        return notification
+
+    def close(self) -> None:
+        """Let the workers exit once the queue is drained"""
+        self.closing = True
+        self._not_empty.set()
+        self._not_full.set()
+
+
+class Dispatcher:
+    """
+    Runs the send functions of all notifiers on one shared asyncio event loop.
+
+    Coroutine send functions run directly on the loop, blocking send functions
+    run in a shared thread pool. Coroutines of the notifiers, including bot
+    command handlers, must run blocking calls like TGTG API requests or
+    template rendering with asyncio.to_thread. The pool is the default executor
+    of the loop, so these calls share its max_workers threads. Each notifier gets as many worker tasks
+    as its concurrency allows and a bounded queue, so a hanging endpoint
+    cannot pile up notifications without limit.
+
+    If an outbox is set, every notification is recorded before it is queued,
+    failed notifications are retried and pending ones are resumed after a restart.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS) -> None:
+        self.metrics: Union[Metrics, None] = None
+        self.outbox: Union[Outbox, None] = None
+        self._retry_task: Union[asyncio.Task, None] = None
+        self.max_workers = max_workers
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+        self._thread: Union[threading.Thread, None] = None
+        self._channels: dict[Notifier, _Channel] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_alive(self) -> bool:
+        """True if the dispatcher event loop is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the event loop thread"""
+        with self._lock:
+            if self.is_alive:
+                return
+            loop = asyncio.new_event_loop()
+            # closing the loop shuts the default executor down, so every loop gets a new pool
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="notifier"))
+            started = threading.Event()
+
+            def _run() -> None:
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+                loop.close()
+
+            self._loop = loop
+            self._thread = threading.Thread(target=_run, name="dispatcher", daemon=True)
+            self._thread.start()
+            started.wait()
+            log.debug("Notification dispatcher started")
+
+    def stop(self) -> None:
+        """Stop all notifiers and the event loop thread"""
+        for notifier in list(self._channels):
+            self.unregister(notifier)
+        with self._lock:
+            if self._loop is None or self._thread is None:
+                return
+            if self._retry_task is not None:
+                self._loop.call_soon_threadsafe(self._retry_task.cancel)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            if self.outbox is not None:
+                self.outbox.flush()
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._loop = None
+            self._thread = None
+            self._retry_task = None
+            log.debug("Notification dispatcher stopped")
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: Union[float, None] = None) -> Any:
+        """Run a coroutine on the dispatcher loop and wait for the result"""
+        self.start()
+        if self._loop is None or self._thread is threading.current_thread():
+            raise RuntimeError("Cannot wait for the dispatcher from within its event loop")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def is_running(self, notifier: Notifier) -> bool:
+        """True if the notifier is registered and its workers are alive"""
+        channel = self._channels.get(notifier)
+        return channel is not None and self.is_alive and any(not worker.done() for worker in channel.workers)
+
+    def register(self, notifier: Notifier) -> None:
+        """Start worker tasks for the notifier"""
+        if notifier in self._channels:
+            return
+        self._channels[notifier] = self.run(self._open(notifier))
+
+    def unregister(self, notifier: Notifier, timeout: float = STOP_TIMEOUT) -> None:
+        """Send all queued items of the notifier and stop its workers"""
+        channel = self._channels.pop(notifier, None)
+        if channel is None or not self.is_alive:
+            return
+        try:
+            self.run(self._close(channel, timeout))
+        except Exception as exc:
+            log.warning("Error stopping %s - %s", notifier.name, exc)
+
+    def submit(self, notifier: Notifier, item: Union[Item, Reservation]) -> None:
+        """Hand an item over to the notifier workers. Safe to call from any thread.
+
+        With the ``block`` overflow policy the caller waits up to ``BLOCK_TIMEOUT``
+        seconds for free space in the queue. The item is dropped after that.
+        """
+        channel = self._channels.get(notifier)
+        if channel is None or self._loop is None:
+            raise RuntimeError(f"{notifier.name} is not registered")
+        notification = Notification(item) if self.outbox is None else self.outbox.add(notifier.name, item)
+        if channel.policy != "block" or self._thread is threading.current_thread():
+            self._loop.call_soon_threadsafe(channel.put, notification)
+            return
+        future = asyncio.run_coroutine_threadsafe(channel.put_wait(notification), self._loop)
+        try:
+            future.result(BLOCK_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            log.warning("%s queue is full. Dropping notification", notifier.name)
+            if self.outbox is not None:
+                self.outbox.done(notification)
+            if self.metrics is not None:
+                self.metrics.notifier_dropped.labels(notifier.name, "timeout").inc()
+
+    async def _open(self, notifier: Notifier) -> _Channel:
+        channel = _Channel(notifier, self.metrics, self.outbox)
+        loop = asyncio.get_running_loop()
+        if self.outbox is not None and self._retry_task is None:
+            self._retry_task = loop.create_task(self._retry())
+        channel.workers = [loop.create_task(self._work(channel)) for _ in range(max(1, notifier.concurrency))]
+        loop.create_task(self._startup(channel))
+        return channel
+
+    async def _startup(self, channel: _Channel) -> None:
+        notifier = channel.notifier
+        try:
+            notifier.config.set_locale()
+            await notifier._astart()
+        except Exception as exc:
+            log.error("Failed starting %s: %s", notifier.name, exc)
+        finally:
+            channel.ready.set()
+
+    async def _close(self, channel: _Channel, timeout: float) -> None:
+        channel.close()
+        _, pending = await asyncio.wait(channel.workers, timeout=timeout)
+        for worker in pending:
+            worker.cancel()
+        if pending:
+            log.warning("%s did not finish sending within %s seconds", channel.notifier.name, timeout)
+            if self.outbox is not None:
+                self.outbox.release(list(channel.items.values()))
+        try:
+            await channel.notifier._astop()
+        except Exception as exc:
+            log.warning("Failed stopping %s: %s", channel.notifier.name, exc)
+
+    async def _work(self, channel: _Channel) -> None:
+        """Sends queued notifications.
+
+        With a digest window, the first item is sent immediately and opens the window.
+        Items arriving while the window is open are collected and sent as one digest
+        when it closes.
+        """
+        notifier = channel.notifier
+        loop = asyncio.get_running_loop()
+        while True:
+            notification = await channel.get()
+            if notification is None:
+                break
+            window = notifier.digest_window / 1000
+            if window <= 0 or not isinstance(notification.item, Item):
+                await self._dispatch(notifier, [notification])
+                continue
+            if loop.time() >= channel.digest_until:
+                channel.digest_until = loop.time() + window
+                await self._dispatch(notifier, [notification])
+                continue
+            batch = [notification]
+            while (remaining := channel.digest_until - loop.time()) > 0:
+                notification = await channel.get(remaining)
+                if notification is None:
+                    break
+                if isinstance(notification.item, Item):
+                    batch.append(notification)
+                else:
+                    await self._dispatch(notifier, [notification])
+            channel.digest_until = loop.time() + window
+            await self._dispatch(notifier, batch)
+
+    async def _retry(self) -> None:
+        """Queue due notifications from the outbox again"""
+        while self.outbox is not None:
+            channels = {notifier.name: channel for notifier, channel in self._channels.items()}
+            try:
+                for name, notification in self.outbox.due(list(channels)):
+                    channels[name].put(notification)
+            except Exception as exc:
+                log.error("Failed reading notification outbox: %s", exc)
+            await asyncio.sleep(RETRY_INTERVAL)
+
+    async def _dispatch(self, notifier: Notifier, notifications: list[Notification]) -> None:
+        """Sends one notification or a digest of several items"""
+        log.debug("Sending %s Notification", notifier.name)
+        start = monotonic()
+        if len(notifications) == 1:
+            send: Callable = notifier._send
+            item: Union[Item, Reservation, Digest] = notifications[0].item
+        else:
+            send = notifier._send_digest
+            item = Digest([notification.item for notification in notifications])  # type: ignore[misc]
+        try:
+            if asyncio.iscoroutinefunction(send):
+                await send(item)
+            else:
+                await asyncio.get_running_loop().run_in_executor(None, self._call, notifier, send, item)
+            if self.outbox is not None:
+                for notification in notifications:
+                    self.outbox.done(notification)
+        except asyncio.CancelledError:
+            if self.outbox is not None:
+                self.outbox.release(notifications)
+            raise
+        except Exception as exc:
+            log.error("Failed sending %s: %s", notifier.name, exc)
+            if self.outbox is not None:
+                for notification in notifications:
+                    if self.outbox.failed(notification, str(exc)):
+                        log.debug("Retrying %s notification later", notifier.name)
+                    else:
+                        log.warning("Giving up sending %s notification after %s attempts", notifier.name, notification.attempts)
+            if self.metrics is not None:
+                self.metrics.notifier_failures.labels(notifier.name).inc()
+        finally:
+            if self.metrics is not None:
+                self.metrics.notifier_send_duration.labels(notifier.name).observe(monotonic() - start)
+
+    @staticmethod
+    def _call(notifier: Notifier, send: Callable, item: Union[Item, Reservation, Digest]) -> None:
+        notifier.config.set_locale()
+        send(item)
+
+
+_dispatcher = Dispatcher()
+
+
+def get_dispatcher() -> Dispatcher:
+    """Returns the process wide notification dispatcher"""
+    return _dispatcher
@@ -1,7 +1,11 @@
 import logging
 
-from tgtg_scanner.errors import IFTTTConfigurationError, MaskConfigurationError
-from tgtg_scanner.models import Config, Favorites, Item, Reservations
+from tgtg_scanner.errors import (
+    IFTTTConfigurationError,
+    MaskConfigurationError,
+    WebHookConfigurationError,
+)
+from tgtg_scanner.models import Config, Favorites, Reservations
 from tgtg_scanner.notifiers.webhook import WebHook
 
 log = logging.getLogger("tgtg")
@@ -15,7 +19,7 @@ class IFTTT(WebHook):
     """
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super(WebHook, self).__init__(config, reservations, favorites)
+        super(WebHook, self).__init__(config, reservations, favorites, config.ifttt)
         self.enabled = config.ifttt.enabled
         self.event = config.ifttt.event
         self.key = config.ifttt.key
@@ -30,11 +34,10 @@ class IFTTT(WebHook):
 
         if self.enabled and (not self.event or not self.key):
             raise IFTTTConfigurationError()
-        if self.enabled and self.body is not None:
-            try:
-                Item.check_mask(self.body)
-            except MaskConfigurationError as exc:
-                raise IFTTTConfigurationError(exc.message) from exc
+        try:
+            self._setup(config.ifttt.pool_size, 0, [("ifttt", {})] if self.enabled else [])
+        except (MaskConfigurationError, WebHookConfigurationError) as exc:
+            raise IFTTTConfigurationError(exc.message) from exc
 
     def __repr__(self) -> str:
         return f"IFTTT: {self.key}"
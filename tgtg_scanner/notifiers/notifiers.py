@@ -1,14 +1,26 @@
 import logging
+import sqlite3
+from pathlib import Path
 from typing import Type, Union
 
-from tgtg_scanner.models import Config, Cron, Favorites, Item, Reservations
+from tgtg_scanner.models import (
+    Config,
+    Cron,
+    Favorites,
+    Item,
+    Location,
+    Metrics,
+    Reservations,
+)
 from tgtg_scanner.models.reservations import Reservation
 from tgtg_scanner.notifiers.apprise import Apprise
 from tgtg_scanner.notifiers.base import Notifier
 from tgtg_scanner.notifiers.console import Console
 from tgtg_scanner.notifiers.discord import Discord
+from tgtg_scanner.notifiers.dispatcher import get_dispatcher
 from tgtg_scanner.notifiers.ifttt import IFTTT
 from tgtg_scanner.notifiers.ntfy import Ntfy
+from tgtg_scanner.notifiers.outbox import Outbox
 from tgtg_scanner.notifiers.push_safer import PushSafer
 from tgtg_scanner.notifiers.script import Script
 from tgtg_scanner.notifiers.smtp import SMTP
@@ -23,8 +35,31 @@ NOTIFIERS: list[Type[Notifier]] = [Apprise, Console, PushSafer, SMTP, IFTTT, Ntf
 class Notifiers:
     """Notifier Manager"""
 
-    def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
+    def __init__(
+        self,
+        config: Config,
+        reservations: Reservations,
+        favorites: Favorites,
+        metrics: Union[Metrics, None] = None,
+        location: Union[Location, None] = None,
+    ):
+        self.dispatcher = get_dispatcher()
+        self.dispatcher.metrics = metrics
+        if config.cache_path is not None and self.dispatcher.outbox is None:
+            try:
+                self.dispatcher.outbox = Outbox(
+                    Path(config.cache_path, "outbox.sqlite3"),
+                    config.outbox_max_attempts,
+                    config.outbox_max_age,
+                    location,
+                )
+            except (OSError, sqlite3.Error) as exc:
+                log.warning("Notification outbox not available - %s", exc)
         self._notifiers: list[Notifier] = [NotifierCls(config, reservations, favorites) for NotifierCls in NOTIFIERS]
+        for notifier in self._notifiers:
+            notifier.metrics = metrics
+        if metrics is not None:
+            metrics.runtime.notifiers = self._enabled_notifiers
         log.info("Activated notifiers:")
         if self.notifier_count == 0:
             log.warning("No notifiers configured!")
@@ -37,6 +72,11 @@ class Notifiers:
     def _enabled_notifiers(self) -> list[Notifier]:
         return [notifier for notifier in self._notifiers if notifier.enabled]
 
+    def travel_modes(self) -> set[str]:
+        """Travel modes of the distance and duration variables used by the enabled notifiers"""
+        texts = [text for notifier in self._enabled_notifiers for text in notifier.templates if text]
+        return Location.used_travel_modes(" ".join(texts))
+
     @property
     def notifier_count(self) -> int:
         """Number of enabled notifiers
@@ -70,3 +110,7 @@ class Notifiers:
                 notifier.stop()
             except Exception as exc:
                 log.warning("Error stopping %s - %s", notifier, exc)
+        self.dispatcher.stop()
+        if self.dispatcher.outbox is not None:
+            self.dispatcher.outbox.close()
+            self.dispatcher.outbox = None
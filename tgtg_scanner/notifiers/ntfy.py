@@ -5,7 +5,7 @@ from requests.auth import HTTPBasicAuth
 
 from tgtg_scanner.errors import MaskConfigurationError, NtfyConfigurationError
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
-from tgtg_scanner.models.reservations import Reservation
+from tgtg_scanner.models.template import Template
 from tgtg_scanner.notifiers.webhook import WebHook
 
 log = logging.getLogger("tgtg")
@@ -15,7 +15,7 @@ class Ntfy(WebHook):
     """Notifier for Ntfy"""
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super(WebHook, self).__init__(config, reservations, favorites)
+        super(WebHook, self).__init__(config, reservations, favorites, config.ntfy)
         self.enabled = config.ntfy.enabled
         self.server = config.ntfy.server
         self.topic = config.ntfy.topic
@@ -34,6 +34,7 @@ class Ntfy(WebHook):
         self.auth = None
         self.method = "POST"
         self.type = None
+        self._templates: dict[str, Template] = {}
 
         if self.enabled:
             if not self.server or not self.topic:
@@ -51,28 +52,29 @@ class Ntfy(WebHook):
             else:
                 log.warning("Username and Password or Access Token missing for Ntfy authentication, defaulting to no auth")
             try:
-                Item.check_mask(self.title)
-                Item.check_mask(self.message)
-                Item.check_mask(self.tags)
-                Item.check_mask(self.click)
+                self._templates = {
+                    "X-Title": Template(self.title),
+                    "X-Message": Template(self.message),
+                    "X-Tags": Template(self.tags),
+                    "X-Click": Template(self.click),
+                }
             except MaskConfigurationError as exc:
                 raise NtfyConfigurationError(exc.message) from exc
+        try:
+            self._setup(config.ntfy.pool_size, 0, [("ntfy", {})] if self.enabled else [])
+        except MaskConfigurationError as exc:
+            raise NtfyConfigurationError(exc.message) from exc
+
+    def _item_headers(self, item: Item) -> dict[str, Union[str, bytes]]:
+        headers: dict[str, Union[str, bytes]] = {
+            header: template.render(item).encode("utf-8") for header, template in self._templates.items()
+        }
+        headers["X-Priority"] = self.priority
+        return headers
 
-    def _send(self, item: Union[Item, Reservation]) -> None:
-        """Sends item information via configured Ntfy endpoint"""
-        if isinstance(item, Item):
-            title = item.unmask(self.title).encode("utf-8")
-            message = item.unmask(self.message).encode("utf-8")
-            tags = item.unmask(self.tags).encode("utf-8")
-            click = item.unmask(self.click).encode("utf-8")
-            self.headers |= {
-                "X-Title": title,
-                "X-Message": message,
-                "X-Priority": self.priority,
-                "X-Tags": tags,
-                "X-Click": click,
-            }
-            super()._send(item)
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        return [self.title, self.message, self.body, self.tags, self.click, *super().templates]
 
     def __repr__(self) -> str:
         return f"Ntfy: {self.server}/{self.topic}"
@@ -0,0 +1,224 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from time import monotonic, time
+from typing import Union
+
+from tgtg_scanner.models import Item, Location
+from tgtg_scanner.models.reservations import Reservation
+
+log = logging.getLogger("tgtg")
+
+MAX_ATTEMPTS = 5
+MAX_AGE = 3600
+RETRY_BACKOFF = 2.0
+RETRY_BACKOFF_MAX = 300.0
+COMMIT_INTERVAL = 0.5
+COMMIT_BATCH = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    notifier TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_next_attempt ON outbox (next_attempt);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    id INTEGER PRIMARY KEY,
+    notifier TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    failed REAL NOT NULL,
+    last_error TEXT
+);
+"""
+
+
+@dataclass
+class Notification:
+    """Item or reservation on its way to one notifier"""
+
+    item: Union[Item, Reservation]
+    id: Union[int, None] = None
+    attempts: int = 0
+
+
+class Outbox:
+    """
+    Durable SQLite outbox for notifications.
+
+    Every notification is recorded with its target notifier before it is queued
+    and removed once it was sent. Failed notifications are retried with exponential
+    backoff and jitter and moved to the dead letter table when all attempts are
+    exhausted or they are older than max_age seconds. Notifications that were
+    pending when the process stopped are resumed on startup.
+
+    Writes are committed in batches, at the latest after COMMIT_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_attempts: int = MAX_ATTEMPTS,
+        max_age: int = MAX_AGE,
+        location: Union[Location, None] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.location = location
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self._last_commit = monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        # notifications that were queued or in flight when the process stopped
+        resumed = self._db.execute("UPDATE outbox SET next_attempt = ? WHERE next_attempt IS NULL", (time(),)).rowcount
+        self._db.commit()
+        if resumed:
+            log.info("Resuming %s pending notifications", resumed)
+
+    def _serialize(self, item: Union[Item, Reservation]) -> tuple[str, str]:
+        if isinstance(item, Item):
+            return "item", json.dumps({"data": item.to_dict(), "locale": item.locale})
+        return "reservation", json.dumps(asdict(item))
+
+    def _deserialize(self, kind: str, payload: str) -> Union[Item, Reservation]:
+        data = json.loads(payload)
+        if kind == "item":
+            return Item(data["data"], self.location, data["locale"])
+        return Reservation(**data)
+
+    def _changed(self, count: int = 1) -> None:
+        self._dirty += count
+        if self._dirty >= COMMIT_BATCH or monotonic() - self._last_commit >= COMMIT_INTERVAL:
+            self._commit()
+
+    def _commit(self) -> None:
+        if self._dirty:
+            self._db.commit()
+            self._dirty = 0
+        self._last_commit = monotonic()
+
+    def flush(self) -> None:
+        """Commit pending writes"""
+        with self._lock:
+            self._commit()
+
+    def add(self, notifier: str, item: Union[Item, Reservation]) -> Notification:
+        """Record a new notification for the notifier"""
+        kind, payload = self._serialize(item)
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (notifier, kind, payload, created) VALUES (?, ?, ?, ?)",
+                (notifier, kind, payload, time()),
+            )
+            self._changed()
+        return Notification(item, cursor.lastrowid)
+
+    def done(self, notification: Notification) -> None:
+        """Remove a sent or deliberately dropped notification"""
+        if notification.id is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (notification.id,))
+            self._changed()
+
+    def release(self, notifications: list[Notification]) -> None:
+        """Make queued notifications due again, e.g. when a notifier stops before sending them"""
+        ids = [(notification.id,) for notification in notifications if notification.id is not None]
+        if not ids:
+            return
+        with self._lock:
+            self._db.executemany("UPDATE outbox SET next_attempt = 0 WHERE id = ?", ids)
+            self._changed(len(ids))
+
+    def failed(self, notification: Notification, error: str) -> bool:
+        """Record a failed attempt. Returns False if the notification was moved to the dead letter table."""
+        if notification.id is None:
+            return False
+        notification.attempts += 1
+        delay = min(RETRY_BACKOFF * 2 ** (notification.attempts - 1), RETRY_BACKOFF_MAX)
+        delay *= random.uniform(0.5, 1.5)
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (notification.attempts, time() + delay, error, notification.id),
+            )
+            self._changed()
+            if notification.attempts >= self.max_attempts:
+                self._bury(notification.id, error)
+                return False
+        return True
+
+    def _bury(self, id: int, error: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO dead_letter (id, notifier, kind, payload, created, attempts, failed, last_error) "
+            "SELECT id, notifier, kind, payload, created, attempts, ?, ? FROM outbox WHERE id = ?",
+            (time(), error, id),
+        )
+        self._db.execute("DELETE FROM outbox WHERE id = ?", (id,))
+        self._changed(2)
+
+    def due(self, notifiers: list[str]) -> list[tuple[str, Notification]]:
+        """Take all due notifications of the given notifiers.
+
+        Expired notifications are moved to the dead letter table.
+        Returns (notifier name, notification) tuples.
+        """
+        if not notifiers:
+            return []
+        now = time()
+        placeholders = ", ".join("?" * len(notifiers))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, notifier, kind, payload, created, attempts FROM outbox "
+                f"WHERE next_attempt <= ? AND notifier IN ({placeholders}) ORDER BY id",
+                (now, *notifiers),
+            ).fetchall()
+            result = []
+            for id, notifier, kind, payload, created, attempts in rows:
+                if now - created > self.max_age:
+                    self._bury(id, "expired")
+                    log.warning("Notification for %s expired after %s attempts", notifier, attempts)
+                    continue
+                try:
+                    item = self._deserialize(kind, payload)
+                except (ValueError, KeyError, TypeError) as err:
+                    self._bury(id, f"invalid payload - {err}")
+                    continue
+                self._db.execute("UPDATE outbox SET next_attempt = NULL WHERE id = ?", (id,))
+                self._changed()
+                result.append((notifier, Notification(item, id, attempts)))
+            self._commit()
+        return result
+
+    @property
+    def pending(self) -> int:
+        """Number of notifications that were not sent yet"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    @property
+    def dead_letters(self) -> int:
+        """Number of notifications that could not be sent"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def close(self) -> None:
+        """Commit pending writes and close the database"""
+        with self._lock:
+            self._commit()
+            self._db.close()
@@ -19,7 +19,7 @@ class PushSafer(Notifier):
     """
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.pushsafer)
         self.enabled = config.pushsafer.enabled
         self.key = config.pushsafer.key
         self.device_id = config.pushsafer.device_id
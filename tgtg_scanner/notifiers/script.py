@@ -1,39 +1,107 @@
+import asyncio
+import json
 import logging
-import subprocess
+from time import monotonic
 from typing import Union
 
-from tgtg_scanner.errors import MaskConfigurationError, ScriptConfigurationError
+from tgtg_scanner.errors import (
+    MaskConfigurationError,
+    NotificationError,
+    ScriptConfigurationError,
+)
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
+from tgtg_scanner.models.item import ATTRS
 from tgtg_scanner.models.reservations import Reservation
+from tgtg_scanner.models.template import Template
 from tgtg_scanner.notifiers import Notifier
 
 log = logging.getLogger("tgtg")
 
+# item variables that are not part of the stdin payload
+PAYLOAD_EXCLUDE = ("item_logo_bytes", "item_cover_bytes")
+# item variables in the stdin payload only if the command uses them, they may request Google Maps
+PAYLOAD_IF_USED = ("distance_", "duration_")
+
 
 class Script(Notifier):
-    """Notifier for the script output"""
+    """Notifier for the script output.
+
+    Runs at most `concurrency` commands at the same time and kills
+    commands that do not finish within `timeout` seconds.
+    """
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.script)
         self.enabled = config.script.enabled
         self.command = config.script.command
         self.cron = config.script.cron
+        self.concurrency = config.script.concurrency
+        self.timeout: int = config.script.timeout
+        self.stdin: bool = config.script.stdin
+        self.args: list[Template] = []
+        self.payload_names: list[str] = []
 
         if self.enabled:
             if self.command is None:
                 raise ScriptConfigurationError()
             else:
                 try:
-                    Item.check_mask(self.command)
+                    self.args = [Template(arg) for arg in self.command.split()]
                 except MaskConfigurationError as exc:
                     raise ScriptConfigurationError(exc.message) from exc
+            if not self.args:
+                raise ScriptConfigurationError()
+            used = {name for arg in self.args for name in arg.variables}
+            self.payload_names = [
+                name for name in ATTRS if name not in PAYLOAD_EXCLUDE and (name in used or not name.startswith(PAYLOAD_IF_USED))
+            ]
+
+    def _payload(self, item: Item) -> bytes:
+        """Item variables as JSON"""
+        values = {name: getattr(item, name) for name in self.payload_names}
+        return json.dumps(values, ensure_ascii=False, default=str).encode("utf-8")
 
-    def _send(self, item: Union[Item, Reservation]) -> None:
-        if self.command is None:
+    def _render(self, item: Item) -> tuple[list[str], Union[bytes, None]]:
+        """Command line and stdin payload for the item"""
+        self.config.set_locale()
+        args = [arg.render(item) for arg in self.args]
+        return args, self._payload(item) if self.stdin else None
+
+    async def _send(self, item: Union[Item, Reservation]) -> None:  # type: ignore[override]
+        if not self.args:
             raise ScriptConfigurationError()
-        if isinstance(item, Item):
-            args = [item.unmask(arg) for arg in self.command.split()]
-            subprocess.Popen(args)
+        if not isinstance(item, Item):
+            return
+        # rendering may request distances from Google Maps, keep it off the event loop
+        args, payload = await asyncio.to_thread(self._render, item)
+        start = monotonic()
+        process = await asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.PIPE if self.stdin else asyncio.subprocess.DEVNULL
+        )
+        try:
+            await asyncio.wait_for(process.communicate(payload), self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            self._observe(process.returncode, monotonic() - start, timed_out=True)
+            raise NotificationError(f"Script timed out after {self.timeout} seconds")
+        except asyncio.CancelledError:
+            # notifier stopped, do not leave the child behind
+            process.kill()
+            await process.wait()
+            raise
+        self._observe(process.returncode, monotonic() - start)
+        if process.returncode != 0:
+            log.warning("Script exited with code %s", process.returncode)
+
+    def _observe(self, returncode: Union[int, None], seconds: float, timed_out: bool = False) -> None:
+        if self.metrics is not None:
+            self.metrics.script_duration.observe(seconds)
+            self.metrics.script_exit_codes.labels("timeout" if timed_out else str(returncode)).inc()
+
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        return [self.command, *super().templates]
 
     def __repr__(self) -> str:
         return f"Shell script: {self.command}"
@@ -4,11 +4,13 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate
-from smtplib import SMTPException, SMTPServerDisconnected
+from smtplib import SMTPException
+from time import monotonic
 from typing import Union
 
 from tgtg_scanner.errors import MaskConfigurationError, SMTPConfigurationError
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
+from tgtg_scanner.models.digest import Digest
 from tgtg_scanner.models.reservations import Reservation
 from tgtg_scanner.notifiers.base import Notifier
 
@@ -19,7 +21,7 @@ class SMTP(Notifier):
     """Notifier for SMTP"""
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.smtp)
         self.server: Union[smtplib.SMTP, None] = None
         self.debug = config.debug
         self.enabled = config.smtp.enabled
@@ -36,12 +38,17 @@ class SMTP(Notifier):
         self.subject = config.smtp.subject
         self.body = config.smtp.body
         self.cron = config.smtp.cron
+        self.idle_timeout: int = config.smtp.idle_timeout
+        self.digest_subject: str = config.smtp.digest_subject
+        self._last_used = monotonic()
         if self.enabled:
             if self.host is None or self.port is None or self.recipients is None:
                 raise SMTPConfigurationError()
             try:
                 Item.check_mask(self.subject)
                 Item.check_mask(self.body)
+                Digest.check_mask(self.digest_subject, "", "")
+                Digest.check_mask(self.digest_header, self.digest_row, self.digest_footer)
             except MaskConfigurationError as exc:
                 raise SMTPConfigurationError(exc.message) from exc
             try:
@@ -62,11 +69,7 @@ class SMTP(Notifier):
 
     def __del__(self):
         """Closes SMTP connection when shutdown"""
-        if self.server:
-            try:
-                self.server.quit()
-            except Exception as exc:
-                log.warning(exc)
+        self._disconnect()
 
     def _connect(self) -> None:
         """Connect to SMTP Server"""
@@ -82,50 +85,86 @@ class SMTP(Notifier):
         self.server.ehlo()
         if self.username is not None and self.password is not None:
             self.server.login(self.username, self.password)
+        self._last_used = monotonic()
 
-    def _stay_connected(self) -> None:
-        """Refresh server connection if connection is lost"""
-        status = -1
-        if self.server is not None:
+    def _disconnect(self) -> None:
+        server, self.server = self.server, None
+        if server is not None:
             try:
-                status = self.server.noop()[0]
-            except SMTPServerDisconnected:
-                pass
-        if status != 250:
-            self._connect()
+                server.quit()
+            except Exception as exc:
+                log.warning(exc)
 
-    def _send_mail(self, subject: str, html: str, item_id: str) -> None:
-        """Sends mail with html body"""
+    def _stay_connected(self) -> None:
+        """Reconnect if the connection was idle for longer than the idle timeout.
+
+        Servers close idle connections after some time, so an old connection
+        is replaced instead of being checked with a NOOP before every mail.
+        """
+        if self.server is not None and monotonic() - self._last_used > self.idle_timeout:
+            log.debug("SMTP connection idle for more than %s seconds. Reconnecting", self.idle_timeout)
+            self._disconnect()
         if self.server is None:
             self._connect()
-        if self.sender is None or self.recipients is None or self.server is None:
+
+    def _recipients(self, item_id: str) -> list[str]:
+        """Recipients for the item. Either the main recipient(s) or the recipient(s) configured for the item."""
+        return self.item_recipients.get(item_id, self.recipients)
+
+    def _send_mail(self, subject: str, html: str, recipients: list[str]) -> None:
+        """Sends mail with html body"""
+        if self.sender is None or not recipients:
             raise SMTPConfigurationError()
         message = MIMEMultipart("alternative")
         message["From"] = self.sender
-
-        # Contains either the main recipient(s) or recipient(s) that should be
-        # notified for the specific item. First, initalize with main recipient(s)
-        recipients = self.item_recipients.get(item_id, self.recipients)
-
         message["To"] = ", ".join(recipients)
         message["Subject"] = subject
         message["Date"] = formatdate(localtime=True)
         message.attach(MIMEText(html, "html", "utf-8"))
         body = message.as_string()
-        log.info("sending email %s", body)
+        log.info("Sending mail '%s' to %s", subject, ", ".join(recipients))
+        log.debug("Mail body: %s", body)
         self._stay_connected()
         try:
-            self.server.sendmail(self.sender, recipients, body)
+            self.server.sendmail(self.sender, recipients, body)  # type: ignore[union-attr]
         except SMTPException:
+            # connection closed by the server or broken, retry once on a new connection
+            self._disconnect()
             self._connect()
-            self.server.sendmail(self.sender, recipients, body)
+            self.server.sendmail(self.sender, recipients, body)  # type: ignore[union-attr]
+        self._last_used = monotonic()
 
     def _send(self, item: Union[Item, Reservation]) -> None:
         """Sends item information via Mail."""
         if isinstance(item, Item):
-            self._send_mail(item.unmask(self.subject), item.unmask(self.body), item.item_id)
+            self._send_mail(item.unmask(self.subject), item.unmask(self.body), self._recipients(item.item_id))
         elif isinstance(item, Reservation):
-            self._send_mail("TGTG order placed: " + item.item_id, f"Here is the Paypal link </br><a href={item.payment_url}> {item.payment_url}</a>", item.item_id)
+            self._send_mail(
+                "TGTG order placed: " + item.item_id,
+                f"Here is the Paypal link </br><a href={item.payment_url}> {item.payment_url}</a>",
+                self._recipients(item.item_id),
+            )
+
+    def _send_digest(self, digest: Digest) -> None:
+        """Sends one digest mail per distinct set of recipients over one connection.
+        Only digests are grouped by recipients, _send sends one mail per item."""
+        groups: dict[tuple[str, ...], list[Item]] = {}
+        for item in digest.items:
+            groups.setdefault(tuple(self._recipients(item.item_id)), []).append(item)
+        for recipients, items in groups.items():
+            group = Digest(items)
+            self._send_mail(
+                group.unmask(self.digest_subject, "", ""),
+                group.unmask(self.digest_header, self.digest_row, self.digest_footer),
+                list(recipients),
+            )
+
+    async def _astop(self) -> None:
+        self._disconnect()
+
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        return [self.subject, self.body, self.digest_subject, *super().templates]
 
     def __repr__(self) -> str:
         return f"SMTP: {self.recipients}"
@@ -2,20 +2,30 @@ from __future__ import annotations
 
 import asyncio
 import datetime
+import json
 import logging
 import random
+import threading
 import warnings
+from collections import OrderedDict
 from functools import wraps
-from queue import Empty
-from time import sleep
+from pathlib import Path
+from time import monotonic, sleep
 from typing import Union
 
-from telegram import BotCommand, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import (
+    BotCommand,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Message,
+    Update,
+)
 from telegram.constants import ParseMode
 from telegram.error import (
     BadRequest,
     InvalidToken,
     NetworkError,
+    RetryAfter,
     TelegramError,
     TimedOut,
 )
@@ -33,12 +43,97 @@ from telegram.warnings import PTBUserWarning
 
 from tgtg_scanner.errors import MaskConfigurationError, TelegramConfigurationError
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
+from tgtg_scanner.models.digest import Digest
 from tgtg_scanner.models.favorites import AddFavoriteRequest, RemoveFavoriteRequest
+from tgtg_scanner.models.image_cache import image_cache, is_image_url
 from tgtg_scanner.models.reservations import Order, Reservation
 from tgtg_scanner.notifiers.base import Notifier
 
 log = logging.getLogger("tgtg")
 
+FILE_ID_CACHE_SIZE = 1024
+
+
+class FileIdCache:
+    """
+    Bounded map of image urls to Telegram file ids.
+    Entries are persisted as JSON if a file is given.
+    """
+
+    def __init__(self, file: Union[Path, None] = None, maxsize: int = FILE_ID_CACHE_SIZE) -> None:
+        self.file = file
+        self.maxsize = maxsize
+        self._file_ids: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.file is not None and self.file.is_file():
+            try:
+                self._file_ids.update(json.loads(self.file.read_text(encoding="utf-8")))
+            except (OSError, ValueError) as err:
+                log.warning("Failed loading Telegram file id cache - %s", err)
+            while len(self._file_ids) > self.maxsize:
+                self._file_ids.popitem(last=False)
+
+    def get(self, url: str) -> Union[str, None]:
+        with self._lock:
+            file_id = self._file_ids.get(url)
+            if file_id is not None:
+                self._file_ids.move_to_end(url)
+            return file_id
+
+    def set(self, url: str, file_id: str) -> None:
+        with self._lock:
+            self._file_ids[url] = file_id
+            self._file_ids.move_to_end(url)
+            while len(self._file_ids) > self.maxsize:
+                self._file_ids.popitem(last=False)
+            self._save()
+
+    def remove(self, url: str) -> None:
+        with self._lock:
+            if self._file_ids.pop(url, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        if self.file is None:
+            return
+        try:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            self.file.write_text(json.dumps(self._file_ids), encoding="utf-8")
+        except OSError as err:
+            log.warning("Failed saving Telegram file id cache - %s", err)
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+
+class RateLimiter:
+    """
+    Schedules Telegram requests according to the bot API limits.
+    About 30 messages per second overall, one message per second
+    to the same chat and 20 messages per minute to the same group.
+    """
+
+    def __init__(self, overall_rate: float = 30, chat_rate: float = 1, group_rate: float = 20 / 60) -> None:
+        self.overall_interval = 1 / overall_rate
+        self.chat_interval = 1 / chat_rate
+        self.group_interval = 1 / group_rate
+        self._overall_next = 0.0
+        self._chat_next: dict[str, float] = {}
+
+    async def wait(self, chat_id: str) -> None:
+        """Waits for the next free slot to send a message to the chat"""
+        now = monotonic()
+        start = max(now, self._overall_next, self._chat_next.get(chat_id, 0.0))
+        self._overall_next = start + self.overall_interval
+        interval = self.group_interval if chat_id.startswith("-") else self.chat_interval
+        self._chat_next[chat_id] = start + interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def pause(self, seconds: float) -> None:
+        """Delays all further requests, e.g. on flood control"""
+        self._overall_next = max(self._overall_next, monotonic() + seconds)
+
 
 def _private(func):
     @wraps(func)
@@ -58,9 +153,11 @@ class Telegram(Notifier):
     """Notifier for Telegram"""
 
     MAX_RETRIES = 10
+    RETRY_BACKOFF = 0.5
+    RETRY_BACKOFF_MAX = 30
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.telegram)
         self.application: Application = None
         self.config = config
         self.enabled = config.telegram.enabled
@@ -73,7 +170,9 @@ class Telegram(Notifier):
         self.only_reservations = config.telegram.only_reservations
         self.cron = config.telegram.cron
         self.mute: Union[datetime.datetime, None] = None
-        self.retries = 0
+        self.polling = False
+        self.limiter = RateLimiter()
+        self.file_ids = FileIdCache(Path(config.cache_path, "telegram_file_ids.json") if config.cache_path is not None else None)
         if self.enabled:
             if not self.token or not self.body:
                 raise TelegramConfigurationError()
@@ -88,6 +187,7 @@ class Telegram(Notifier):
             warnings.filterwarnings("ignore", category=PTBUserWarning, module="telegram")
             try:
                 Item.check_mask(self.body)
+                Digest.check_mask(self.digest_header, self.digest_row, self.digest_footer)
             except MaskConfigurationError as err:
                 raise TelegramConfigurationError(err.message) from err
             try:
@@ -157,41 +257,25 @@ class Telegram(Notifier):
             asyncio.run(self._get_chat_id())
         super().start()
 
-    def _run(self) -> None:
-        async def _listen_for_items() -> None:
-            # Setting event loop explicitly for python 3.9 compatibility
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            self.application = ApplicationBuilder().token(self.token).arbitrary_callback_data(True).build()
-            self.application.add_error_handler(self._error)
-            await self.application.bot.set_my_commands([])
-            if not self.disable_commands:
-                try:
-                    await self._start_polling()
-                except Exception as exc:
-                    log.error("Telegram failed starting polling: %s", exc)
-                    return
-            while True:
-                try:
-                    item = self.queue.get(block=False)
-                    if item is None:
-                        break
-                    log.debug("Sending %s Notification", self.name)
-                    await self._send(item)
-                except Empty:
-                    pass
-                except Exception as exc:
-                    log.error("Failed sending %s: %s", self.name, exc)
-                finally:
-                    await asyncio.sleep(0.1)
-            if not self.disable_commands:
-                try:
-                    await self._stop_polling()
-                except Exception as exc:
-                    log.warning("Telegram failed stopping polling: %s", exc)
-
-        self.config.set_locale()
-        asyncio.run(_listen_for_items())
+    async def _astart(self) -> None:
+        self.application = ApplicationBuilder().token(self.token).arbitrary_callback_data(True).build()
+        self.application.add_error_handler(self._error)
+        await self.application.bot.set_my_commands([])
+        self.polling = False
+        if not self.disable_commands:
+            try:
+                await self._start_polling()
+                self.polling = True
+            except Exception as exc:
+                log.error("Telegram failed starting polling: %s", exc)
+
+    async def _astop(self) -> None:
+        if self.polling:
+            try:
+                await self._stop_polling()
+            except Exception as exc:
+                log.warning("Telegram failed stopping polling: %s", exc)
+            self.polling = False
 
     def _unmask(self, text: str, item: Item) -> str:
         for match in item._get_variables(text):
@@ -201,11 +285,25 @@ class Telegram(Notifier):
                 text = text.replace(match.group(0), val)
         return text
 
-    def _unmask_image(self, text: str, item: Item) -> Union[bytes, None]:
-        if text in ["${{item_logo_bytes}}", "${{item_cover_bytes}}"]:
-            matches = item._get_variables(text)
-            return bytes(getattr(item, matches[0].group(1)))
-        return None
+    def _image_url(self, text: str, item: Item) -> Union[str, None]:
+        url = {"${{item_logo_bytes}}": item.item_logo, "${{item_cover_bytes}}": item.item_cover}.get(text)
+        return url if is_image_url(url) else None
+
+    def _get_photo(self, image_url: str) -> Union[str, bytes, None]:
+        """Returns the Telegram file id of an already uploaded image or the cached image.
+        Never waits for a download. Sends without image if it is not cached yet."""
+        file_id = self.file_ids.get(image_url)
+        if file_id is not None:
+            return file_id
+        image = image_cache.get_cached(image_url)
+        if image is None:
+            log.debug("%s image not cached yet: %s", self.name, image_url)
+            image_cache.prefetch(image_url)
+        return image
+
+    def _remember_file_id(self, image_url: str, message: Union[Message, None]) -> None:
+        if isinstance(message, Message) and message.photo:
+            self.file_ids.set(image_url, message.photo[-1].file_id)
 
     async def _send(self, item: Union[Item, Reservation]) -> None:  # type: ignore[override]
         """Send item information as Telegram message.
@@ -216,45 +314,90 @@ class Telegram(Notifier):
         if self.mute and self.mute < datetime.datetime.now():
             log.info("Reactivated Telegram Notifications")
             self.mute = None
-        image = None
+        image_url = None
         if isinstance(item, Item) and not self.only_reservations and not self.mute:
-            message = self._unmask(self.body, item)
+            # rendering may request distances from Google Maps, keep it off the event loop
+            message = await asyncio.to_thread(self._unmask, self.body, item)
             if self.image:
-                image = self._unmask_image(self.image, item)
+                image_url = await asyncio.to_thread(self._image_url, self.image, item)
         elif isinstance(item, Reservation):
             message = escape_markdown(f"{item.display_name} is reserved for 5 minutes", version=2)
         else:
             return
-        await self._send_message(message, image)
+        await self._send_message(message, image_url)
 
-    async def _send_message(self, message: str, image: Union[bytes, None] = None) -> None:
+    async def _send_digest(self, digest: Digest) -> None:  # type: ignore[override]
+        """Send several items as one Telegram message without image"""
+        if self.mute and self.mute < datetime.datetime.now():
+            log.info("Reactivated Telegram Notifications")
+            self.mute = None
+        if self.only_reservations or self.mute:
+            return
+        message = await asyncio.to_thread(digest.unmask, self.digest_header, self.digest_row, self.digest_footer, self._unmask)
+        await self._send_message(message)
+
+    async def _send_message(self, message: str, image_url: Union[str, None] = None) -> None:
+        """Sends the message to all chats concurrently"""
         log.debug("%s message: %s", self.name, message)
-        fmt = ParseMode.MARKDOWN_V2
-        for chat_id in self.chat_ids:
+        start = monotonic()
+        chat_ids = list(self.chat_ids)
+        if chat_ids and image_url and self.file_ids.get(image_url) is None:
+            # upload the image once and reuse the file id for the other chats
+            await self._send_to_chat(chat_ids.pop(0), message, image_url)
+        await asyncio.gather(*[self._send_to_chat(chat_id, message, image_url) for chat_id in chat_ids])
+        if self.metrics is not None:
+            self.metrics.notification_fanout.labels(self.name).observe(monotonic() - start)
+
+    async def _send_to_chat(self, chat_id: str, message: str, image_url: Union[str, None] = None) -> None:
+        """Sends the message to one chat with rate limiting and exponential retry"""
+        for attempt in range(Telegram.MAX_RETRIES):
+            await self.limiter.wait(chat_id)
             try:
-                if image:
-                    await self.application.bot.send_photo(chat_id=chat_id, photo=image, caption=message, parse_mode=fmt)
-                else:
-                    await self.application.bot.send_message(
-                        chat_id=chat_id,
-                        text=message,
-                        parse_mode=fmt,
-                        disable_web_page_preview=True,
-                    )
-                self.retries = 0
+                await self._send_chat_message(chat_id, message, image_url)
+                return
+            except RetryAfter as err:
+                retry_after: Union[int, datetime.timedelta] = err.retry_after
+                seconds = retry_after.total_seconds() if isinstance(retry_after, datetime.timedelta) else retry_after
+                log.warning("Telegram flood control, retrying in %s seconds", seconds)
+                self.limiter.pause(float(seconds))
             except BadRequest as err:
                 err_message = err.message
                 if err_message.startswith("Can't parse entities:"):
                     err_message += ". For details see https://github.com/Der-Henning/tgtg/wiki/Configuration#note-on-markdown-v2"
                 log.error("Telegram Error: %s", err_message)
+                return
             except (NetworkError, TimedOut) as err:
                 log.warning("Telegram Error: %s", err)
-                self.retries += 1
-                if self.retries > Telegram.MAX_RETRIES:
-                    raise err
-                await self._send_message(message)
+                backoff = min(Telegram.RETRY_BACKOFF * 2**attempt, Telegram.RETRY_BACKOFF_MAX)
+                await asyncio.sleep(backoff * (0.5 + random.random()))
             except TelegramError as err:
                 log.error("Telegram Error: %s", err)
+                return
+        log.error("Telegram Error: giving up sending to chat %s after %s tries", chat_id, Telegram.MAX_RETRIES)
+
+    async def _send_chat_message(self, chat_id: str, message: str, image_url: Union[str, None] = None) -> None:
+        fmt = ParseMode.MARKDOWN_V2
+        photo = self._get_photo(image_url) if image_url else None
+        if not image_url or not photo:
+            await self.application.bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                parse_mode=fmt,
+                disable_web_page_preview=True,
+            )
+            return
+        try:
+            res = await self.application.bot.send_photo(chat_id=chat_id, photo=photo, caption=message, parse_mode=fmt)
+        except BadRequest:
+            if not isinstance(photo, str):
+                raise
+            # file id is not valid anymore, upload the image again
+            self.file_ids.remove(image_url)
+            photo = self._get_photo(image_url)
+            if not photo:
+                raise
+            res = await self.application.bot.send_photo(chat_id=chat_id, photo=photo, caption=message, parse_mode=fmt)
+        self._remember_file_id(image_url, res)
 
     def _is_my_chat(self, update: Update) -> bool:
         return str(update.message.chat.id) in self.chat_ids
@@ -282,7 +425,7 @@ class Telegram(Notifier):
 
     @_private
     async def _reserve_item_menu(self, update: Update, _) -> None:
-        favorites = self.favorites.get_favorites()
+        favorites = await asyncio.to_thread(self.favorites.get_favorites)
         buttons = [
             [InlineKeyboardButton(f"{item.display_name}: {item.items_available}", callback_data=item)] for item in favorites
         ]
@@ -303,7 +446,7 @@ class Telegram(Notifier):
 
     @_private
     async def _cancel_orders_menu(self, update: Update, _) -> None:
-        self.reservations.update_active_orders()
+        await asyncio.to_thread(self.reservations.update_active_orders)
         buttons = [
             [InlineKeyboardButton(order.display_name, callback_data=order)] for order in self.reservations.active_orders.values()
         ]
@@ -315,13 +458,13 @@ class Telegram(Notifier):
 
     @_private
     async def _cancel_all_orders(self, update: Update, _) -> None:
-        self.reservations.cancel_all_orders()
+        await asyncio.to_thread(self.reservations.cancel_all_orders)
         await update.message.reply_text("Cancelled all active Orders")
         log.debug("Cancelled all active Orders")
 
     @_private
     async def _list_favorites(self, update: Update, _) -> None:
-        favorites = self.favorites.get_favorites()
+        favorites = await asyncio.to_thread(self.favorites.get_favorites)
         if not favorites:
             await update.message.reply_text("You currently don't have any favorites.")
         else:
@@ -329,7 +472,7 @@ class Telegram(Notifier):
 
     @_private
     async def _list_favorite_ids(self, update: Update, _) -> None:
-        favorites = self.favorites.get_favorites()
+        favorites = await asyncio.to_thread(self.favorites.get_favorites)
         if not favorites:
             await update.message.reply_text("You currently don't have any favorites.")
         else:
@@ -354,7 +497,7 @@ class Telegram(Notifier):
                 ),
             )
         )
-        self.favorites.add_favorites(item_ids)
+        await asyncio.to_thread(self.favorites.add_favorites, item_ids)
         await update.message.reply_text(f"Added the following item ids to favorites: {' '.join(item_ids)}")
         log.debug('Added the following item ids to favorites: "%s"', item_ids)
 
@@ -377,15 +520,15 @@ class Telegram(Notifier):
                 ),
             )
         )
-        self.favorites.remove_favorite(item_ids)
+        await asyncio.to_thread(self.favorites.remove_favorite, item_ids)
         await update.message.reply_text(f"Removed the following item ids from favorites: {' '.join(item_ids)}")
         log.debug("Removed the following item ids from favorites: '%s'", item_ids)
 
     @_private
     async def _url_handler(self, update: Update, context: CallbackContext) -> None:
         item_id = context.matches[0].group(1)
-        item_favorite = self.favorites.is_item_favorite(item_id)
-        item = self.favorites.get_item_by_id(item_id)
+        item_favorite = await asyncio.to_thread(self.favorites.is_item_favorite, item_id)
+        item = await asyncio.to_thread(self.favorites.get_item_by_id, item_id)
         if item.item_id is None:
             await update.message.reply_text("There is no Item with this link")
             return
@@ -442,12 +585,12 @@ class Telegram(Notifier):
             await update.callback_query.answer(f"Removed {data.display_name} form reservation queue")
             log.debug('Removed "%s" from reservation queue', data.display_name)
         if isinstance(data, Order):
-            self.reservations.cancel_order(data.id)
+            await asyncio.to_thread(self.reservations.cancel_order, data.id)
             await update.callback_query.answer(f"Canceled Order for {data.display_name}")
             log.debug('Canceled order for "%s"', data.display_name)
         if isinstance(data, AddFavoriteRequest):
             if data.proceed:
-                self.favorites.add_favorites([data.item_id])
+                await asyncio.to_thread(self.favorites.add_favorites, [data.item_id])
                 await update.callback_query.edit_message_text(f"Added {data.item_display_name} to favorites")
                 log.debug('Added "%s" to favorites', data.item_display_name)
                 log.debug('Removed "%s" from favorites', data.item_display_name)
@@ -455,7 +598,7 @@ class Telegram(Notifier):
                 await update.callback_query.delete_message()
         if isinstance(data, RemoveFavoriteRequest):
             if data.proceed:
-                self.favorites.remove_favorite([data.item_id])
+                await asyncio.to_thread(self.favorites.remove_favorite, [data.item_id])
                 await update.callback_query.edit_message_text(f"Removed {data.item_display_name} from favorites")
                 log.debug('Removed "%s" from favorites', data.item_display_name)
             else:
@@ -498,5 +641,9 @@ class Telegram(Notifier):
                 ",".join(self.chat_ids),
             )
 
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        return [self.body, self.image, *super().templates]
+
     def __repr__(self) -> str:
         return f"Telegram: {self.chat_ids}"
@@ -1,23 +1,52 @@
-import json
 import logging
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import monotonic, sleep
+from typing import Any, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
-from tgtg_scanner.errors import MaskConfigurationError, WebHookConfigurationError
+from tgtg_scanner.errors import (
+    MaskConfigurationError,
+    NotificationError,
+    WebHookConfigurationError,
+)
 from tgtg_scanner.models import Config, Favorites, Item, Reservations
 from tgtg_scanner.models.reservations import Reservation
+from tgtg_scanner.models.template import JsonTemplate, Template
 from tgtg_scanner.notifiers.base import Notifier
 
 log = logging.getLogger("tgtg")
 
+RETRY_BACKOFF = 0.5
+
+
+@dataclass
+class Endpoint:
+    """One webhook target with compiled templates"""
+
+    name: str
+    url: Template
+    method: str = "POST"
+    body: Union[Template, JsonTemplate, None] = None
+    type: Union[str, None] = None
+    headers: dict[str, Union[str, bytes]] = field(default_factory=dict)
+    auth: Union[HTTPBasicAuth, None] = None
+    timeout: int = 60
+    retries: int = 0
+
 
 class WebHook(Notifier):
-    """Notifier for custom Webhooks"""
+    """Notifier for custom Webhooks.
+
+    Sends to the configured URL and/or a list of endpoints.
+    All endpoints receive the notification concurrently.
+    """
 
     def __init__(self, config: Config, reservations: Reservations, favorites: Favorites):
-        super().__init__(config, reservations, favorites)
+        super().__init__(config, reservations, favorites, config.webhook)
         self.enabled: bool = config.webhook.enabled
         self.method: str = config.webhook.method
         self.url: Union[str, None] = config.webhook.url
@@ -29,56 +58,183 @@ class WebHook(Notifier):
         self.password: Union[str, None] = config.webhook.password
         self.timeout: int = config.webhook.timeout
         self.cron = config.webhook.cron
+        endpoints: list[tuple[str, dict[str, Any]]] = []
         if self.enabled:
-            if self.method is None or self.url is None:
+            if self.method is None or (self.url is None and not config.webhook.endpoints):
                 raise WebHookConfigurationError()
             if self.username is not None and self.password is not None:
                 self.auth = HTTPBasicAuth(self.username, self.password)
                 log.debug("Using basic auth with user '%s' for webhook", self.username)
+        try:
+            if self.enabled:
+                if self.url is not None:
+                    endpoints.append(("webhook", {}))
+                for index, endpoint in enumerate(config.webhook.endpoints):
+                    endpoints.append((endpoint.get("name", str(index)), endpoint))
+            self._setup(config.webhook.pool_size, config.webhook.retries, endpoints)
+        except MaskConfigurationError as exc:
+            raise WebHookConfigurationError(exc.message) from exc
+        except (TypeError, ValueError, AttributeError) as exc:
+            raise WebHookConfigurationError(f"Invalid webhook endpoint - {exc}") from exc
+
+    def _setup(self, pool_size: int, retries: int, endpoints: list[tuple[str, dict[str, Any]]]) -> None:
+        """Creates the endpoints from their names and options and the connections to them.
+        Notifiers based on WebHook call this after reading their config."""
+        self.pool_size = pool_size
+        self.concurrency = pool_size
+        self.retries = retries
+        self.endpoints: list[Endpoint] = [self._endpoint(name, endpoint) for name, endpoint in endpoints]
+        self.session = self._create_session(pool_size, len(self.endpoints))
+        self._executor: Union[ThreadPoolExecutor, None] = self._create_executor()
+
+    def _endpoint(self, name: str, endpoint: dict[str, Any]) -> Endpoint:
+        """Creates an endpoint. Missing options are taken from the notifier configuration."""
+        url = endpoint.get("url", self.url)
+        if url is None:
+            raise WebHookConfigurationError(f"Webhook endpoint {name} has no url")
+        body = endpoint.get("body", self.body)
+        type = endpoint.get("type", self.type)
+        auth = self.auth
+        retries = int(endpoint.get("retries", self.retries))
+        if retries < 0:
+            raise WebHookConfigurationError(f"Webhook endpoint {name} has negative retries")
+        if "username" in endpoint and "password" in endpoint:
+            auth = HTTPBasicAuth(endpoint["username"], endpoint["password"])
+        return Endpoint(
+            name=name,
+            url=Template(url),
+            method=endpoint.get("method", self.method),
+            body=self._compile_body(name, body, type),
+            type=type,
+            headers=dict(endpoint.get("headers", self.headers or {})),
+            auth=auth,
+            timeout=int(endpoint.get("timeout", self.timeout)),
+            retries=retries,
+        )
+
+    @staticmethod
+    def _compile_body(name: str, body: Union[str, None], type: Union[str, None]) -> Union[Template, JsonTemplate, None]:
+        if not body:
+            return None
+        if type is not None and "json" in type:
             try:
-                Item.check_mask(self.body)
-                Item.check_mask(self.url)
-            except MaskConfigurationError as exc:
-                raise WebHookConfigurationError(exc.message) from exc
+                return JsonTemplate(body)
+            except ValueError as exc:
+                raise WebHookConfigurationError(f"Webhook endpoint {name} body is not valid JSON - {exc}") from exc
+        return Template(body)
+
+    @staticmethod
+    def _create_session(pool_size: int, hosts: int = 1) -> requests.Session:
+        """Session with a pool of keep-alive connections"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, hosts), pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _create_executor(self) -> Union[ThreadPoolExecutor, None]:
+        """Executor sending to several endpoints concurrently, None for a single endpoint"""
+        if len(self.endpoints) < 2:
+            return None
+        return ThreadPoolExecutor(max_workers=len(self.endpoints), thread_name_prefix=self.name)
+
+    def _headers(self, endpoint: Endpoint) -> dict[str, Union[str, bytes]]:
+        """Request headers of the endpoint. Never modifies the configured headers."""
+        headers = dict(endpoint.headers)
+        if endpoint.type:
+            headers["Content-Type"] = endpoint.type
+        return headers
+
+    def _item_headers(self, item: Item) -> dict[str, Union[str, bytes]]:
+        """Additional request headers rendered from the item"""
+        return {}
+
+    def _body(self, endpoint: Endpoint, item: Item) -> Union[bytes, None]:
+        if endpoint.body is None:
+            return None
+        if isinstance(endpoint.body, JsonTemplate):
+            return endpoint.body.render(item)
+        return endpoint.body.render(item).encode("utf-8")
 
     def _send(self, item: Union[Item, Reservation]) -> None:
-        """Sends item information via configured Webhook endpoint"""
+        """Sends item information to all configured endpoints"""
         if isinstance(item, Item):
-            if self.url is None:
+            if not self.endpoints:
                 raise WebHookConfigurationError()
-            url = item.unmask(self.url)
-            log.debug("%s url: %s", self.name, url)
-            body: Union[bytes, None] = None
-            headers = self.headers or dict()
-            if self.type:
-                headers["Content-Type"] = self.type
-            if self.body:
-                if self.type is not None and "json" in self.type:
-                    body = json.dumps(json.loads(item.unmask(self.body).replace("\n", "\\n"))).encode("utf-8")
-                else:
-                    body = item.unmask(self.body).encode("utf-8")
-                log.debug("%s body: %s", self.name, body)
-                # body = item.unmask(self.body)
-                # if isinstance(body, bytes):
-                #     pass
-                # elif self.type and "json" in self.type:
-                #     body = json.dumps(json.loads(body.replace("\n", "\\n")))
-                #     log.debug("%s body: %s", self.name, body)
-                # else:
-                #     body = body.encode("utf-8")
-                #     log.debug("%s body: %s", self.name, body)
-            log.debug("%s headers: %s", self.name, headers)
-            res = requests.request(
-                method=self.method,
-                url=url,
-                timeout=self.timeout,
-                data=body,
-                headers=headers,
-                auth=self.auth,
-            )
-            if not res.ok:
-                log.error("%s Request failed with status code %s", self.name, res.status_code)
-                log.debug("%s Response content: %s", self.name, res.text)
+            if len(self.endpoints) == 1:
+                self._deliver(self.endpoints[0], item)
+                return
+            if self._executor is None:
+                raise NotificationError(f"{self.name} is stopped")
+            futures = [self._executor.submit(self._deliver, endpoint, item) for endpoint in self.endpoints]
+            errors = [future.exception() for future in futures]
+            for endpoint, error in zip(self.endpoints, errors):
+                if error is not None:
+                    log.error("%s endpoint %s failed: %s", self.name, endpoint.name, error)
+            # retrying would send duplicates to the endpoints that succeeded
+            if all(errors):
+                raise NotificationError(f"{self.name} all endpoints failed")
+
+    def _deliver(self, endpoint: Endpoint, item: Item) -> None:
+        """Sends the item to one endpoint, retrying network and server errors"""
+        url = endpoint.url.render(item)
+        log.debug("%s url: %s", self.name, url)
+        body = self._body(endpoint, item)
+        log.debug("%s body: %s", self.name, body)
+        headers = {**self._headers(endpoint), **self._item_headers(item)}
+        log.debug("%s headers: %s", self.name, headers)
+        for attempt in range(endpoint.retries + 1):
+            if attempt > 0:
+                self._observe_retry(endpoint)
+                sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            start = monotonic()
+            try:
+                res = self.session.request(
+                    method=endpoint.method,
+                    url=url,
+                    timeout=endpoint.timeout,
+                    data=body,
+                    headers=headers,
+                    auth=endpoint.auth,
+                )
+            except requests.RequestException as exc:
+                error: Exception = exc
+                continue
+            finally:
+                self._observe_latency(endpoint, monotonic() - start)
+            if res.ok:
+                return
+            log.debug("%s Response content: %s", self.name, res.text)
+            error = NotificationError(f"{self.name} Request failed with status code {res.status_code}")
+            if res.status_code < 500 and res.status_code != 429:
+                break
+        raise error
+
+    def _observe_latency(self, endpoint: Endpoint, seconds: float) -> None:
+        if self.metrics is not None:
+            self.metrics.webhook_request_duration.labels(self.name, endpoint.name).observe(seconds)
+
+    def _observe_retry(self, endpoint: Endpoint) -> None:
+        if self.metrics is not None:
+            self.metrics.webhook_retries.labels(self.name, endpoint.name).inc()
+
+    async def _astart(self) -> None:
+        # the executor is shut down when the notifier stops
+        if self._executor is None:
+            self._executor = self._create_executor()
+
+    async def _astop(self) -> None:
+        self.session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def templates(self) -> list[Union[str, None]]:
+        endpoints = [template.text for endpoint in self.endpoints for template in (endpoint.url, endpoint.body) if template]
+        return [*endpoints, *super().templates]
 
     def __repr__(self) -> str:
+        if self.url is None:
+            return f"WebHook: {len(self.endpoints)} endpoints"
         return f"WebHook: {self.url}"
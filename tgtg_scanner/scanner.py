@@ -1,7 +1,8 @@
 import logging
 import sys
-from random import random
-from time import sleep
+from datetime import datetime
+from pathlib import Path
+from time import monotonic, sleep
 from typing import Dict, List, NoReturn, Union
 
 from progress.spinner import Spinner
@@ -16,11 +17,21 @@ from tgtg_scanner.models import (
     Metrics,
     Reservations,
 )
+from tgtg_scanner.models.distance_filter import DistanceFilter
+from tgtg_scanner.models.image_cache import image_cache, is_image_url
+from tgtg_scanner.models.item import get_locale
+from tgtg_scanner.models.item_group import ItemGroup
+from tgtg_scanner.models.state import StateStore
 from tgtg_scanner.notifiers import Notifiers
 from tgtg_scanner.tgtg import TgtgClient
 
 log = logging.getLogger("tgtg")
 
+# seconds after which items that are not returned by the API anymore are removed
+STATE_TTL = 24 * 3600
+# max seconds the scanner sleeps at once, to follow changes of the system clock
+MAX_IDLE_SLEEP = 3600
+
 item_name_map = {}
 
 class Activity:
@@ -49,13 +60,25 @@ class Scanner:
 
     def __init__(self, config: Config):
         self.config = config
-        self.metrics = Metrics(self.config.metrics_port)
+        self.metrics = Metrics(self.config.metrics_port, self.config.metrics_max_items, self.config.metrics_item_info)
         self.item_ids = set(self.config.item_ids)
         self.buy_item_ids = set(self.config.buy_item_ids)
         self.cron = self.config.schedule_cron
+        self.groups = ItemGroup.from_config(self.config)
+        # items of the configured groups are only scanned by their group
+        self.grouped_item_ids = {item_id for group in self.groups if not group.favorites for item_id in group.item_ids}
+        # resolve babel locale once before formatting prices in the hot loop
+        get_locale(self.config.locale)
+        if self.config.cache_path is not None:
+            image_cache.set_path(Path(self.config.cache_path, "images"))
         self.state: Dict[str, Item] = {}
+        # monotonic time an item was last returned by the API
+        self.last_seen: Dict[str, float] = {}
+        # versioned state for the JSON state api
+        self.state_store = StateStore()
         self.notifiers: Union[Notifiers, None] = None
         self.location: Union[Location, None] = None
+        self.distance_filter = DistanceFilter.from_config(self.config)
         self.tgtg_client = TgtgClient(
             email=self.config.tgtg.username,
             timeout=self.config.tgtg.timeout,
@@ -67,6 +90,7 @@ class Scanner:
             datadome_cookie=self.config.tgtg.datadome,
             base_url=self.config.tgtg.base_url,
         )
+        self.metrics.runtime.client = self.tgtg_client
         self.reservations = Reservations(self.tgtg_client)
         self.favorites = Favorites(self.tgtg_client)
 
@@ -74,7 +98,7 @@ class Scanner:
         """
         Returns an item for test notifications
         """
-        items = sorted(self._get_favorites(), key=lambda x: x.items_available, reverse=True)
+        items = sorted(self._get_favorites() or [], key=lambda x: x.items_available, reverse=True)
 
         if items:
             return items[0]
@@ -89,30 +113,45 @@ class Scanner:
 
         return items[0]
 
-    def _job(self) -> None:
+    def _job(self, groups: Union[List[ItemGroup], None] = None) -> bool:
         """
-        Job iterates over all monitored items
+        Job iterates over all monitored items of the groups, by default of all groups
+
+        Returns:
+            bool: False if every item and favorites request failed
         """
         if self.notifiers is None:
             raise RuntimeError("Notifiers not initialized!")
 
+        groups = self.groups if groups is None else groups
         items: list[Item] = []
-        for item_id in self.item_ids.union(self.buy_item_ids):
+        fetches = succeeded = 0
+        for item_id in [item_id for group in groups for item_id in group.item_ids]:
+            fetches += 1
             try:
-                if item_id != "":
-                    item_dict = self.tgtg_client.get_item(item_id)
-                    items.append(Item(item_dict, self.location, self.config.locale))
+                item_dict = self.tgtg_client.get_item(item_id)
+                items.append(Item(item_dict, self.location, self.config.locale))
+                succeeded += 1
             except TgtgAPIError as err:
                 log.error(err)
-        
+
         for item in items:
             self._check_item(item, True)
 
-        items += self._get_favorites()
+        if any(group.favorites for group in groups):
+            fetches += 1
+            favorites = self._get_favorites()
+            if favorites is not None:
+                items += [item for item in favorites if item.item_id not in self.grouped_item_ids]
+                succeeded += 1
         for item in items:
             item_name_map[item.__getattribute__("item_id")] = item.__getattribute__("display_name") + item.price
             self._check_item(item)
 
+        if self.location is not None:
+            self.location.prefetch()
+        self._evict_stale_items()
+
         amounts = {item_id : item.items_available for item_id, item in self.state.items() if item is not None}
         print("Current Stock State:")
         for item_id in amounts:
@@ -128,20 +167,22 @@ class Scanner:
             self.tgtg_client.refresh_token,
             self.tgtg_client.datadome_cookie,
         )
+        return succeeded > 0 or fetches == 0
 
-    def _get_favorites(self) -> list[Item]:
+    def _get_favorites(self) -> Union[list[Item], None]:
         """
         Get favorites as list of Items
 
         Returns:
-            List: List of items
+            List: List of items, None if the request failed
         """
         try:
             items = self.get_favorites()
         except TgtgAPIError as err:
             log.warning("_get_favorites failed")
             log.error(err)
-            return []
+            self.metrics.get_favorites_errors.inc()
+            return None
         return [Item(item, self.location, self.config.locale) for item in items]
 
     def _check_item(self, item: Item, notify = False) -> None:
@@ -149,20 +190,56 @@ class Scanner:
         Checks if the available item amount raised from zero to something
         and triggers notifications.
         """
+        self.last_seen[item.item_id] = monotonic()
         state_item = self.state.get(item.item_id)
-        if state_item is not None:
+        if state_item is None:
+            self._prefetch_image(item)
+            if self.location is not None:
+                self.location.watch(item.pickup_location, item.pickup_coordinates)
+        else:
             if state_item.items_available == item.items_available:
                 return
             log.info("%s - new amount: %s", item.display_name, item.items_available)
             if item.items_available > 0:
                 if item.item_id in self.buy_item_ids:          
                     self.buy(item.item_id)
-                if notify:
+                if notify and not self.distance_filter.accepts(item):
+                    log.info("%s is too far away - no notification", item.display_name)
+                elif notify:
                     self._send_messages(item)
-                    self.metrics.send_notifications.labels(item.item_id, item.display_name).inc()
+                    self.metrics.count_notification(item)
 
         self.metrics.update(item)
         self.state[item.item_id] = item
+        self.state_store.update(item)
+
+    def _evict_stale_items(self) -> None:
+        """
+        Stops observing items that were not returned for STATE_TTL seconds,
+        e.g. removed favorites, and removes their metrics.
+        """
+        now = monotonic()
+        stale = [item_id for item_id, seen in self.last_seen.items() if now - seen > STATE_TTL]
+        # grouped items are not returned outside of the schedule of their group
+        for item_id in [item_id for item_id in stale if item_id not in self.grouped_item_ids]:
+            log.debug("Removing %s from observation", item_id)
+            self.state.pop(item_id, None)
+            self.state_store.remove(item_id)
+            item_name_map.pop(item_id, None)
+            del self.last_seen[item_id]
+        self.metrics.retain(self.state)
+
+    def _prefetch_image(self, item: Item) -> None:
+        """
+        Starts downloading the notification image of a newly observed item,
+        so sending a notification does not wait for the download.
+        """
+        image = self.config.telegram.image
+        if not self.config.telegram.enabled or not image:
+            return
+        url = item.item_logo if image == "${{item_logo_bytes}}" else item.item_cover
+        if is_image_url(url):
+            image_cache.prefetch(url)
 
     def _send_messages(self, item: Item) -> None:
         """
@@ -194,11 +271,20 @@ class Scanner:
             self.config.location.enabled,
             self.config.location.google_maps_api_key,
             self.config.location.origin_address,
+            cache_path=Path(self.config.cache_path, "location.sqlite3") if self.config.cache_path else None,
+            cache_ttl=self.config.location.cache_ttl * 24 * 3600,
+            cache_size=self.config.location.cache_size,
+            metrics=self.metrics,
+            provider=self.config.location.provider,
+            origin_coordinates=self.config.location.origin_coordinates,
+            speeds=self.config.location.speeds,
         )
         # activate and test notifiers
         if self.config.metrics:
-            self.metrics.enable_metrics()
-        self.notifiers = Notifiers(self.config, self.reservations, self.favorites)
+            self.metrics.enable_metrics(self.state_store if self.config.metrics_state else None)
+        self.notifiers = Notifiers(self.config, self.reservations, self.favorites, self.metrics, self.location)
+        # resolve the distances used by the notifier templates ahead of time
+        self.location.travel_modes.update(self.notifiers.travel_modes())
         self.notifiers.start()
         if not self.config.disable_tests and self.notifiers.notifier_count > 0:
             log.info("Sending test Notifications ...")
@@ -208,30 +294,66 @@ class Scanner:
         running = True
         if self.cron != Cron("* * * * *"):
             log.info("Active on schedule: %s", self.cron.get_description(self.config.locale))
+        for group in self.groups:
+            if not group.favorites:
+                log.info(
+                    "Item group %s: %s items every %s seconds on schedule: %s",
+                    group.name,
+                    len(group.item_ids),
+                    group.sleep_time,
+                    group.cron.get_description(self.config.locale),
+                )
         activity = Activity(self.config.activity and not (self.config.docker or self.config.quiet))
         while True:
-            if self.cron.is_now:
+            if any(group.cron.is_now for group in self.groups):
                 if not running:
                     log.info("Scanner reenabled by cron schedule.")
                     running = True
-                try:
-                    if item_id != None:
-                        self.buy(item_id)
-                    else:
-                        self._job()
-                except Exception:
-                    log.error("Job Error! - %s", sys.exc_info())
-                finally:
-                    sleep_time = self.config.sleep_time * (0.9 + 0.2 * random())
-                    for _ in range(int(sleep_time)):
-                        activity.next()
-                        sleep(sleep_time / int(sleep_time))
-                        activity.flush()
-            elif running:
-                log.info("Scanner disabled by cron schedule.")
-                running = False
+                now = monotonic()
+                due = [group for group in self.groups if group.due(now)]
+                if due:
+                    try:
+                        if item_id != None:
+                            self.buy(item_id)
+                            self.metrics.scan_succeeded()
+                        elif self._job(due):
+                            self.metrics.scan_succeeded()
+                        else:
+                            self.metrics.scan_failed()
+                    except Exception:
+                        log.error("Job Error! - %s", sys.exc_info())
+                        self.metrics.scan_failed()
+                    finally:
+                        now = monotonic()
+                        for group in due:
+                            group.fetched(now)
+                sleep_time = self._seconds_until_due()
+                steps = max(int(sleep_time), 1)
+                for _ in range(steps):
+                    activity.next()
+                    sleep(sleep_time / steps)
+                    activity.flush()
             else:
-                sleep(30)
+                if running:
+                    log.info("Scanner disabled by cron schedule.")
+                    running = False
+                sleep(self._seconds_until_due())
+
+    def _seconds_until_due(self) -> float:
+        """
+        Seconds until the next item group is due, either by its poll interval
+        or by the activation of its cron schedule. At most MAX_IDLE_SLEEP.
+        """
+        now, wall_time = monotonic(), datetime.now()
+        seconds: float = MAX_IDLE_SLEEP
+        for group in self.groups:
+            if group.cron.is_now:
+                seconds = min(seconds, group.next_fetch - now)
+                continue
+            activation = group.cron.next_activation(wall_time)
+            if activation is not None:
+                seconds = min(seconds, max((activation - wall_time).total_seconds(), group.next_fetch - now))
+        return max(seconds, 0)
 
     def stop(self) -> None:
         """
@@ -6,6 +6,7 @@ import random
 import re
 import time
 import webbrowser
+from collections import Counter
 from datetime import datetime
 from http import HTTPStatus
 from typing import List, Union
@@ -38,6 +39,8 @@ ORDER_STATUS_ENDPOINT = "order/v7/{}/status"
 MANUFACTURERITEM_ENDPOINT = "manufactureritem/v2/"
 ORDER_PAY_ENDPOINT = "order/v7/{}/pay"
 PAYMENT_ENDPOINT = "payment/v3/"
+# item and order ids in endpoint paths
+ID_SEGMENT = re.compile(r"/(\d+|[0-9a-fA-F-]{20,})(?=/|$)")
 USER_AGENTS = [
     "TGTG/{} Dalvik/2.1.0 (Linux; U; Android 9; Nexus 5 Build/M4B30Z)",
     "TGTG/{} Dalvik/2.1.0 (Linux; U; Android 10; SM-G935F Build/NRD90M)",
@@ -148,6 +151,9 @@ class TgtgClient:
         self.session = None
 
         self.captcha_error_count = 0
+        # failed requests per (endpoint, status code) and number of token refreshes
+        self.api_errors: Counter[tuple[str, int]] = Counter()
+        self.token_refresh_count = 0
 
     def __del__(self) -> None:
         if self.session:
@@ -200,6 +206,7 @@ class TgtgClient:
         # 2. Try: Reset session
         # 3. Try: Delete datadome cookie and reset session
         # 10.Try: Sleep 10 minutes, and reset session
+        self.api_errors[(ID_SEGMENT.sub("/{id}", path.rstrip("/")), response.status_code)] += 1
         if response.status_code == 403:
             log.debug("Captcha Error 403!")
             self.captcha_error_count += 1
@@ -262,6 +269,7 @@ class TgtgClient:
         self.access_token = response.json().get("access_token")
         self.refresh_token = response.json().get("refresh_token")
         self.last_time_token_refreshed = datetime.now()
+        self.token_refresh_count += 1
 
     def login(self) -> None:
         if not (self.email or self.access_token and self.refresh_token):